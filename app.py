@@ -1,11 +1,18 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for
+from flask import Flask, render_template, stream_template, request, send_file, redirect, url_for, jsonify
+from itsdangerous import URLSafeSerializer, BadSignature
 import pandas as pd
 import sys
 sys.path.append('..')
 import scripts.utilities_database as utilities_database
+import scripts.storage_database as storage_database
 import scripts.get_url_theses_selenium as get_url_theses_selenium
 import scripts.search_engine as search_engine
 import scripts.RAG as RAG
+import scripts.result_cache as result_cache
+import scripts.retrieval_service as retrieval_service
+import scripts.facet_index as facet_index
+import scripts.sqlite_docstore as sqlite_docstore
+import scripts.job_queue as job_queue
 
 import configparser
 
@@ -14,16 +21,80 @@ config = configparser.ConfigParser()
 config.read('./scripts/config.ini')
 
 MODEL_EMBEDDING                  = config["DEFAULT"]['MODEL_EMBEDDING']
+SEARCH_MODEL                     = config["SEARCH"]['SEARCH_MODEL']
 VECTOR_STORE_PATH                = config["DEFAULT"]['VECTOR_STORE_PATH']
-EXCEL_QUERY_STORE_PATH           = config["DEFAULT"]['EXCEL_QUERY_STORE_PATH']
-EXCEL_TEMPORARY_QUERY_STORE_PATH = config["DEFAULT"]['EXCEL_TEMPORARY_QUERY_STORE_PATH']
+EXCEL_EXPORT_PATH                = config["DEFAULT"]['EXCEL_EXPORT_PATH']
 PORT_SERVER                      = config["DEFAULT"]['PORT_SERVER']
 API_KEY                          = config["MISTRAL"]["API_KEY"]
+RESULT_CACHE_MAX_ENTRIES         = config["CACHE"].getint('RESULT_CACHE_MAX_ENTRIES')
+RESULT_CACHE_MAX_MB              = config["CACHE"].getint('RESULT_CACHE_MAX_MB')
+RESULT_CACHE_TTL                 = config["CACHE"].getfloat('RESULT_CACHE_TTL')
+RESULT_CACHE_SPILL_PATH          = config["CACHE"]['RESULT_CACHE_SPILL_PATH']
+PAGE_SIZE                        = config["DISPLAY"].getint('PAGE_SIZE')
+
+# result sets of the users, the token of the result set is carried in the url
+RESULT_CACHE = result_cache.ResultSetCache(max_entries = RESULT_CACHE_MAX_ENTRIES,
+                                           max_bytes   = RESULT_CACHE_MAX_MB * 1024**2,
+                                           ttl         = RESULT_CACHE_TTL,
+                                           spill_path  = None if RESULT_CACHE_SPILL_PATH == "None" else RESULT_CACHE_SPILL_PATH)
 
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = "secret_key"
 
+# cursor of a result page : signed (view token, offset, key word, filters), carried in the url
+CURSORS = URLSafeSerializer(app.config['SECRET_KEY'], salt="resultats-cursor")
+
+
+def render_results_page(token: str, view_token: str, df_view: pd.DataFrame, offset: int, key_word: str, 
+                        mistral_answer: str, facets: dict, filters: dict):
+    """Stream one page of PAGE_SIZE theses of a view (the result set or the theses found
+    by a search), the previous and next pages are reached with cursors
+
+        Args:
+            token (str): 
+                token of the result set
+                
+            view_token (str): 
+                token of the displayed theses in the result cache
+                
+            df_view (pd.DataFrame): 
+                the displayed theses
+                
+            offset (int): 
+                position of the first these of the page
+
+        Returns:
+            Response: the streamed page
+    """
+    offset  = max(0, min(offset, max(df_view.shape[0] - 1, 0)))
+    df_page = df_view.iloc[offset:offset + PAGE_SIZE]
+    
+    def get_cursor(page_offset):
+        return CURSORS.dumps({"view": view_token, "offset": page_offset, "key_word": key_word, "filters": filters})
+    
+    next_cursor     = get_cursor(offset + PAGE_SIZE) if offset + PAGE_SIZE < df_view.shape[0] else None
+    previous_cursor = get_cursor(max(offset - PAGE_SIZE, 0)) if offset > 0 else None
+    
+    # the rows are rendered and sent one by one, the full abstracts are loaded on demand
+    rows = (row for row in df_page.drop(columns=["content"], errors="ignore").to_dict(orient = "records"))
+    
+    return stream_template('resultats.html',
+                           PORT_SERVER     = f"http://127.0.0.1:{PORT_SERVER}",
+                           key_word        = key_word,
+                           mistral_answer  = mistral_answer,
+                           facets          = facets,
+                           filters         = filters,
+                           token           = token,
+                           nb_results      = df_view.shape[0],
+                           page            = offset // PAGE_SIZE + 1,
+                           nb_pages        = max(1, -(-df_view.shape[0] // PAGE_SIZE)),
+                           first_index     = offset,
+                           next_cursor     = next_cursor,
+                           previous_cursor = previous_cursor,
+                           data            = rows)
+
+
 @app.route("/")
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -32,26 +103,93 @@ def index():
         
         query     = request.form.get('user_query')
         url_query = get_url_theses_selenium.get_url_request(query)
-        df_theses = pd.read_excel(EXCEL_QUERY_STORE_PATH)
         
-        if not utilities_database.query_already_exist(df_theses, url_query):
-            print("updating the database because new request")
-            # can use selenium method of beautiful soup
-            df_theses = utilities_database.update_database_selenium(df_theses, query)
-        else:
-            print("url query found in excel because request already done")
+        if not utilities_database.query_already_exist(url_query):
+            # scrape -> store -> embed is run by the ingest worker (python -m scripts.ingest_worker),
+            # the page polls the progress of the job. The same url query submitted while its job is
+            # in flight gets that job, the subject is scraped once
+            job_id = job_queue.submit_job(query, url_query)
+            print(f"new request, ingestion job {job_id} queued")
             
-        df_request = df_theses[df_theses["url_query"] == url_query]
-        df_request.to_excel(EXCEL_TEMPORARY_QUERY_STORE_PATH, index= False)
+            if request.accept_mimetypes.best == "application/json":
+                return jsonify({"job_id": job_id, "progress": url_for("job_progress", job_id=job_id)}), 202
+            return redirect(url_for("loading", job_id=job_id))
         
+        print("url query found in the store because request already done")
+        df_request = storage_database.load_query_theses(url_query)
+        token      = RESULT_CACHE.put(url_query, df_request)
             
-        return redirect(url_for("resultats"))
+        return redirect(url_for("resultats", token=token))
     return render_template('index.html')
 
 
+@app.route('/loading/<int:job_id>')
+def loading(job_id: int):
+    # waiting page of a new query, polls /jobs/<job_id>
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return redirect(url_for("index"))
+    return render_template('loading.html', job_id=job_id, query=job["query"])
+
+
+@app.route('/jobs/<int:job_id>')
+def job_progress(job_id: int):
+    # progress of an ingestion job : status, stage, counts of the stage, elapsed and remaining seconds
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    
+    return jsonify({"job_id"  : job_id,
+                    "query"   : job["query"],
+                    "status"  : job["status"],
+                    "stage"   : job["stage"],
+                    "done"    : job["done"],
+                    "total"   : job["total"],
+                    "position": job["position"],
+                    "requests": job["nb_requests"],
+                    "elapsed" : round(job["elapsed"], 1),
+                    "eta"     : None if job["eta"] is None else round(job["eta"], 1),
+                    "error"   : job["error"],
+                    "result"  : url_for("job_result", job_id=job_id) if job["status"] == job_queue.STATUS_DONE else None})
+
+
+@app.route('/jobs/<int:job_id>/result')
+def job_result(job_id: int):
+    # theses of an ingested query, put in the result cache like a query already in the store
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return redirect(url_for("index"))
+    if job["status"] != job_queue.STATUS_DONE:
+        return redirect(url_for("loading", job_id=job_id))
+    
+    df_request = storage_database.load_query_theses(job["url_query"])
+    token      = RESULT_CACHE.put(job["url_query"], df_request)
+    return redirect(url_for("resultats", token=token))
+
+
+@app.route('/export')
+def export():
+    # the store is exported on demand, excel is not the live store anymore
+    excel_path = storage_database.export_to_excel(EXCEL_EXPORT_PATH)
+    return send_file(excel_path, as_attachment=True)
+
+
+@app.route('/retrieval_stats')
+def retrieval_stats():
+    # load and search timings of the resident model and vector store, hits of the query caches
+    service = retrieval_service.get_retrieval_service(MODEL_EMBEDDING, VECTOR_STORE_PATH)
+    return jsonify({**service.stats(), **search_engine.get_cache_stats(), "jobs": job_queue.get_jobs_stats()})
+
+
 @app.route('/resultats', methods=['GET', 'POST'])
 def resultats():
-    df_output = pd.read_excel(EXCEL_TEMPORARY_QUERY_STORE_PATH)
+    token      = request.args.get('token')
+    result_set = RESULT_CACHE.get(token)
+    
+    if result_set is None: # unknown or expired token, the user has to search again
+        return redirect(url_for("index"))
+    
+    url_query, df_output = result_set
     
     # check API TOKEN
     is_token_mistral = False if API_KEY == "None" else True
@@ -59,40 +197,104 @@ def resultats():
     response_rag = "No Mistral token API provided in ./scripts/config.ini" if API_KEY == "None" else "API Mistral ready No request yet"
         
     
+    # values of the facets in the result set, to fill the filters of the page, counted on its rows
+    facets = facet_index.count_facets(df_output)
+    
     if request.method == "POST":
         query = request.form.get('user_query')
         mistral_query = request.form.get('mistral_query')
+        filters = facet_index.parse_filters(request.form) # discipline, etablissement, direction, year
         
-        results = search_engine.get_similar_paragraphs(query, 
-                                                       df_output["content"].tolist(),
-                                                       {}, # filter on similar paragraphs if needed
-                                                       MODEL_EMBEDDING,
-                                                       VECTOR_STORE_PATH,
-                                                       10)
+        if query:
+            results = search_engine.get_similar_paragraphs(query, 
+                                                           df_output["content"].tolist(),
+                                                           filters, # resolved on the facet index before the search
+                                                           SEARCH_MODEL, # BM25, all-MiniLM-L6-v2 or HYBRID
+                                                           VECTOR_STORE_PATH,
+                                                           10,
+                                                           ids = df_output["Id"].tolist()) # search only over the result set
+            
+            context = RAG.document_into_context(results)
+            
+            # theses of the result set in the order of the search
+            rank_similar   = {res.metadata["Id"]: rank for rank, res in enumerate(results)}
+            df_deep_search = df_output[df_output["Id"].isin(rank_similar)].sort_values("Id", key=lambda ids: ids.map(rank_similar))
+            
+            if mistral_query and is_token_mistral:
+                response_rag = RAG.call_mistral_rag(context=context, prompt= f"quels articles se réfèrent le plus à la requête : '{mistral_query}'")
+        else: # filters only, no scoring
+            df_deep_search = df_output[df_output["Id"].isin(facet_index.filter_ids(filters, df_output["Id"].tolist()))] if filters else df_output
         
-        context = RAG.document_into_context(results)
+        # the theses found are kept as a view of the result set, for the next pages
+        view_token = RESULT_CACHE.put(url_query, df_deep_search.reset_index(drop=True))
         
-        list_url_similar = [res.metadata["url_these"] for res in results] # look for the specific url corresponding to the similar these
-        df_deep_search = df_output[df_output["url_these"].isin(list_url_similar)]
+        return render_results_page(token, view_token, df_deep_search, 0, f"Filter : {query} {filters if filters else ''}",
+                                   response_rag, facets, filters)
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            position = CURSORS.loads(cursor)
+        except BadSignature:
+            return redirect(url_for("resultats", token=token))
         
-        if mistral_query and is_token_mistral:
-            response_rag = RAG.call_mistral_rag(context=context, prompt= f"quels articles se réfèrent le plus à la requête : '{mistral_query}'")
+        view = RESULT_CACHE.get(position["view"])
+        if view is None: # expired search, back to the first page of the result set
+            return redirect(url_for("resultats", token=token))
         
-        return render_template('resultats.html',
-                               PORT_SERVER                         = f"http://127.0.0.1:{PORT_SERVER}", 
-                               key_word                            = f"Filter : {query}", 
-                               mistral_answer                      = response_rag, 
-                               data= df_deep_search.to_dict(orient = "records"))
+        return render_results_page(token, position["view"], view[1], position["offset"], position["key_word"],
+                                   response_rag, facets, position["filters"])
         
-    return render_template('resultats.html', 
-                           PORT_SERVER                    = f"http://127.0.0.1:{PORT_SERVER}",
-                           key_word                       = "No key word provided", 
-                           mistral_answer                 = response_rag, 
-                           data= df_output.to_dict(orient = "records"))
+    return render_results_page(token, token, df_output, 0, "No key word provided", response_rag, facets, {})
+
+
+@app.route('/these/<int:these_id>/content')
+def these_content(these_id: int):
+    # full abstract of a these, loaded by the result page when "Afficher plus" is clicked
+    document = sqlite_docstore.SQLiteDocstore().search(str(these_id))
+    
+    if isinstance(document, str):
+        return jsonify({"error": document}), 404
+    
+    return jsonify({"Id": these_id, "content": document.page_content})
+
+
+@app.route('/api/search')
+def api_search():
+    # key word search with facets : /api/search?q=...&discipline=Chimie&year=2010-2015&token=...
+    # without token the whole store is searched, without q the theses matching the facets are returned
+    query   = request.args.get('q', '').strip()
+    filters = facet_index.parse_filters(request.args)
+    k       = request.args.get('k', 10, type=int)
+    token   = request.args.get('token')
+    ids     = None
+    
+    if k is None or k <= 0:
+        return jsonify({"error": "k should be a positive int"}), 400
+    
+    if token:
+        result_set = RESULT_CACHE.get(token)
+        if result_set is None:
+            return jsonify({"error": "unknown or expired token"}), 404
+        ids = result_set[1]["Id"].tolist()
+    
+    if query:
+        results = search_engine.get_similar_paragraphs(query, [], filters, SEARCH_MODEL, VECTOR_STORE_PATH, k, ids = ids)
+    else:
+        if not filters and ids is None:
+            return jsonify({"error": "provide a query q or facets"}), 400
+        ids     = facet_index.filter_ids(filters, ids) if filters else ids
+        results = sqlite_docstore.SQLiteDocstore().search_many([str(i) for i in ids[:k]])
+    
+    return jsonify({"query"     : query,
+                    "filters"   : filters,
+                    "nb_results": len(results),
+                    "results"   : [{key: value for key, value in res.metadata.items() if key != "content_condensed"} for res in results]})
 
 
 
 if __name__ == '__main__':
+    # the new queries are ingested by a separate process : python -m scripts.ingest_worker
     app.run(debug=True, host="0.0.0.0", port=PORT_SERVER, threaded=False)
 
 
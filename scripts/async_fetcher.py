@@ -0,0 +1,181 @@
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional
+import aiohttp
+import scripts.http_cache as http_cache
+import configparser
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+MAX_CONNECTIONS = config["FETCHER"].getint("MAX_CONNECTIONS")
+MAX_PER_HOST    = config["FETCHER"].getint("MAX_PER_HOST")
+TIMEOUT         = config["FETCHER"].getfloat("TIMEOUT")
+CONNECT_TIMEOUT = config["FETCHER"].getfloat("CONNECT_TIMEOUT")
+MAX_RETRIES     = config["FETCHER"].getint("MAX_RETRIES")
+BACKOFF_BASE    = config["FETCHER"].getfloat("BACKOFF_BASE")
+BACKOFF_MAX     = config["FETCHER"].getfloat("BACKOFF_MAX")
+
+# status worth a new attempt, the other errors are returned at once
+RETRY_STATUS    = {429, 500, 502, 503, 504}
+USER_AGENT      = "these-explorer"
+
+
+def get_backoff(attempt: int, backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX)-> float:
+    """Delay before a new attempt, exponential backoff with full jitter so that the
+    requests failing together are not sent again together
+
+        Args:
+            attempt (int):
+                number of the failed attempt, from 0
+
+        Returns:
+            float: the delay in seconds
+    """
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+async def fetch_page(session: aiohttp.ClientSession, url: str, max_retries: int = MAX_RETRIES, stats: dict = None,
+                     cache: Optional[http_cache.HttpCache] = None)-> Optional[str]:
+    """Get the html of a page, retried on timeouts, connection errors and the
+    RETRY_STATUS status. With a cache, a fresh page is served without request and
+    a stale one is revalidated with a conditional request
+
+        Args:
+            session (aiohttp.ClientSession):
+                the pooled session
+
+            url (str):
+                the url of the page
+
+            max_retries (int, optional):
+                new attempts after a failure. Defaults to MAX_RETRIES.
+
+            stats (dict, optional):
+                counters of the fetch, updated. Defaults to None.
+
+            cache (Optional[http_cache.HttpCache], optional):
+                the http cache. Defaults to None.
+
+        Returns:
+            Optional[str]: the html, None if every attempt failed
+    """
+    stats = {} if stats is None else stats
+    entry = cache.lookup(url) if cache is not None else None
+
+    if entry is not None and cache.is_fresh(entry):
+        stats["pages"] = stats.get("pages", 0) + 1
+        return cache.hit(entry)
+
+    headers = cache.conditional_headers(entry) if cache is not None else {}
+
+    for attempt in range(max_retries + 1):
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and entry is not None:
+                    stats["pages"] = stats.get("pages", 0) + 1
+                    return cache.not_modified(entry)
+
+                if response.status == 200:
+                    stats["pages"] = stats.get("pages", 0) + 1
+                    html = await response.text()
+                    if cache is not None:
+                        cache.store(url, html, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                    return html
+
+                reason = f"status {response.status}"
+                if response.status not in RETRY_STATUS:
+                    break
+
+                retry_after = response.headers.get("Retry-After", "")
+                delay       = min(float(retry_after), BACKOFF_MAX) if retry_after.isdigit() else get_backoff(attempt)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            reason = type(error).__name__
+            delay  = get_backoff(attempt)
+
+        if attempt < max_retries:
+            stats["retries"] = stats.get("retries", 0) + 1
+            await asyncio.sleep(delay)
+
+    print(f"fetch : {url} failed, {reason}")
+    stats["failures"] = stats.get("failures", 0) + 1
+    return None
+
+
+async def fetch_all(urls: List[str], max_connections: int = MAX_CONNECTIONS, max_per_host: int = MAX_PER_HOST,
+                    timeout: float = TIMEOUT, max_retries: int = MAX_RETRIES, stats: dict = None,
+                    cache: Optional[http_cache.HttpCache] = None)-> Dict[str, Optional[str]]:
+    """Get the html of the pages with one pooled session : the connections are kept alive
+    and reused, at most max_per_host requests are sent at once to the same host
+
+        Args:
+            urls (List[str]):
+                the urls of the pages
+
+            max_connections (int, optional):
+                size of the connection pool. Defaults to MAX_CONNECTIONS.
+
+            max_per_host (int, optional):
+                connections opened at once to a host. Defaults to MAX_PER_HOST.
+
+            timeout (float, optional):
+                timeout of one request in seconds. Defaults to TIMEOUT.
+
+            max_retries (int, optional):
+                new attempts after a failure. Defaults to MAX_RETRIES.
+
+            stats (dict, optional):
+                counters of the fetch, updated. Defaults to None.
+
+            cache (Optional[http_cache.HttpCache], optional):
+                the http cache, the fresh pages are not requested. Defaults to None.
+
+        Returns:
+            Dict[str, Optional[str]]: url -> html, None for the pages that failed
+    """
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_per_host)
+    timeouts  = aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeouts, headers={"User-Agent": USER_AGENT}) as session:
+        pages = await asyncio.gather(*[fetch_page(session, url, max_retries, stats, cache) for url in urls])
+
+    return dict(zip(urls, pages))
+
+
+def fetch_pages(urls: List[str], max_per_host: int = MAX_PER_HOST, use_cache: bool = True, **kwargs)-> Dict[str, Optional[str]]:
+    """Get the html of the pages from synchronous code (scrapers, flask views), through
+    the http cache of the process
+
+        Args:
+            urls (List[str]):
+                the urls of the pages
+
+            max_per_host (int, optional):
+                connections opened at once to a host. Defaults to MAX_PER_HOST.
+
+            use_cache (bool, optional):
+                False to download every page. Defaults to True.
+
+        Returns:
+            Dict[str, Optional[str]]: url -> html, None for the pages that failed
+
+        Raise:
+        ------
+            - if urls is not a list
+    """
+    if not isinstance(urls, list):
+        raise TypeError(f"wrong type, urls should be list, found : {type(urls).__name__}")
+
+    stats = {}
+    start = time.perf_counter()
+    cache = http_cache.get_http_cache() if use_cache else None
+    pages = asyncio.run(fetch_all(list(dict.fromkeys(urls)), max_per_host=max_per_host, stats=stats, cache=cache, **kwargs))
+    elapsed = time.perf_counter() - start
+
+    print(f"fetch : {stats.get('pages', 0)} pages in {elapsed:.2f}s ({stats.get('pages', 0) / max(elapsed, 1e-9):.1f} pages/sec), "
+          f"{stats.get('retries', 0)} retries, {stats.get('failures', 0)} failures")
+    return pages
@@ -0,0 +1,114 @@
+import argparse
+import time
+from typing import Dict, List
+import numpy as np
+import faiss
+import sys
+sys.path.append('..')
+import scripts.get_vector_store as get_vector_store
+
+# Benchmark of the index types of get_vector_store on synthetic embeddings, run from the root of the repo :
+#   python -m scripts.benchmark_ann_index --sizes 10000 100000 1000000
+# recall@10 is computed against the FLAT (exact) index
+
+DIMENSION = 384 # all-MiniLM-L6-v2
+
+
+def create_synthetic_vectors(nb_vectors: int, dimension: int = DIMENSION, nb_clusters: int = 100, seed: int = 0)-> np.ndarray:
+    """Create clustered normalized vectors, closer to sentence embeddings than
+    uniform noise
+
+        Args:
+            nb_vectors (int):
+                number of vectors
+
+            dimension (int, optional):
+                dimension of the vectors. Defaults to DIMENSION.
+
+            nb_clusters (int, optional):
+                number of topics. Defaults to 100.
+
+            seed (int, optional):
+                random seed of the points, the topics are the same for every seed. Defaults to 0.
+
+        Returns:
+            np.ndarray: the float32 vectors (nb_vectors, dimension)
+    """
+    centers = np.random.default_rng(1234).standard_normal((nb_clusters, dimension), dtype=np.float32)
+    rng     = np.random.default_rng(seed)
+    vectors = np.empty((nb_vectors, dimension), dtype=np.float32)
+
+    # by chunk to limit the memory of the 1M corpus
+    for start in range(0, nb_vectors, 100_000):
+        end    = min(start + 100_000, nb_vectors)
+        labels = rng.integers(0, nb_clusters, end - start)
+        vectors[start:end] = centers[labels] + 0.3 * rng.standard_normal((end - start, dimension), dtype=np.float32)
+
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def measure_latencies(index: faiss.Index, queries: np.ndarray, k: int)-> np.ndarray:
+    """Latency of each query searched one by one, like in the app
+
+        Returns:
+            np.ndarray: the latencies in milliseconds
+    """
+    latencies = []
+    for i in range(queries.shape[0]):
+        start = time.perf_counter()
+        index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def benchmark_index(index_type: str, vectors: np.ndarray, queries: np.ndarray, ground_truth: np.ndarray, k: int)-> Dict[str, float]:
+    """Build an index of the given type and measure its recall, latency and memory
+
+        Returns:
+            Dict[str, float]: the measures
+    """
+    start = time.perf_counter()
+    index = get_vector_store.create_faiss_index(vectors, index_type)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - start
+
+    _, indices = index.search(queries, k)
+    recall     = np.mean([len(set(indices[i]) & set(ground_truth[i])) / k for i in range(queries.shape[0])])
+    latencies  = measure_latencies(index, queries, k)
+
+    return {"index"        : type(index).__name__,
+            "build_s"      : build_seconds,
+            "recall@10"    : recall,
+            "p50_ms"       : np.percentile(latencies, 50),
+            "p99_ms"       : np.percentile(latencies, 99),
+            "memory_mb"    : faiss.serialize_index(index).nbytes / 1024**2}
+
+
+def main(sizes: List[int], index_types: List[str], nb_queries: int, k: int = 10):
+
+    print(f"{'size':>9} {'type':>6} {'index':>14} {'build_s':>9} {'recall@10':>10} {'p50_ms':>8} {'p99_ms':>8} {'memory_mb':>10}")
+
+    for size in sizes:
+        vectors = create_synthetic_vectors(size)
+        queries = create_synthetic_vectors(nb_queries, seed=1)
+
+        # exact baseline
+        flat = faiss.IndexFlatL2(vectors.shape[1])
+        flat.add(vectors)
+        _, ground_truth = flat.search(queries, k)
+
+        for index_type in ["FLAT"] + [index_type for index_type in index_types if index_type != "FLAT"]:
+            res = benchmark_index(index_type, vectors, queries, ground_truth, k)
+            print(f"{size:>9} {index_type:>6} {res['index']:>14} {res['build_s']:>9.1f} {res['recall@10']:>10.3f} "
+                  f"{res['p50_ms']:>8.3f} {res['p99_ms']:>8.3f} {res['memory_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="recall@10, latency and memory of the FAISS index types")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="corpus sizes")
+    parser.add_argument("--index-types", nargs="+", default=["IVF", "HNSW", "IVFPQ"], help="index types compared to FLAT")
+    parser.add_argument("--nb-queries", type=int, default=200, help="number of queries")
+    args = parser.parse_args()
+
+    main(args.sizes, [index_type.upper() for index_type in args.index_types], args.nb_queries)
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+from typing import List
+from aiohttp import web
+import sys
+sys.path.append('..')
+import scripts.get_metadata_thesis_bs4 as get_metadata_thesis_bs4
+import scripts.http_cache as http_cache
+import scripts.storage_database as storage_database
+
+# Benchmark of the metadata fetch of the theses pages : the thread version (50 threads,
+# one requests.get per page) against the asyncio fetcher (one pooled session), on a local
+# stand-in of theses.fr, run from the root of the repo :
+#   python -m scripts.benchmark_async_fetcher --nb-pages 500 --latency 0.1 --error-rate 0.02
+# the server answers after --latency seconds and fails --error-rate of the requests with a 503,
+# the http cache is disabled so that every page is downloaded
+
+http_cache.HTTP_CACHE_ENABLED = False
+
+PAGE = """<html><body>
+<h1 data-v-d290f8ce>Thèse {number}</h1>
+<table>
+<tr data-v-276fb210>Auteur / Autrice : Author {number}</tr>
+<tr data-v-276fb210>Discipline(s) : Chimie</tr>
+<tr data-v-276fb210>Date : Soutenance le 03/11/2016</tr>
+</table>
+<p data-v-35e8592d>{content}</p>
+</body></html>"""
+
+
+def start_server(latency: float, error_rate: float, max_connections: int = 0)-> str:
+    """Start the stand-in server in a thread
+
+        Args:
+            latency (float):
+                seconds before each answer
+
+            error_rate (float):
+                share of the requests answered by a 503
+
+            max_connections (int, optional):
+                connections served at once like a rate limited host, 0 for no limit. Defaults to 0.
+
+        Returns:
+            str: the url of the server
+    """
+    started = threading.Event()
+    address = {}
+
+    async def main():
+        limit = asyncio.Semaphore(max_connections if max_connections > 0 else 10**6)
+
+        async def these_page(request):
+            async with limit:
+                await asyncio.sleep(latency)
+                if random.random() < error_rate:
+                    return web.Response(status=503)
+                number = request.match_info["number"]
+                return web.Response(text=PAGE.format(number=number, content="water membrane filtration " * 80), content_type="text/html")
+
+        app    = web.Application()
+        app.router.add_get("/these/{number}", these_page)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site   = web.TCPSite(runner, "127.0.0.1", 0, backlog=1024)
+        await site.start()
+        address["url"] = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        started.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(main()), daemon=True).start()
+    started.wait()
+    return address["url"]
+
+
+def benchmark(name: str, scrape, urls: List[str]):
+    """Time a scraper, the pages/sec only count the theses parsed with their title,
+    an error page parsed by the thread version is not a these
+    """
+    start    = time.perf_counter()
+    metadata = scrape(urls)
+    elapsed  = time.perf_counter() - start
+    parsed   = int((metadata["title"] != storage_database.MISSING_VALUE).sum()) if "title" in metadata.columns else 0
+    print(f"{name:>22} {len(urls):>6} {parsed:>8} {elapsed:>9.2f} {parsed / elapsed:>10.1f}")
+
+
+def main(nb_pages: int, latency: float, error_rate: float, per_host: List[int], max_connections: int):
+
+    url  = start_server(latency, error_rate, max_connections)
+    urls = [f"{url}/these/{i}" for i in range(nb_pages)]
+
+    print(f"{nb_pages} pages, latency {latency}s, error rate {error_rate}, server connections {max_connections or 'unlimited'}")
+    print(f"{'fetcher':>22} {'pages':>6} {'parsed':>8} {'seconds':>9} {'pages/sec':>10}")
+
+    benchmark("threads (50)", get_metadata_thesis_bs4.get_all_metadata_theses_bs_parallelized, urls)
+    for max_per_host in per_host:
+        benchmark(f"asyncio (per host {max_per_host})",
+                  lambda urls: get_metadata_thesis_bs4.get_all_metadata_theses_bs_async(urls, max_per_host=max_per_host), urls)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="thread fetcher against the asyncio fetcher on a local server")
+    parser.add_argument("--nb-pages", type=int, default=500, help="number of theses pages")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds before each answer of the server")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of the requests failed with a 503")
+    parser.add_argument("--per-host", type=int, nargs="+", default=[8, 16, 50], help="MAX_PER_HOST values of the asyncio fetcher")
+    parser.add_argument("--server-connections", type=int, default=0, help="requests served at once by the server, 0 for no limit")
+    args = parser.parse_args()
+
+    main(args.nb_pages, args.latency, args.error_rate, args.per_host, args.server_connections)
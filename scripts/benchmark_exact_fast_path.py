@@ -0,0 +1,90 @@
+import argparse
+import time
+from typing import Dict, List
+import numpy as np
+import faiss
+import sys
+sys.path.append('..')
+import scripts.get_vector_store as get_vector_store
+import scripts.retrieval_service as retrieval_service
+from scripts.benchmark_ann_index import create_synthetic_vectors
+
+# Benchmark of the exact numpy search over a result set against the FAISS search restricted
+# to the result set by an ID selector, run from the root of the repo :
+#   python -m scripts.benchmark_exact_fast_path --corpus-size 100000 --index-types FLAT HNSW
+# the crossover is the result set size from which the FAISS index is faster, it is the
+# value to set for EXACT_SEARCH_MAX_SIZE
+
+
+def median_latency(search, queries: np.ndarray)-> float:
+    """Median latency of queries searched one by one, like in the app
+
+        Returns:
+            float: the median latency in milliseconds
+    """
+    latencies = []
+    for i in range(queries.shape[0]):
+        start = time.perf_counter()
+        search(queries[i])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies))
+
+
+def benchmark_size(index: faiss.Index, vectors: np.ndarray, queries: np.ndarray, size: int, k: int, seed: int = 0)-> Dict[str, float]:
+    """Latency of both paths for a result set of the given size drawn in the corpus
+
+        Returns:
+            Dict[str, float]: the measures
+    """
+    positions = np.sort(np.random.default_rng(seed).choice(vectors.shape[0], size, replace=False))
+
+    # built once per result set and cached by the retrieval service
+    start  = time.perf_counter()
+    matrix = np.ascontiguousarray(vectors[positions])
+    norms  = np.einsum("ij,ij->i", matrix, matrix)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    params = get_vector_store.get_search_parameters(index, faiss.IDSelectorBatch(positions))
+
+    numpy_ms = median_latency(lambda query: retrieval_service.exact_top_k(query, matrix, norms, k), queries)
+    faiss_ms = median_latency(lambda query: index.search(query[None, :], k, params=params), queries)
+
+    return {"matrix_build_ms": build_ms,
+            "matrix_mb"      : matrix.nbytes / 1024**2,
+            "numpy_ms"       : numpy_ms,
+            "faiss_ms"       : faiss_ms}
+
+
+def main(corpus_size: int, index_types: List[str], sizes: List[int], nb_queries: int, k: int = 10):
+
+    vectors = create_synthetic_vectors(corpus_size)
+    queries = create_synthetic_vectors(nb_queries, seed=1)
+
+    print(f"corpus of {corpus_size} vectors, {nb_queries} queries, k = {k}")
+    print(f"{'type':>6} {'result_set':>10} {'build_ms':>9} {'matrix_mb':>10} {'numpy_ms':>9} {'faiss_ms':>9} {'faster':>7}")
+
+    for index_type in index_types:
+        index = get_vector_store.create_faiss_index(vectors, index_type, precision="float32")
+        index.add(vectors)
+
+        crossover = None
+        for size in [size for size in sizes if size <= corpus_size]:
+            res    = benchmark_size(index, vectors, queries, size, k)
+            faster = "numpy" if res["numpy_ms"] <= res["faiss_ms"] else "faiss"
+            if faster == "faiss" and crossover is None:
+                crossover = size
+            print(f"{index_type:>6} {size:>10} {res['matrix_build_ms']:>9.2f} {res['matrix_mb']:>10.1f} "
+                  f"{res['numpy_ms']:>9.3f} {res['faiss_ms']:>9.3f} {faster:>7}")
+
+        print(f"{index_type:>6} crossover : {crossover if crossover else 'none, numpy is faster up to ' + str(max(sizes))}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="exact numpy search of a result set against the FAISS index")
+    parser.add_argument("--corpus-size", type=int, default=100_000, help="number of vectors in the index")
+    parser.add_argument("--index-types", nargs="+", default=["FLAT", "HNSW", "IVF"], help="index types compared to numpy")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 2_000, 3_000, 5_000, 10_000, 20_000, 50_000, 100_000], help="result set sizes")
+    parser.add_argument("--nb-queries", type=int, default=100, help="number of queries")
+    args = parser.parse_args()
+
+    main(args.corpus_size, [index_type.upper() for index_type in args.index_types], args.sizes, args.nb_queries)
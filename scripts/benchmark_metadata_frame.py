@@ -0,0 +1,70 @@
+import argparse
+import random
+import time
+from typing import Dict, List
+import pandas as pd
+
+# Microbenchmark of the dataframe of the scraped metadata : one-row dataframes concatenated
+# in the loop (previous scrapers, O(n²) copies) against records built into a frame once,
+# run from the root of the repo :
+#   python -m scripts.benchmark_metadata_frame --sizes 100 1000 10000
+
+# metadata names of theses.fr, a page only has some of them
+METADATA = ["Auteur / Autrice", "Direction", "Type", "Discipline(s)", "Date", "Etablissement(s)",
+            "Ecole(s) doctorale(s)", "Partenaire(s) de recherche", "Jury", "Examinateurs / Examinatrices",
+            "Rapporteurs / Rapporteuses", "Equipe de recherche", "Laboratoire", "référent"]
+
+
+def create_records(nb_theses: int, seed: int = 0)-> List[Dict[str, str]]:
+    """Records shaped like the scraped theses, with an abstract of about 1500 characters"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(nb_theses):
+        record = {name: f"{name} {i}" for name in METADATA if rng.random() < 0.8}
+        record["title"]     = f"Thèse {i}"
+        record["content"]   = "water membrane filtration " * 60
+        record["url_these"] = f"https://theses.fr/{i}"
+        records.append(record)
+    return records
+
+
+def concat_in_loop(records: List[Dict[str, str]])-> pd.DataFrame:
+    metadata = pd.DataFrame()
+    for record in records:
+        metadata = pd.concat([metadata, pd.DataFrame([record])])
+    return metadata.reset_index(drop=True)
+
+
+def build_once(records: List[Dict[str, str]])-> pd.DataFrame:
+    return pd.DataFrame.from_records(records)
+
+
+def main(sizes: List[int], max_concat_size: int):
+
+    print(f"{'theses':>7} {'concat_s':>9} {'records_s':>10} {'speedup':>8} {'same':>5}")
+    for size in sizes:
+        records = create_records(size)
+
+        start    = time.perf_counter()
+        df_once  = build_once(records)
+        once_s   = time.perf_counter() - start
+
+        if size > max_concat_size:
+            print(f"{size:>7} {'skipped':>9} {once_s:>10.4f} {'-':>8} {'-':>5}")
+            continue
+
+        start     = time.perf_counter()
+        df_concat = concat_in_loop(records)
+        concat_s  = time.perf_counter() - start
+
+        same = df_concat.fillna("").astype(str).equals(df_once[df_concat.columns].fillna("").astype(str))
+        print(f"{size:>7} {concat_s:>9.3f} {once_s:>10.4f} {concat_s / once_s:>7.0f}x {str(same):>5}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="dataframe of the scraped metadata, concat in the loop against records")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000], help="number of theses")
+    parser.add_argument("--max-concat-size", type=int, default=10_000, help="larger sizes only run the records version")
+    args = parser.parse_args()
+
+    main(args.sizes, args.max_concat_size)
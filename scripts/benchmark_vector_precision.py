@@ -0,0 +1,95 @@
+import argparse
+import time
+from typing import Dict, List
+import numpy as np
+import faiss
+import sys
+sys.path.append('..')
+import scripts.get_vector_store as get_vector_store
+from scripts.benchmark_ann_index import create_synthetic_vectors
+
+# Benchmark of the precision of the vectors stored in the index, run from the root of the repo :
+#   python -m scripts.benchmark_vector_precision --sizes 10000 100000 --index-types FLAT HNSW
+# recall@10 is computed against the exact float32 FLAT index, with and without
+# re-scoring the RERANK_FACTOR * 10 candidates with the exact float32 vectors
+
+
+def search_rescored(index: faiss.Index, vectors: np.ndarray, queries: np.ndarray, k: int, rerank_factor: int)-> np.ndarray:
+    """Search rerank_factor * k candidates and keep the k closest by exact distance
+
+        Returns:
+            np.ndarray: the (nb_queries, k) positions
+    """
+    _, candidates = index.search(queries, k * rerank_factor)
+    results = np.empty((queries.shape[0], k), dtype=np.int64)
+
+    for i in range(queries.shape[0]):
+        distances  = ((vectors[candidates[i]] - queries[i]) ** 2).sum(axis=1)
+        results[i] = candidates[i][np.argsort(distances, kind="stable")[:k]]
+    return results
+
+
+def get_recall(indices: np.ndarray, ground_truth: np.ndarray, k: int)-> float:
+    return float(np.mean([len(set(indices[i]) & set(ground_truth[i])) / k for i in range(indices.shape[0])]))
+
+
+def benchmark_precision(index_type: str, precision: str, vectors: np.ndarray, queries: np.ndarray,
+                        ground_truth: np.ndarray, k: int, rerank_factor: int)-> Dict[str, float]:
+    """Build an index of the given type and precision and measure its memory, recall and latency
+
+        Returns:
+            Dict[str, float]: the measures
+    """
+    index = get_vector_store.create_faiss_index(vectors, index_type, precision=precision)
+    index.add(vectors)
+
+    start = time.perf_counter()
+    _, indices = index.search(queries, k)
+    search_ms  = (time.perf_counter() - start) * 1000 / queries.shape[0]
+
+    start = time.perf_counter()
+    rescored    = search_rescored(index, vectors, queries, k, rerank_factor)
+    rescored_ms = (time.perf_counter() - start) * 1000 / queries.shape[0]
+
+    memory = faiss.serialize_index(index).nbytes
+    return {"index"          : type(index).__name__,
+            "memory_mb"      : memory / 1024**2,
+            "bytes_per_vec"  : memory / vectors.shape[0],
+            "recall@10"      : get_recall(indices, ground_truth, k),
+            "rescored@10"    : get_recall(rescored, ground_truth, k),
+            "search_ms"      : search_ms,
+            "rescored_ms"    : rescored_ms}
+
+
+def main(sizes: List[int], index_types: List[str], precisions: List[str], nb_queries: int, rerank_factor: int, k: int = 10):
+
+    print(f"{'size':>9} {'type':>6} {'precision':>9} {'index':>26} {'memory_mb':>10} {'bytes/vec':>10} "
+          f"{'recall@10':>10} {'rescored@10':>12} {'search_ms':>10} {'rescored_ms':>12}")
+
+    for size in sizes:
+        vectors = create_synthetic_vectors(size)
+        queries = create_synthetic_vectors(nb_queries, seed=1)
+
+        # exact baseline
+        flat = faiss.IndexFlatL2(vectors.shape[1])
+        flat.add(vectors)
+        _, ground_truth = flat.search(queries, k)
+
+        for index_type in index_types:
+            for precision in precisions:
+                res = benchmark_precision(index_type, precision, vectors, queries, ground_truth, k, rerank_factor)
+                print(f"{size:>9} {index_type:>6} {precision:>9} {res['index']:>26} {res['memory_mb']:>10.1f} {res['bytes_per_vec']:>10.0f} "
+                      f"{res['recall@10']:>10.3f} {res['rescored@10']:>12.3f} {res['search_ms']:>10.3f} {res['rescored_ms']:>12.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="memory and recall@10 of float32, float16 and int8 vectors")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="corpus sizes")
+    parser.add_argument("--index-types", nargs="+", default=["FLAT", "HNSW"], help="index types")
+    parser.add_argument("--precisions", nargs="+", default=list(get_vector_store.PRECISIONS.keys()), help="precisions compared")
+    parser.add_argument("--nb-queries", type=int, default=200, help="number of queries")
+    parser.add_argument("--rerank-factor", type=int, default=get_vector_store.RERANK_FACTOR, help="candidates re-scored = rerank factor * 10")
+    args = parser.parse_args()
+
+    main(args.sizes, [index_type.upper() for index_type in args.index_types],
+         [precision.lower() for precision in args.precisions], args.nb_queries, args.rerank_factor)
@@ -0,0 +1,506 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import Counter
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+import configparser
+import sys
+sys.path.append('..')
+import scripts.storage_database as storage_database
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+BM25_INDEX_PATH = config["DEFAULT"]["BM25_INDEX_PATH"]
+K1              = config["BM25"].getfloat("K1")
+B               = config["BM25"].getfloat("B")
+MERGE_RATIO     = config["BM25"].getfloat("MERGE_RATIO")
+MAX_SEGMENTS    = config["BM25"].getint("MAX_SEGMENTS")
+
+# file of the index in BM25_INDEX_PATH : vocabulary, Id of the store, lengths and postings sorted by term
+INDEX_FILE      = "bm25_index.npz"
+# file of a segment : the theses added after the index file was written, named after the position of its first these
+SEGMENT_FILE    = "bm25_segment_{}.npz"
+SEGMENT_PATTERN = re.compile(r"^bm25_segment_(\d+)\.npz$")
+# columns of the store indexed
+TEXT_COLUMNS    = ["title", "content"]
+TOKEN_PATTERN   = re.compile(r"\w+")
+
+
+def tokenize(text: str)-> List[str]:
+    """Lower case words of a text without accents, tokens of one character are dropped
+
+        Args:
+            text (str):
+                the text to tokenize
+
+        Returns:
+            List[str]: the tokens
+
+        Example:
+        --------
+            >>> tokenize("Étude de l'apprentissage")
+            ['etude', 'de', 'apprentissage']
+    """
+    if not isinstance(text, str):
+        return []
+
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in TOKEN_PATTERN.findall(text) if len(token) > 1]
+
+
+def get_texts(df: pd.DataFrame)-> List[str]:
+    """Text indexed for each these of the store : the title and the content, missing values are skipped
+
+        Args:
+            df (pd.DataFrame):
+                theses of the store
+
+        Returns:
+            List[str]: the text of each row
+    """
+    columns = [column for column in TEXT_COLUMNS if column in df.columns]
+    texts   = []
+    for row in df[columns].itertuples(index=False):
+        texts.append(" ".join(value for value in row if isinstance(value, str) and value.strip() != storage_database.MISSING_VALUE))
+    return texts
+
+
+def get_segment_files(bm25_index_path: str)-> List[Tuple[int, str]]:
+    """Segment files of an index folder
+
+        Args:
+            bm25_index_path (str):
+                folder of the index
+
+        Returns:
+            List[Tuple[int, str]]: position of the first these and path of each segment, in the order of the positions
+    """
+    if not os.path.isdir(bm25_index_path):
+        return []
+
+    segments = []
+    for file_name in os.listdir(bm25_index_path):
+        match = SEGMENT_PATTERN.match(file_name)
+        if match is not None:
+            segments.append((int(match.group(1)), os.path.join(bm25_index_path, file_name)))
+    return sorted(segments)
+
+
+class BM25Index:
+    """
+        Okapi BM25 inverted index of the theses of the store, persisted in npz files.
+        The corpus is tokenized once at ingest time, only the new theses are tokenized
+        when the index is updated. The postings are stored sorted by term so that a query
+        only reads the postings of its terms, the scores are computed with numpy and the
+        top k is selected with argpartition.
+        The theses added go in a new segment (postings sorted by term of these theses only)
+        saved in its own file, so an ingest doesn't rewrite the postings of the corpus. The
+        segments are merged in the index file when they hold merge_ratio of its postings or
+        when there are max_segments of them.
+
+        Example:
+        --------
+            >>> index = BM25Index.load("./static/bm25_index")
+            >>> index.add([12, 13], ["deep learning for ...", "..."])
+            >>> index.save("./static/bm25_index")
+            >>> index.search("deep learning", 10, ids=[12, 13, 40])
+            [(12, 3.2), (40, 1.1)]
+    """
+
+    def __init__(self, k1: float = K1, b: float = B, merge_ratio: float = MERGE_RATIO, max_segments: int = MAX_SEGMENTS):
+
+        self.k1           = k1
+        self.b            = b
+        self.merge_ratio  = merge_ratio
+        self.max_segments = max_segments
+
+        self.terms         = []                            # term id -> term
+        self.term_ids      = {}                            # term -> term id
+        self.doc_ids       = np.empty(0, dtype=np.int64)   # position -> Id of the store
+        self.doc_lengths   = np.empty(0, dtype=np.int32)
+        # postings sorted by term, the postings of term t are in [term_pointers[t], term_pointers[t + 1]),
+        # the terms created after the postings have no pointer
+        self.term_pointers = np.zeros(1, dtype=np.int64)
+        self.term_docs     = np.empty(0, dtype=np.int32)
+        self.term_tfs      = np.empty(0, dtype=np.int32)
+        # (position of the first these, term_pointers, term_docs, term_tfs) of each segment not merged yet
+        self.segments      = []
+
+        # folder where the postings and the first _nb_saved_segments segments are saved, the
+        # generation of the index file is written in its segments, the other segments are stale
+        self._saved_path        = None
+        self._nb_saved_segments = 0
+        self._generation        = 0
+
+        self._build()
+
+    def __len__(self):
+        return self.doc_ids.shape[0]
+
+    def _get_parts(self)-> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """term_pointers, term_docs and term_tfs of the merged postings and of each segment"""
+        return [(self.term_pointers, self.term_docs, self.term_tfs)] + [segment[1:] for segment in self.segments]
+
+    def _build(self):
+        """Compute the idf of the terms and the length normalization of the documents,
+        both depend on the whole corpus
+        """
+        nb_docs = len(self)
+
+        document_frequencies = np.zeros(len(self.terms), dtype=np.int64)
+        for term_pointers, _, _ in self._get_parts():
+            document_frequencies[:term_pointers.shape[0] - 1] += np.diff(term_pointers)
+        self._idf            = np.log1p((nb_docs - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+
+        average_length       = self.doc_lengths.mean() if nb_docs else 1.0
+        self._doc_norms      = (self.k1 * (1 - self.b + self.b * self.doc_lengths / max(average_length, 1e-9))).astype(np.float32)
+        self._position_of_id = dict(zip(self.doc_ids.tolist(), range(nb_docs)))
+
+    def add(self, ids: List[int], texts: List[str])-> int:
+        """Tokenize and append theses to the index, the Id already indexed are skipped.
+        The new postings make a new segment, the postings already indexed are not
+        read nor copied
+
+            Args:
+                ids (List[int]):
+                    Id in the store of the theses
+
+                texts (List[str]):
+                    text of each these
+
+            Returns:
+                int: number of theses added
+
+            Raise:
+            ------
+                - if ids and texts don't have the same length
+        """
+        if len(ids) != len(texts):
+            raise TypeError(f"ids and texts should have the same length, recieved : {len(ids)} and {len(texts)}")
+
+        new_ids, lengths, post_docs, post_terms, post_tfs = [], [], [], [], []
+        position = len(self)
+        seen     = set()
+
+        for doc_id, text in zip(ids, texts):
+            doc_id = int(doc_id)
+            if doc_id in self._position_of_id or doc_id in seen:
+                continue
+            seen.add(doc_id)
+
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                if term not in self.term_ids:
+                    self.term_ids[term] = len(self.terms)
+                    self.terms.append(term)
+                post_docs.append(position)
+                post_terms.append(self.term_ids[term])
+                post_tfs.append(tf)
+
+            new_ids.append(doc_id)
+            lengths.append(len(tokens))
+            position += 1
+
+        if len(new_ids) == 0:
+            return 0
+
+        # postings of the segment sorted by term, in the order of the theses for each term
+        post_terms    = np.array(post_terms, dtype=np.int64)
+        order         = np.argsort(post_terms, kind="stable")
+        term_pointers = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(post_terms, minlength=len(self.terms)), out=term_pointers[1:])
+        self.segments.append((len(self), term_pointers,
+                              np.array(post_docs, dtype=np.int32)[order], np.array(post_tfs, dtype=np.int32)[order]))
+
+        self.doc_ids     = np.concatenate([self.doc_ids, np.array(new_ids, dtype=np.int64)])
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.array(lengths, dtype=np.int32)])
+        self._build()
+
+        return len(new_ids)
+
+    def get_postings(self, term_id: int)-> Tuple[np.ndarray, np.ndarray]:
+        """Postings of a term in the merged postings and in the segments
+
+            Args:
+                term_id (int):
+                    id of the term
+
+            Returns:
+                Tuple[np.ndarray, np.ndarray]: position and term frequency in each these containing the term
+        """
+        docs, tfs = [], []
+        for term_pointers, term_docs, term_tfs in self._get_parts():
+            if term_id + 1 < term_pointers.shape[0]:
+                start, end = term_pointers[term_id], term_pointers[term_id + 1]
+                docs.append(term_docs[start:end])
+                tfs.append(term_tfs[start:end])
+
+        if len(docs) == 1:
+            return docs[0], tfs[0]
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def needs_merge(self)-> bool:
+        """The segments hold merge_ratio of the merged postings or there are max_segments of them"""
+        nb_segment_postings = sum(segment[2].shape[0] for segment in self.segments)
+        return len(self.segments) >= self.max_segments or nb_segment_postings > self.merge_ratio * self.term_docs.shape[0]
+
+    def merge(self):
+        """Merge the segments in the postings sorted by term, the segments are concatenated
+        after the postings so that the postings of a term stay in the order of the theses
+        """
+        if len(self.segments) == 0:
+            return
+
+        parts      = self._get_parts()
+        post_terms = np.concatenate([np.repeat(np.arange(term_pointers.shape[0] - 1), np.diff(term_pointers))
+                                     for term_pointers, _, _ in parts])
+        order      = np.argsort(post_terms, kind="stable")
+
+        self.term_docs     = np.concatenate([term_docs for _, term_docs, _ in parts])[order]
+        self.term_tfs      = np.concatenate([term_tfs for _, _, term_tfs in parts])[order]
+        self.term_pointers = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(post_terms, minlength=len(self.terms)), out=self.term_pointers[1:])
+        self.segments      = []
+
+    def search(self, query: str, k: int, ids: List[int] = None)-> List[Tuple[int, float]]:
+        """Score the theses containing at least one term of the query
+
+            Args:
+                query (str):
+                    the query string
+
+                k (int):
+                    number of theses to return
+
+                ids (List[int], optional):
+                    Id in the store of the candidate theses. Defaults to None, every these.
+
+            Returns:
+                List[Tuple[int, float]]: Id in the store and score of the theses, the best first
+        """
+        query_terms = Counter(self.term_ids[token] for token in tokenize(query) if token in self.term_ids)
+        if len(query_terms) == 0 or k <= 0:
+            return []
+
+        mask = None
+        if ids is not None:
+            mask = np.zeros(len(self), dtype=bool)
+            mask[[self._position_of_id[int(i)] for i in ids if int(i) in self._position_of_id]] = True
+
+        docs, contributions = [], []
+        for term_id, query_tf in query_terms.items():
+            term_docs, term_tfs = self.get_postings(term_id)
+            term_tfs            = term_tfs.astype(np.float32)
+
+            if mask is not None:
+                keep      = mask[term_docs]
+                term_docs = term_docs[keep]
+                term_tfs  = term_tfs[keep]
+
+            docs.append(term_docs)
+            contributions.append(query_tf * self._idf[term_id] * term_tfs * (self.k1 + 1) / (term_tfs + self._doc_norms[term_docs]))
+
+        docs = np.concatenate(docs)
+        if docs.shape[0] == 0:
+            return []
+
+        # sum the contributions of the terms of each document, a dense array over the
+        # corpus is cheaper than sorting the postings when the query terms are frequent
+        if docs.shape[0] * 8 > len(self):
+            scores      = np.bincount(docs, weights=np.concatenate(contributions), minlength=len(self))
+            unique_docs = np.flatnonzero(scores)
+            scores      = scores[unique_docs]
+        else:
+            unique_docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(contributions))
+
+        if scores.shape[0] > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return list(zip(self.doc_ids[unique_docs[top]].tolist(), scores[top].tolist()))
+
+    def save(self, bm25_index_path: str = BM25_INDEX_PATH):
+        """Write the index in bm25_index_path : only the segments not saved yet if the index
+        was loaded from or saved in this folder, otherwise, or if the segments need a merge,
+        the merged postings in the index file and the segment files are removed. Each file is
+        replaced at once so a process reading the index never sees a partial file
+
+            Args:
+                bm25_index_path (str, optional):
+                    folder of the index. Defaults to BM25_INDEX_PATH.
+        """
+        if not os.path.exists(bm25_index_path):
+            os.makedirs(bm25_index_path)
+
+        if self._saved_path != os.path.abspath(bm25_index_path) or self.needs_merge():
+            self.merge()
+            self._generation = time.time_ns()
+            self._save_file(os.path.join(bm25_index_path, INDEX_FILE),
+                            terms         = np.array(self.terms, dtype=str),
+                            doc_ids       = self.doc_ids,
+                            doc_lengths   = self.doc_lengths,
+                            term_pointers = self.term_pointers,
+                            term_docs     = self.term_docs,
+                            term_tfs      = self.term_tfs,
+                            parameters    = np.array([self.k1, self.b]),
+                            generation    = np.array(self._generation))
+            # merged in the index file or stale, the readers skip them until they are removed
+            for _, segment_file in get_segment_files(bm25_index_path):
+                os.remove(segment_file)
+        else:
+            first_term = self.term_pointers.shape[0] - 1
+            for number, (first_position, term_pointers, term_docs, term_tfs) in enumerate(self.segments):
+                last_position = self.segments[number + 1][0] if number + 1 < len(self.segments) else len(self)
+                if number >= self._nb_saved_segments:
+                    # the terms created by the segment, their ids follow the terms of the previous ones
+                    self._save_file(os.path.join(bm25_index_path, SEGMENT_FILE.format(first_position)),
+                                    terms         = np.array(self.terms[first_term:term_pointers.shape[0] - 1], dtype=str),
+                                    doc_ids       = self.doc_ids[first_position:last_position],
+                                    doc_lengths   = self.doc_lengths[first_position:last_position],
+                                    term_pointers = term_pointers,
+                                    term_docs     = term_docs,
+                                    term_tfs      = term_tfs,
+                                    generation    = np.array(self._generation))
+                first_term = term_pointers.shape[0] - 1
+
+        self._saved_path        = os.path.abspath(bm25_index_path)
+        self._nb_saved_segments = len(self.segments)
+
+    @staticmethod
+    def _save_file(file_path: str, **arrays):
+        """Write arrays in a npz file through a temporary file replaced at once"""
+        temp_file = file_path + ".tmp.npz"
+        np.savez(temp_file, **arrays)
+        os.replace(temp_file, file_path)
+
+    @classmethod
+    def load(cls, bm25_index_path: str = BM25_INDEX_PATH)-> "BM25Index":
+        """Load the index of bm25_index_path and its segments, an empty index if it doesn't exist yet
+
+            Args:
+                bm25_index_path (str, optional):
+                    folder of the index. Defaults to BM25_INDEX_PATH.
+
+            Returns:
+                BM25Index: the index
+        """
+        index      = cls()
+        index_file = os.path.join(bm25_index_path, INDEX_FILE)
+
+        if not os.path.exists(index_file):
+            return index
+
+        with np.load(index_file, allow_pickle=False) as data:
+            index.terms         = data["terms"].tolist()
+            index.doc_ids       = data["doc_ids"]
+            index.doc_lengths   = data["doc_lengths"]
+            index.term_pointers = data["term_pointers"]
+            index.term_docs     = data["term_docs"]
+            index.term_tfs      = data["term_tfs"]
+            index.k1, index.b   = data["parameters"].tolist()
+            index._generation   = int(data["generation"]) if "generation" in data.files else 0
+
+        doc_ids, doc_lengths = [index.doc_ids], [index.doc_lengths]
+        position             = len(index)
+        try:
+            for first_position, segment_file in get_segment_files(bm25_index_path):
+                if first_position != position: # merged in the index file or stale
+                    continue
+                with np.load(segment_file, allow_pickle=False) as data:
+                    if int(data["generation"]) != index._generation:
+                        continue
+                    index.terms.extend(data["terms"].tolist())
+                    index.segments.append((first_position, data["term_pointers"], data["term_docs"], data["term_tfs"]))
+                    doc_ids.append(data["doc_ids"])
+                    doc_lengths.append(data["doc_lengths"])
+                position += doc_ids[-1].shape[0]
+        except FileNotFoundError: # the segments were merged by another process meanwhile
+            return cls.load(bm25_index_path)
+
+        index.doc_ids            = np.concatenate(doc_ids)
+        index.doc_lengths        = np.concatenate(doc_lengths)
+        index.term_ids           = {term: term_id for term_id, term in enumerate(index.terms)}
+        index._saved_path        = os.path.abspath(bm25_index_path)
+        index._nb_saved_segments = len(index.segments)
+        index._build()
+        return index
+
+
+def update_bm25_index(df: pd.DataFrame, bm25_index_path: str = BM25_INDEX_PATH, rebuild: bool = False)-> BM25Index:
+    """Add the theses not indexed yet to the BM25 index, the index is built from the
+    whole store if it doesn't exist yet
+
+        Args:
+            df (pd.DataFrame):
+                theses of the store with their Id
+
+            bm25_index_path (str, optional):
+                folder of the index. Defaults to BM25_INDEX_PATH.
+
+            rebuild (bool, optional):
+                index df from scratch. Defaults to False.
+
+        Returns:
+            BM25Index: the updated index
+
+        Raise:
+        ------
+            - if df is not a DataFrame with an Id column
+    """
+    if not isinstance(df, pd.DataFrame) or storage_database.COLUMN_ID not in df.columns:
+        raise TypeError(f"df should be a pd.DataFrame of the store with its '{storage_database.COLUMN_ID}' column, found : {type(df).__name__}")
+
+    if rebuild:
+        index = BM25Index()
+    else:
+        index = BM25Index.load(bm25_index_path)
+        if len(index) == 0:
+            df = storage_database.load_all_theses()
+
+    start    = time.perf_counter()
+    nb_added = index.add(df[storage_database.COLUMN_ID].tolist(), get_texts(df))
+
+    if nb_added > 0 or rebuild:
+        index.save(bm25_index_path)
+    print(f"BM25 index : {nb_added} theses added in {time.perf_counter() - start:.2f}s, {len(index)} theses, {len(index.terms)} terms")
+
+    return index
+
+
+# index of the process, reloaded when its files change on disk
+_INDEXES      = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_bm25_index(bm25_index_path: str = BM25_INDEX_PATH)-> BM25Index:
+    """Get the BM25 index of the process, loaded at the first call and reloaded
+    when its file is updated or a segment is added
+
+        Args:
+            bm25_index_path (str, optional):
+                folder of the index. Defaults to BM25_INDEX_PATH.
+
+        Returns:
+            BM25Index: the shared index
+    """
+    index_file = os.path.join(bm25_index_path, INDEX_FILE)
+    files      = [index_file] + [segment_file for _, segment_file in get_segment_files(bm25_index_path)]
+    version    = tuple((file, os.path.getmtime(file)) for file in files if os.path.exists(file)) if os.path.exists(index_file) else None
+    key        = os.path.abspath(bm25_index_path)
+
+    with _INDEXES_LOCK:
+        if key not in _INDEXES or _INDEXES[key][1] != version:
+            if version is None:
+                print("BM25 index missing, run : python -m scripts.maintenance rebuild")
+            _INDEXES[key] = (BM25Index.load(bm25_index_path), version)
+        return _INDEXES[key][0]
@@ -1,4 +1,5 @@
 from urllib.parse import urlparse
+import re
 import os
 
 
@@ -18,3 +19,39 @@ def check_correct_url(url_web_site: str, verbose: bool= False):
     if not parsed_url.scheme or not parsed_url.netloc:
         raise ValueError(f"L'URL '{url_web_site}' is not correct.")
     
+
+
+def canonical_query(query: str)-> str:
+    """Canonical form of a user query : lowercase, words separated by one space,
+    two queries with the same canonical form share the same url query
+
+        Args:
+            query (str):
+                the user query
+
+        Returns:
+            str: the canonical query
+
+        Example:
+        --------
+            >>> canonical_query("  Water   Membrane ")
+            "water membrane"
+    """
+    if not isinstance(query, str):
+        raise TypeError(f"wrong type, query should be str, found : {type(query).__name__}")
+
+    return " ".join(query.lower().split())
+
+
+def canonical_url_query(url_query: str)-> str:
+    """Canonical form of a url query built before the queries were canonical,
+    the words of its q parameter are made canonical
+
+        Args:
+            url_query (str):
+                the url query on theses.fr
+
+        Returns:
+            str: the canonical url query
+    """
+    return re.sub(r"([?&]q=)([^&]*)", lambda match: match.group(1) + "+".join(canonical_query(match.group(2).replace("+", " ")).split()), url_query)
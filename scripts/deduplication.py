@@ -0,0 +1,412 @@
+import time
+import zlib
+import hashlib
+import sqlite3
+from typing import Dict, List, Set, Tuple
+import numpy as np
+import pandas as pd
+import configparser
+import sys
+sys.path.append('..')
+import scripts.storage_database as storage_database
+import scripts.bm25_index as bm25_index
+import scripts.facet_index as facet_index
+import scripts.get_vector_store as get_vector_store
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+VECTOR_STORE_PATH   = config["DEFAULT"]["VECTOR_STORE_PATH"]
+NUM_PERMUTATIONS    = config["DEDUP"].getint("NUM_PERMUTATIONS")
+NUM_BANDS           = config["DEDUP"].getint("NUM_BANDS")
+SHINGLE_SIZE        = config["DEDUP"].getint("SHINGLE_SIZE")
+DUPLICATE_THRESHOLD = config["DEDUP"].getfloat("DUPLICATE_THRESHOLD")
+TITLE_THRESHOLD     = config["DEDUP"].getfloat("TITLE_THRESHOLD")
+
+COLUMN_CONTENT      = "content"
+COLUMN_TITLE        = "title"
+COLUMN_AUTHOR       = "Auteur / Autrice"
+# permutations of the MinHash, fixed so that signatures are the same in every process
+PRIME               = (1 << 31) - 1
+_RNG                = np.random.default_rng(20240101)
+PERMUTATION_A       = _RNG.integers(1, PRIME, NUM_PERMUTATIONS, dtype=np.int64)
+PERMUTATION_B       = _RNG.integers(0, PRIME, NUM_PERMUTATIONS, dtype=np.int64)
+
+
+def get_content_hash(text: str)-> str:
+    """Hash of a text without case, accents, punctuation and whitespace differences
+
+        Args:
+            text (str):
+                the abstract
+
+        Returns:
+            str: the sha1 of the normalized text, None for a missing text
+    """
+    if storage_database.is_missing_value(text):
+        return None
+    return hashlib.sha1(" ".join(bm25_index.tokenize(text)).encode("utf-8")).hexdigest()
+
+
+def get_shingles(text: str, shingle_size: int = SHINGLE_SIZE)-> Set[int]:
+    """Hashes of the sequences of shingle_size words of a normalized text
+
+        Args:
+            text (str):
+                the abstract
+
+            shingle_size (int, optional):
+                number of words of a shingle. Defaults to SHINGLE_SIZE.
+
+        Returns:
+            Set[int]: the shingles, empty for a missing text
+    """
+    if storage_database.is_missing_value(text):
+        return set()
+
+    tokens = bm25_index.tokenize(text)
+    if len(tokens) < shingle_size:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))} if tokens else set()
+
+    return {zlib.crc32(" ".join(tokens[i:i + shingle_size]).encode("utf-8")) for i in range(len(tokens) - shingle_size + 1)}
+
+
+def get_minhash(shingles: Set[int])-> np.ndarray:
+    """MinHash signature of a set of shingles, two signatures agree on a permutation
+    with a probability equal to the Jaccard similarity of the sets
+
+        Args:
+            shingles (Set[int]):
+                the shingles
+
+        Returns:
+            np.ndarray: the NUM_PERMUTATIONS minimum hashes
+    """
+    values = np.fromiter(shingles, dtype=np.int64, count=len(shingles)) % PRIME
+    return ((np.outer(values, PERMUTATION_A) + PERMUTATION_B) % PRIME).min(axis=0)
+
+
+def get_bands(signature: np.ndarray, nb_bands: int = NUM_BANDS)-> List[Tuple[int, int]]:
+    """LSH buckets of a signature : the signature is cut in nb_bands bands, documents
+    sharing one bucket are candidates near duplicates
+
+        Args:
+            signature (np.ndarray):
+                the MinHash signature
+
+            nb_bands (int, optional):
+                number of bands. Defaults to NUM_BANDS.
+
+        Returns:
+            List[Tuple[int, int]]: (band, bucket) of each band
+    """
+    bands = []
+    for band, rows in enumerate(np.array_split(signature, nb_bands)):
+        bucket = int.from_bytes(hashlib.blake2b(rows.tobytes(), digest_size=8).digest(), "big", signed=True)
+        bands.append((band, bucket))
+    return bands
+
+
+def get_containment(shingles_a: Set[int], shingles_b: Set[int])-> float:
+    """Share of the smallest set of shingles found in the other one, 1 for a
+    truncated copy of an abstract
+
+        Returns:
+            float: the containment in [0, 1]
+    """
+    if len(shingles_a) == 0 or len(shingles_b) == 0:
+        return 0.0
+    return len(shingles_a & shingles_b) / min(len(shingles_a), len(shingles_b))
+
+
+def find_store_candidates(conn: sqlite3.Connection, bands: List[Tuple[int, int]])-> Set[int]:
+    """Id of the theses of the store sharing a LSH bucket, lookup on the buckets index"""
+    candidates = set()
+    for band, bucket in bands:
+        rows = conn.execute(f"SELECT {storage_database.COLUMN_ID} FROM {storage_database.TABLE_LSH_BUCKETS} "
+                            f"WHERE band = ? AND bucket = ?", (band, bucket)).fetchall()
+        candidates.update(row[0] for row in rows)
+    return candidates
+
+
+def get_identity(url: str, title: str, author: str)-> Tuple[str, Set[str], str]:
+    """What identifies a these besides its abstract : its url, the tokens of its title
+    and its normalized author, None (or an empty set) for a missing value"""
+    return (None if storage_database.is_missing_value(url) else url,
+            set() if storage_database.is_missing_value(title) else set(bm25_index.tokenize(title)),
+            None if storage_database.is_missing_value(author) else " ".join(bm25_index.tokenize(author)))
+
+
+def is_same_these(identity_a: Tuple[str, Set[str], str], identity_b: Tuple[str, Set[str], str])-> bool:
+    """Two theses with the same (or a near copy of the) abstract are the same these only
+    if their metadata agree : same author or titles sharing TITLE_THRESHOLD of their
+    tokens (Jaccard). An abstract can be a boilerplate shared by several theses, two
+    theses with different urls need both the title and the author to agree
+
+        Args:
+            identity_a (Tuple[str, Set[str], str]):
+                url, title tokens and author of the first these, from get_identity
+
+            identity_b (Tuple[str, Set[str], str]):
+                url, title tokens and author of the second these
+
+        Returns:
+            bool: True if the two theses are the same
+    """
+    url_a, title_a, author_a = identity_a
+    url_b, title_b, author_b = identity_b
+
+    same_title  = len(title_a) > 0 and len(title_b) > 0 and len(title_a & title_b) / len(title_a | title_b) >= TITLE_THRESHOLD
+    same_author = author_a is not None and author_a == author_b
+
+    if url_a is not None and url_b is not None and url_a != url_b:
+        return same_title and same_author
+    return same_title or same_author
+
+
+def load_store_records(conn: sqlite3.Connection, ids: List[int], cache: Dict[int, Tuple[Set[int], Tuple[str, Set[str], str]]])-> Dict[int, Tuple[Set[int], Tuple[str, Set[str], str]]]:
+    """Shingles of the abstracts and identity (url, title, author) of the theses of the
+    store, read once per Id"""
+    missing = [doc_id for doc_id in ids if doc_id not in cache]
+    if missing:
+        existing_columns = storage_database.get_columns(conn)
+        columns = [storage_database.quote_identifier(column) if column in existing_columns else "NULL"
+                   for column in [COLUMN_CONTENT, storage_database.COLUMN_URL_THESE, COLUMN_TITLE, COLUMN_AUTHOR]]
+        placeholders = ", ".join(["?"] * len(missing))
+        rows = conn.execute(f"SELECT {storage_database.COLUMN_ID}, {', '.join(columns)} FROM {storage_database.TABLE_THESES} "
+                            f"WHERE {storage_database.COLUMN_ID} IN ({placeholders})", missing).fetchall()
+        for doc_id, content, url, title, author in rows:
+            cache[doc_id] = (get_shingles(content), get_identity(url, title, author))
+    return cache
+
+
+def find_duplicates(conn: sqlite3.Connection, df: pd.DataFrame, check_store: bool = True)-> pd.DataFrame:
+    """Find the rows of df already in the store or earlier in df : same url of the these,
+    or same abstract once normalized or near duplicate abstract (MinHash LSH candidates
+    verified by the containment of their shingles) with metadata that agree (is_same_these)
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the store
+
+            df (pd.DataFrame):
+                the scraped theses
+
+            check_store (bool, optional):
+                compare the rows to the theses of the store too. Defaults to True.
+
+        Returns:
+            pd.DataFrame: df with a content_hash column and a canonical column : Id of the store
+            of the original these, "row:<i>" for an original earlier in df, None for a new these
+    """
+    df = df.reset_index(drop=True).copy()
+    canonicals, hashes, signatures = [], [], []
+    batch_urls, batch_hashes, batch_buckets, batch_shingles, batch_identities = {}, {}, {}, {}, {}
+    store_records = {}
+    column_id, table = storage_database.COLUMN_ID, storage_database.TABLE_THESES
+
+    for i, row in df.iterrows():
+        url          = row.get(storage_database.COLUMN_URL_THESE)
+        content      = row.get(COLUMN_CONTENT)
+        identity     = get_identity(url, row.get(COLUMN_TITLE), row.get(COLUMN_AUTHOR))
+        content_hash = get_content_hash(content)
+        canonical    = None
+        bands        = []
+
+        # same these page
+        if not storage_database.is_missing_value(url):
+            if url in batch_urls:
+                canonical = batch_urls[url]
+            elif check_store:
+                found = conn.execute(f"SELECT {column_id} FROM {table} WHERE {storage_database.COLUMN_URL_THESE} = ? LIMIT 1", (url,)).fetchone()
+                canonical = found[0] if found else None
+
+        # same abstract
+        if canonical is None and content_hash is not None:
+            canonical = next((candidate for candidate in batch_hashes.get(content_hash, [])
+                              if is_same_these(identity, batch_identities[candidate])), None)
+            if canonical is None and check_store:
+                candidates = [found[0] for found in conn.execute(f"SELECT {column_id} FROM {table} WHERE {storage_database.COLUMN_CONTENT_HASH} = ? "
+                                                                 f"ORDER BY {column_id}", (content_hash,)).fetchall()]
+                load_store_records(conn, candidates, store_records)
+                canonical = next((candidate for candidate in candidates
+                                  if candidate in store_records and is_same_these(identity, store_records[candidate][1])), None)
+
+        # near duplicate abstract
+        shingles = get_shingles(content)
+        if len(shingles) > 0:
+            bands = get_bands(get_minhash(shingles))
+
+        if canonical is None and len(bands) > 0:
+            best = DUPLICATE_THRESHOLD
+            for candidate in set().union(*[batch_buckets.get(band, set()) for band in bands]):
+                containment = get_containment(shingles, batch_shingles[candidate])
+                if containment >= best and is_same_these(identity, batch_identities[candidate]):
+                    canonical, best = candidate, containment
+
+            if canonical is None and check_store:
+                candidates = sorted(find_store_candidates(conn, bands))
+                load_store_records(conn, candidates, store_records)
+                for candidate in candidates:
+                    if candidate not in store_records:
+                        continue
+                    candidate_shingles, candidate_identity = store_records[candidate]
+                    containment = get_containment(shingles, candidate_shingles)
+                    if containment >= best and is_same_these(identity, candidate_identity):
+                        canonical, best = candidate, containment
+
+        if canonical is None: # new these, the next rows are compared to it
+            canonical_key = None
+            row_key       = f"row:{i}"
+            if not storage_database.is_missing_value(url):
+                batch_urls[url] = row_key
+            if content_hash is not None:
+                batch_hashes.setdefault(content_hash, []).append(row_key)
+            for band in bands:
+                batch_buckets.setdefault(band, set()).add(row_key)
+            batch_shingles[row_key]   = shingles
+            batch_identities[row_key] = identity
+        else:
+            canonical_key = canonical
+            bands         = []
+            if not storage_database.is_missing_value(url):
+                batch_urls.setdefault(url, canonical)
+
+        canonicals.append(canonical_key)
+        hashes.append(content_hash)
+        signatures.append(bands)
+
+    df[storage_database.COLUMN_CONTENT_HASH] = hashes
+    df["canonical"] = pd.Series(canonicals, index=df.index, dtype=object)
+    df["lsh_bands"] = pd.Series(signatures, index=df.index, dtype=object)
+    return df
+
+
+def insert_deduplicated(conn: sqlite3.Connection, df: pd.DataFrame)-> Tuple[pd.DataFrame, int]:
+    """Insert scraped theses in the store, only the new theses are stored, every row
+    (new these or duplicate) is linked to its url query in query_theses
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the store, in a transaction
+
+            df (pd.DataFrame):
+                the scraped theses with their url_query
+
+        Returns:
+            Tuple[pd.DataFrame, int]: the new theses with their Id and the number of duplicates
+    """
+    df = find_duplicates(conn, df)
+
+    is_new = df["canonical"].isna()
+    df_new = df[is_new].drop(columns=["canonical", "lsh_bands", storage_database.COLUMN_URL_QUERY], errors="ignore")
+    df_new = storage_database.insert_theses(conn, df_new)
+
+    # Id given to the new theses, for the duplicates of a these of the same batch
+    row_ids = {f"row:{i}": doc_id for i, doc_id in zip(df.index[is_new], df_new[storage_database.COLUMN_ID])}
+
+    bands = [(band, bucket, doc_id) for doc_id, row_bands in zip(df_new[storage_database.COLUMN_ID], df.loc[is_new, "lsh_bands"])
+             for band, bucket in row_bands]
+    conn.executemany(f"INSERT INTO {storage_database.TABLE_LSH_BUCKETS} (band, bucket, {storage_database.COLUMN_ID}) VALUES (?, ?, ?)", bands)
+
+    if storage_database.COLUMN_URL_QUERY in df.columns:
+        ids = [row_ids[f"row:{i}"] if new else row_ids.get(canonical, canonical)
+               for i, new, canonical in zip(df.index, is_new, df["canonical"])]
+        storage_database.insert_query_theses(conn, df[storage_database.COLUMN_URL_QUERY].tolist(), ids)
+        df_new[storage_database.COLUMN_URL_QUERY] = df.loc[is_new, storage_database.COLUMN_URL_QUERY].tolist()
+
+    return df_new, int((~is_new).sum())
+
+
+def append_deduplicated(df: pd.DataFrame, database_path: str = storage_database.DATABASE_PATH)-> pd.DataFrame:
+    """Append scraped theses to the store, the exact and near duplicates of theses already
+    in the store (or earlier in df) are only linked to the query instead of being stored again.
+    A store filled before the deduplication is deduplicated first
+
+        Args:
+            df (pd.DataFrame):
+                the scraped theses with their url_query
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            pd.DataFrame: the new theses with their Id, to embed
+    """
+    start = time.perf_counter()
+    with storage_database.store_lock(database_path), storage_database.open_database(database_path) as conn:
+        is_indexed = conn.execute(f"SELECT 1 FROM {storage_database.TABLE_LSH_BUCKETS} LIMIT 1").fetchone() is not None
+        is_empty   = conn.execute(f"SELECT 1 FROM {storage_database.TABLE_THESES} LIMIT 1").fetchone() is None
+
+    # store filled before the deduplication, its theses are compared to the new ones
+    if not is_indexed and not is_empty:
+        deduplicate_store(database_path)
+
+    with storage_database.store_lock(database_path), storage_database.open_database(database_path) as conn:
+        df_new, nb_duplicates = insert_deduplicated(conn, df)
+
+    print(f"deduplication : {df_new.shape[0]} new theses, {nb_duplicates} duplicates linked in {time.perf_counter() - start:.2f}s")
+    return df_new
+
+
+def deduplicate_store(database_path: str = storage_database.DATABASE_PATH, vector_store_path: str = VECTOR_STORE_PATH,
+                      bm25_index_path: str = bm25_index.BM25_INDEX_PATH, facet_index_path: str = facet_index.FACET_INDEX_PATH)-> int:
+    """Deduplicate the theses already in the store (store filled before the deduplication),
+    the theses are read in the order of their Id, the queries of a duplicate are linked to
+    the first copy, the duplicate is deleted and the LSH buckets are rebuilt. In the same
+    operation, the duplicates are removed from the vector store (nothing is embedded again)
+    and the BM25 and the facet indexes are rebuilt from the store.
+    Maintenance command : python -m scripts.maintenance dedup
+
+        Args:
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+            vector_store_path (str, optional):
+                folder of the vector store. Defaults to VECTOR_STORE_PATH.
+
+            bm25_index_path (str, optional):
+                folder of the BM25 index. Defaults to BM25_INDEX_PATH.
+
+            facet_index_path (str, optional):
+                folder of the facet index. Defaults to FACET_INDEX_PATH.
+
+        Returns:
+            int: number of duplicates found
+    """
+    column_id, table, table_links = storage_database.COLUMN_ID, storage_database.TABLE_THESES, storage_database.TABLE_QUERY_THESES
+
+    with storage_database.store_lock(database_path):
+        with storage_database.open_database(database_path) as conn:
+            df = pd.read_sql_query(f"SELECT * FROM {table} ORDER BY {column_id}", conn)
+            conn.execute(f"DELETE FROM {storage_database.TABLE_LSH_BUCKETS}")
+
+            df = find_duplicates(conn, df, check_store=False)
+            row_ids = {f"row:{i}": doc_id for i, doc_id in enumerate(df[column_id].tolist())}
+            is_new  = df["canonical"].isna()
+
+            conn.executemany(f"UPDATE {table} SET {storage_database.COLUMN_CONTENT_HASH} = ? WHERE {column_id} = ?",
+                             zip(df.loc[is_new, storage_database.COLUMN_CONTENT_HASH], df.loc[is_new, column_id].tolist()))
+            conn.executemany(f"INSERT INTO {storage_database.TABLE_LSH_BUCKETS} (band, bucket, {column_id}) VALUES (?, ?, ?)",
+                             [(band, bucket, doc_id) for doc_id, row_bands in zip(df.loc[is_new, column_id].tolist(), df.loc[is_new, "lsh_bands"])
+                              for band, bucket in row_bands])
+
+            # the queries of a duplicate are moved to the original these, the duplicate is deleted
+            duplicates = [(row_ids.get(canonical, canonical), doc_id) for canonical, doc_id in
+                          zip(df.loc[~is_new, "canonical"], df.loc[~is_new, column_id].tolist())]
+            conn.executemany(f"UPDATE OR IGNORE {table_links} SET {column_id} = ? WHERE {column_id} = ?", duplicates)
+            conn.executemany(f"DELETE FROM {table_links} WHERE {column_id} = ?", [(doc_id,) for _, doc_id in duplicates])
+            conn.executemany(f"DELETE FROM {table} WHERE {column_id} = ?", [(doc_id,) for _, doc_id in duplicates])
+
+        # the deleted theses are not searchable anymore, still under the lock of the store
+        if len(duplicates) > 0:
+            get_vector_store.remove_from_vector_store(vector_store_path, [doc_id for _, doc_id in duplicates])
+            df_store = storage_database.load_all_theses(database_path)
+            bm25_index.update_bm25_index(df_store, bm25_index_path, rebuild=True)
+            facet_index.update_facet_index(df_store, facet_index_path, rebuild=True)
+
+    nb_duplicates = len(duplicates)
+    print(f"deduplication : {nb_duplicates} duplicates merged in the store and removed from the indexes")
+    return nb_duplicates
@@ -0,0 +1,279 @@
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, List
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+import configparser
+
+# Read config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+DRIVER_PATH_GOOGLE   = config["DRIVER"]["DRIVER_PATH_GOOGLE"]
+POOL_SIZE            = config["DRIVER"].getint("POOL_SIZE")
+MAX_PAGES_PER_DRIVER = config["DRIVER"].getint("MAX_PAGES_PER_DRIVER")
+
+# seconds a worker waits for a driver before checking again if one can be created
+ACQUIRE_POLL         = 1.0
+
+# python functions
+
+def create_chrome_driver()-> webdriver.Chrome:
+    """Start a headless Chrome
+
+        Returns:
+            webdriver.Chrome: the driver
+    """
+    options = Options()
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--headless")
+    return webdriver.Chrome(service=Service(DRIVER_PATH_GOOGLE), options=options)
+
+
+def is_healthy(driver)-> bool:
+    """Check that the browser of a driver still answers"""
+    try:
+        driver.execute_script("return 1")
+        return True
+    except Exception:
+        return False
+
+
+class DriverPool:
+    """
+        Pool of headless Chrome drivers shared by the scrapers of the process : the
+        browsers are started once and reused across requests instead of a new browser
+        for each search. A driver is checked before being lent, and replaced after
+        max_pages pages or if it fails. map() spreads a list of pages over the drivers
+        of the pool through a work queue.
+
+        Example:
+        --------
+            >>> pool = get_driver_pool()
+            >>> with pool.driver() as driver:
+            >>>     driver.get(url_query)
+            >>> records = pool.map(get_metadata_theses, list_url_these)
+    """
+
+    def __init__(self, size: int = POOL_SIZE, max_pages: int = MAX_PAGES_PER_DRIVER, create_driver: Callable = create_chrome_driver):
+
+        if not isinstance(size, int) or size < 1:
+            raise TypeError(f"wrong type, size should be a positive int, found : {size}")
+
+        self.size          = size
+        self.max_pages     = max_pages
+        self.create_driver = create_driver
+
+        # last released driver lent first, the least used ones are recycled less often
+        self._idle       = queue.LifoQueue()
+        self._pages      = {}
+        self._nb_drivers = 0
+        self._lock       = threading.Lock()
+        self._stats      = {"started": 0, "recycled": 0, "unhealthy": 0, "pages": 0, "start_seconds": 0.0}
+
+    def _start_driver(self):
+        start  = time.perf_counter()
+        driver = self.create_driver()
+        with self._lock:
+            self._pages[id(driver)] = 0
+            self._stats["started"] += 1
+            self._stats["start_seconds"] += time.perf_counter() - start
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._pages.pop(id(driver), None)
+            self._nb_drivers -= 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _acquire(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_start = self._nb_drivers < self.size
+                    if can_start:
+                        self._nb_drivers += 1
+
+                if can_start:
+                    try:
+                        return self._start_driver()
+                    except Exception:
+                        with self._lock:
+                            self._nb_drivers -= 1
+                        raise
+
+                try: # every driver is lent, wait for one to come back
+                    driver = self._idle.get(timeout=ACQUIRE_POLL)
+                except queue.Empty:
+                    continue
+
+            if is_healthy(driver):
+                return driver
+
+            print("driver pool : unhealthy driver replaced")
+            with self._lock:
+                self._stats["unhealthy"] += 1
+            self._discard(driver)
+
+    def _release(self, driver, broken: bool = False):
+        with self._lock:
+            self._pages[id(driver)] = self._pages.get(id(driver), 0) + 1
+            self._stats["pages"] += 1
+            worn_out = self._pages[id(driver)] >= self.max_pages
+            if broken or worn_out:
+                self._stats["recycled"] += 1
+
+        if broken or worn_out:
+            self._discard(driver)
+        else:
+            self._idle.put(driver)
+
+    @contextmanager
+    def driver(self):
+        """Borrow a driver of the pool for one page, it goes back to the pool
+        when leaving the context, or is replaced if the browser failed
+
+            Yields:
+                webdriver.Chrome: the driver
+        """
+        driver = self._acquire()
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self._release(driver, broken)
+
+    def map(self, func: Callable[[Any, Any], Any], items: List[Any], max_retries: int = 1)-> List[Any]:
+        """Apply func(item, driver) to every item with the drivers of the pool, the items
+        are taken from a work queue by one worker per driver
+
+            Args:
+                func (Callable[[Any, Any], Any]):
+                    the scraper of one page, ex : get_metadata_theses(url_these, driver)
+
+                items (List[Any]):
+                    the pages to scrape
+
+                max_retries (int, optional):
+                    new attempts on another driver if the browser fails. Defaults to 1.
+
+            Returns:
+                List[Any]: the result of each item in the order of items, None for the failed ones
+                (browser failures are retried, other errors of func are logged and not retried)
+
+            Raise:
+            ------
+                - if items is not a list
+        """
+        if not isinstance(items, list):
+            raise TypeError(f"wrong type, items should be list, found : {type(items).__name__}")
+
+        results = [None] * len(items)
+        work    = queue.Queue()
+        for i, item in enumerate(items):
+            work.put((i, item))
+
+        def worker():
+            while True:
+                try:
+                    i, item = work.get_nowait()
+                except queue.Empty:
+                    return
+
+                for attempt in range(max_retries + 1):
+                    try:
+                        with self.driver() as driver:
+                            results[i] = func(item, driver)
+                        break
+                    except WebDriverException as error:
+                        if attempt == max_retries:
+                            print(f"driver pool : {item} failed, {type(error).__name__}")
+                    except Exception as error: # not a browser failure, the item is skipped and the worker goes on
+                        print(f"driver pool : {item} failed, {type(error).__name__} : {error}")
+                        break
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.size, len(items)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def warm_up(self):
+        """Start the drivers of the pool at once before the first request"""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(self._acquire) for _ in range(self.size)]
+            drivers = [future.result() for future in futures if future.exception() is None]
+
+        for driver in drivers:
+            self._idle.put(driver)
+        print(f"driver pool : {len(drivers)} drivers ready")
+
+    def close(self):
+        """Quit the idle drivers"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self)-> dict:
+        """Drivers started, recycled after max_pages or a failure, replaced after
+        a failed health check, pages served and mean start time of a browser
+
+            Returns:
+                dict: the counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["drivers"] = self._nb_drivers
+            stats["idle"]    = self._idle.qsize()
+        stats["mean_start_seconds"] = stats.pop("start_seconds") / max(stats["started"], 1)
+        return stats
+
+
+# pool of the process, started at the first scraping
+_POOL      = None
+_POOL_LOCK = threading.Lock()
+
+def get_driver_pool()-> DriverPool:
+    """Get the driver pool of the process, its drivers are quit when the process exits
+
+        Returns:
+            DriverPool: the shared pool
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = DriverPool()
+            atexit.register(_POOL.close)
+        return _POOL
+
+
+def warm_up_in_background():
+    """Start the drivers of the pool in a thread, the app answers meanwhile"""
+    def warm_up():
+        try:
+            get_driver_pool().warm_up()
+        except Exception as error:
+            print(f"driver pool : warm up failed, {type(error).__name__} : {error}")
+
+    threading.Thread(target=warm_up, daemon=True).start()
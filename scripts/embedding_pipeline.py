@@ -0,0 +1,182 @@
+import time
+import atexit
+import threading
+from typing import Iterator, List, Tuple
+import numpy as np
+import configparser
+import scripts.job_queue as job_queue
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+BATCH_SIZE  = config["EMBEDDING"].getint("BATCH_SIZE")
+NUM_WORKERS = config["EMBEDDING"].getint("NUM_WORKERS")
+NUM_THREADS = config["EMBEDDING"].getint("NUM_THREADS")
+
+# python functions
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """
+        LangChain embeddings over a SentenceTransformer created by the caller : the same
+        model embeds the queries of the vector store and the batches of embed_batches.
+        The vectors are the ones of HuggingFaceEmbeddings (new lines replaced by spaces,
+        not normalized by default)
+
+        Example:
+        --------
+            >>> model      = SentenceTransformer("all-MiniLM-L6-v2")
+            >>> embeddings = SentenceTransformerEmbeddings(model, "all-MiniLM-L6-v2")
+            >>> embeddings.embed_query("machine learning")
+            >>> embed_batches(texts, embeddings.model)
+    """
+
+    def __init__(self, model: SentenceTransformer, model_name: str, normalize_embeddings: bool = False):
+
+        if not isinstance(model, SentenceTransformer):
+            raise TypeError(f"wrong type object, expected SentenceTransformer, got : {type(model).__name__}")
+
+        self.model                = model
+        self.model_name           = model_name
+        self.normalize_embeddings = normalize_embeddings
+
+    def embed_documents(self, texts: List[str])-> List[List[float]]:
+        """Embed a list of texts"""
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.model.encode(texts, normalize_embeddings=self.normalize_embeddings).tolist()
+
+    def embed_query(self, text: str)-> List[float]:
+        """Embed a query"""
+        return self.embed_documents([text])[0]
+
+
+def print_throughput(nb_done: int, nb_total: int, start: float):
+    """Print the progress of the embedding, docs/sec and remaining time, and report
+    it to the ingestion job of the process
+
+        Args:
+            nb_done (int):
+                number of documents embedded
+
+            nb_total (int):
+                number of documents to embed
+
+            start (float):
+                time.perf_counter() when the embedding started
+    """
+    elapsed    = time.perf_counter() - start
+    throughput = nb_done / elapsed if elapsed > 0 else 0.0
+    eta        = (nb_total - nb_done) / throughput if throughput > 0 else 0.0
+    print(f"embedding : {nb_done}/{nb_total} docs, {throughput:.1f} docs/sec, eta {eta:.0f}s")
+    job_queue.report_progress("embedding", nb_done, nb_total)
+
+
+# multi-process pools of the process, one per model and number of workers : started by the first
+# embedding that needs one, reused by the next ingests, stopped when the process exits
+_POOLS      = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_multi_process_pool(model: SentenceTransformer, num_workers: int)-> Tuple[dict, threading.Lock]:
+    """Get the multi-process pool of the process for a model, it is created at the first call
+
+        Args:
+            model (SentenceTransformer):
+                the embedding model, loaded once in each process of the pool
+
+            num_workers (int):
+                number of processes of the pool
+
+        Returns:
+            Tuple[dict, threading.Lock]: the pool, and the lock held while a batch is on the pool
+    """
+    key = (id(model), num_workers)
+
+    with _POOLS_LOCK:
+        if key not in _POOLS:
+            pool = model.start_multi_process_pool(["cpu"] * num_workers)
+            # the model is kept with its pool so that its id can't be reused by another model
+            _POOLS[key] = (model, pool, threading.Lock())
+            atexit.register(model.stop_multi_process_pool, pool)
+        _, pool, pool_lock = _POOLS[key]
+        return pool, pool_lock
+
+
+def embed_batches(texts: List[str],
+                  model: SentenceTransformer,
+                  batch_size: int = BATCH_SIZE,
+                  num_workers: int = NUM_WORKERS,
+                  num_threads: int = NUM_THREADS,
+                  normalize_embeddings: bool = False)-> Iterator[Tuple[int, np.ndarray]]:
+    """
+        Embed the texts batch by batch, each batch is yielded as soon as it is embedded
+        so that it can be added to the index without keeping every vector in memory.
+        With num_workers > 1 and more than batch_size texts, each batch is spread on the pool of
+        processes of get_multi_process_pool (one model per process, started once per process),
+        otherwise the model runs in the current process on num_threads torch threads.
+        The throughput is printed after each batch
+
+        Args:
+            texts (List[str]):
+                the texts to embed
+
+            model (SentenceTransformer):
+                the embedding model, ex : the model of SentenceTransformerEmbeddings
+
+            batch_size (int, optional):
+                number of texts embedded at once by a process. Defaults to BATCH_SIZE.
+
+            num_workers (int, optional):
+                number of processes, 1 to embed in the current process. Defaults to NUM_WORKERS.
+
+            num_threads (int, optional):
+                number of torch threads in the current process, 0 keeps the torch default. Defaults to NUM_THREADS.
+
+            normalize_embeddings (bool, optional):
+                normalize the vectors to unit length. Defaults to False.
+
+        Yields:
+            Tuple[int, np.ndarray]: position of the first text of the batch and the float32 vectors of the batch
+
+        Raise:
+        ------
+            - if model is not SentenceTransformer
+            - if batch_size is not a positive int
+    """
+    if not isinstance(model, SentenceTransformer):
+        raise TypeError(f"wrong type object, expected SentenceTransformer, got : {type(model).__name__}")
+
+    if not isinstance(batch_size, int) or batch_size <= 0:
+        raise TypeError(f"batch_size should be a positive int, recieved : {batch_size}")
+
+    # same preprocessing as SentenceTransformerEmbeddings.embed_documents
+    texts = [text.replace("\n", " ") for text in texts]
+    pool  = None
+
+    # a single batch is not worth the round trip to the processes
+    if num_workers > 1 and len(texts) > batch_size:
+        pool, pool_lock = get_multi_process_pool(model, num_workers)
+        # each process gets a full batch
+        batch_size_pool = batch_size * num_workers
+    else:
+        batch_size_pool = batch_size
+        if num_threads > 0:
+            import torch
+            torch.set_num_threads(num_threads)
+
+    start = time.perf_counter()
+    for batch_start in range(0, len(texts), batch_size_pool):
+        batch = texts[batch_start:batch_start + batch_size_pool]
+
+        if pool is not None:
+            # the queues of the pool are shared, one batch at a time
+            with pool_lock:
+                vectors = model.encode_multi_process(batch, pool, batch_size=batch_size, chunk_size=batch_size,
+                                                     normalize_embeddings=normalize_embeddings)
+        else:
+            vectors = model.encode(batch, batch_size=batch_size, normalize_embeddings=normalize_embeddings)
+
+        print_throughput(batch_start + len(batch), len(texts), start)
+        yield batch_start, np.asarray(vectors, dtype=np.float32)
@@ -0,0 +1,363 @@
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+import configparser
+import sys
+sys.path.append('..')
+import scripts.storage_database as storage_database
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+FACET_INDEX_PATH = config["DEFAULT"]["FACET_INDEX_PATH"]
+
+# file of the index in FACET_INDEX_PATH : sorted Id arrays of each value of each facet
+INDEX_FILE       = "facet_index.npz"
+# facet -> column of the store
+FACETS           = {"discipline"   : "Discipline(s)",
+                    "etablissement": "Etablissement(s)",
+                    "direction"    : "Direction",
+                    "year"         : "Date"}
+YEAR_PATTERN     = re.compile(r"Soutenance.*?(\d{4})")
+RANGE_PATTERN    = re.compile(r"^\s*(\d{4})\s*-\s*(\d{4})\s*$")
+
+
+def get_facet_values(facet: str, value: str)-> List[str]:
+    """Values of a facet for one cell of the store : the directors are split,
+    the year is the defense year of the Date column
+
+        Args:
+            facet (str):
+                discipline, etablissement, direction or year
+
+            value (str):
+                the cell of the store
+
+        Returns:
+            List[str]: the values, empty for a missing value or a these not defended yet
+
+        Example:
+        --------
+            >>> get_facet_values("direction", "  Pierre Aimar, Patrice Bacchin")
+            ['Pierre Aimar', 'Patrice Bacchin']
+            >>> get_facet_values("year", "  Soutenance le 03/11/2016")
+            ['2016']
+    """
+    if not isinstance(value, str) or value.strip() in ["", storage_database.MISSING_VALUE, "Missing Value"]:
+        return []
+
+    if facet == "year":
+        year = YEAR_PATTERN.search(value)
+        return [year.group(1)] if year else []
+
+    if facet == "direction":
+        return [name.strip() for name in value.split(",") if name.strip()]
+
+    return [value.strip()]
+
+
+def sort_counts(facet: str, counts: Dict[str, int])-> List[Tuple[str, int]]:
+    """(value, count) of a facet, the most frequent first, the years in order"""
+    if facet == "year":
+        return sorted(counts.items())
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def count_facets(df: pd.DataFrame)-> Dict[str, List[Tuple[str, int]]]:
+    """Number of theses of each value of each facet in a result set, counted on the
+    facet columns of its own rows : the cost is the size of the result set, not the
+    number of values in the store
+
+        Args:
+            df (pd.DataFrame):
+                the theses of the result set
+
+        Returns:
+            Dict[str, List[Tuple[str, int]]]: (value, count) of each facet, the most frequent
+            first, the years in order
+
+        Raise:
+        ------
+            - if df is not a DataFrame
+    """
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError(f"wrong type, df should be pd.DataFrame, found : {type(df).__name__}")
+
+    df     = df.drop_duplicates(subset=storage_database.COLUMN_ID) if storage_database.COLUMN_ID in df.columns else df
+    counts = {}
+    for facet, column in FACETS.items():
+        values = df[column].tolist() if column in df.columns else []
+        # a director named twice in the same cell counts the these once
+        counts[facet] = sort_counts(facet, Counter(facet_value for value in values for facet_value in set(get_facet_values(facet, value))))
+    return counts
+
+
+def parse_filters(args)-> Dict[str, List[str]]:
+    """Facet filters of a request, a facet can be given several times
+
+        Args:
+            args (MultiDict):
+                request.form or request.args
+
+        Returns:
+            Dict[str, List[str]]: the values of each facet given, the empty ones are skipped
+    """
+    filters = {}
+    for facet in FACETS:
+        values = [value.strip() for value in args.getlist(facet) if value and value.strip()]
+        if len(values) > 0:
+            filters[facet] = values
+    return filters
+
+
+class FacetIndex:
+    """
+        Index of the metadata of the store used as filters : for each facet (discipline,
+        etablissement, direction, defense year) and each of its values, the sorted array
+        of the Id of the theses. A filter is resolved by unions and intersections of
+        these arrays, the store is never scanned, and the Id found restrict the vector
+        and BM25 search before scoring.
+
+        Example:
+        --------
+            >>> index = FacetIndex.load("./static/facet_index")
+            >>> index.get_ids({"discipline": ["Chimie"], "year": ["2010-2015"]})
+            array([3, 17, 42])
+    """
+
+    def __init__(self):
+
+        # facet -> value -> sorted Id
+        self.postings    = {facet: {} for facet in FACETS}
+        self.indexed_ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return self.indexed_ids.shape[0]
+
+    def add(self, df: pd.DataFrame)-> int:
+        """Index the theses not indexed yet
+
+            Args:
+                df (pd.DataFrame):
+                    theses of the store with their Id
+
+            Returns:
+                int: number of theses added
+        """
+        df_new = df[~df[storage_database.COLUMN_ID].isin(self.indexed_ids)].drop_duplicates(subset=storage_database.COLUMN_ID)
+        if df_new.shape[0] == 0:
+            return 0
+
+        for facet, column in FACETS.items():
+            if column not in df_new.columns:
+                continue
+
+            new_postings = {}
+            for doc_id, value in zip(df_new[storage_database.COLUMN_ID].tolist(), df_new[column].tolist()):
+                for facet_value in get_facet_values(facet, value):
+                    new_postings.setdefault(facet_value, []).append(doc_id)
+
+            for facet_value, ids in new_postings.items():
+                ids = np.array(ids, dtype=np.int64)
+                if facet_value in self.postings[facet]:
+                    ids = np.concatenate([self.postings[facet][facet_value], ids])
+                self.postings[facet][facet_value] = np.unique(ids)
+
+        self.indexed_ids = np.union1d(self.indexed_ids, df_new[storage_database.COLUMN_ID].to_numpy(dtype=np.int64))
+
+        return df_new.shape[0]
+
+    def get_value_ids(self, facet: str, value: str)-> np.ndarray:
+        """Id of the theses of one value of a facet, a year can be a range 2010-2015
+
+            Returns:
+                np.ndarray: the sorted Id
+        """
+        postings = self.postings[facet]
+        year_range = RANGE_PATTERN.match(value) if facet == "year" else None
+
+        if year_range:
+            first, last = year_range.groups()
+            arrays = [ids for year, ids in postings.items() if first <= year <= last]
+            return np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+
+        if value in postings:
+            return postings[value]
+
+        # values typed in the API, the case and the accents of the store may differ
+        for facet_value, ids in postings.items():
+            if facet_value.casefold() == value.casefold():
+                return ids
+        return np.empty(0, dtype=np.int64)
+
+    def get_ids(self, filters: Dict[str, List[str]])-> np.ndarray:
+        """Id of the theses matching the filters, values of a facet are combined with OR,
+        facets are combined with AND
+
+            Args:
+                filters (Dict[str, List[str]]):
+                    values of each facet
+
+            Returns:
+                np.ndarray: the sorted Id
+
+            Raise:
+            ------
+                - if a facet is unknown
+        """
+        ids = None
+        for facet, values in filters.items():
+            if facet not in FACETS:
+                raise TypeError(f"unknown facet {facet}, expected one of : {list(FACETS.keys())}")
+
+            if isinstance(values, str):
+                values = [values]
+
+            facet_ids = np.unique(np.concatenate([self.get_value_ids(facet, value) for value in values] + [np.empty(0, dtype=np.int64)]))
+            ids = facet_ids if ids is None else np.intersect1d(ids, facet_ids, assume_unique=True)
+
+        return self.indexed_ids if ids is None else ids
+
+    def save(self, facet_index_path: str = FACET_INDEX_PATH):
+        """Write the index in facet_index_path, the file is replaced at once
+
+            Args:
+                facet_index_path (str, optional):
+                    folder of the index. Defaults to FACET_INDEX_PATH.
+        """
+        if not os.path.exists(facet_index_path):
+            os.makedirs(facet_index_path)
+
+        arrays = {"indexed_ids": self.indexed_ids}
+        for facet, postings in self.postings.items():
+            values = sorted(postings.keys())
+            arrays[f"{facet}_values"]   = np.array(values, dtype=str)
+            arrays[f"{facet}_pointers"] = np.cumsum([0] + [postings[value].shape[0] for value in values]).astype(np.int64)
+            arrays[f"{facet}_ids"]      = np.concatenate([postings[value] for value in values] + [np.empty(0, dtype=np.int64)])
+
+        index_file = os.path.join(facet_index_path, INDEX_FILE)
+        temp_file  = index_file + ".tmp.npz"
+        np.savez(temp_file, **arrays)
+        os.replace(temp_file, index_file)
+
+    @classmethod
+    def load(cls, facet_index_path: str = FACET_INDEX_PATH)-> "FacetIndex":
+        """Load the index of facet_index_path, an empty index if it doesn't exist yet
+
+            Args:
+                facet_index_path (str, optional):
+                    folder of the index. Defaults to FACET_INDEX_PATH.
+
+            Returns:
+                FacetIndex: the index
+        """
+        index      = cls()
+        index_file = os.path.join(facet_index_path, INDEX_FILE)
+
+        if not os.path.exists(index_file):
+            return index
+
+        with np.load(index_file, allow_pickle=False) as data:
+            index.indexed_ids = data["indexed_ids"]
+            for facet in FACETS:
+                values, pointers, ids = data[f"{facet}_values"].tolist(), data[f"{facet}_pointers"], data[f"{facet}_ids"]
+                index.postings[facet] = {value: ids[pointers[i]:pointers[i + 1]] for i, value in enumerate(values)}
+
+        return index
+
+
+def update_facet_index(df: pd.DataFrame, facet_index_path: str = FACET_INDEX_PATH, rebuild: bool = False)-> FacetIndex:
+    """Add the theses not indexed yet to the facet index, the index is built from the
+    whole store if it doesn't exist yet
+
+        Args:
+            df (pd.DataFrame):
+                theses of the store with their Id
+
+            facet_index_path (str, optional):
+                folder of the index. Defaults to FACET_INDEX_PATH.
+
+            rebuild (bool, optional):
+                index df from scratch. Defaults to False.
+
+        Returns:
+            FacetIndex: the updated index
+
+        Raise:
+        ------
+            - if df is not a DataFrame with an Id column
+    """
+    if not isinstance(df, pd.DataFrame) or storage_database.COLUMN_ID not in df.columns:
+        raise TypeError(f"df should be a pd.DataFrame of the store with its '{storage_database.COLUMN_ID}' column, found : {type(df).__name__}")
+
+    if rebuild:
+        index = FacetIndex()
+    else:
+        index = FacetIndex.load(facet_index_path)
+        if len(index) == 0:
+            df = storage_database.load_all_theses()
+
+    nb_added = index.add(df)
+    if nb_added > 0 or rebuild:
+        index.save(facet_index_path)
+    print(f"facet index : {nb_added} theses added, {len(index)} theses")
+
+    return index
+
+
+# index of the process, reloaded when the file changes on disk
+_INDEXES      = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_facet_index(facet_index_path: str = FACET_INDEX_PATH)-> FacetIndex:
+    """Get the facet index of the process, loaded at the first call and reloaded
+    when its file is updated
+
+        Args:
+            facet_index_path (str, optional):
+                folder of the index. Defaults to FACET_INDEX_PATH.
+
+        Returns:
+            FacetIndex: the shared index
+    """
+    index_file = os.path.join(facet_index_path, INDEX_FILE)
+    version    = os.path.getmtime(index_file) if os.path.exists(index_file) else None
+    key        = os.path.abspath(facet_index_path)
+
+    with _INDEXES_LOCK:
+        if key not in _INDEXES or _INDEXES[key][1] != version:
+            if version is None:
+                print("facet index missing, run : python -m scripts.maintenance rebuild")
+            _INDEXES[key] = (FacetIndex.load(facet_index_path), version)
+        return _INDEXES[key][0]
+
+
+def filter_ids(filters: Dict[str, List[str]], ids: List[int] = None, facet_index_path: str = FACET_INDEX_PATH)-> List[int]:
+    """Id of the theses matching the filters, among the given Id
+
+        Args:
+            filters (Dict[str, List[str]]):
+                values of each facet, see FacetIndex.get_ids
+
+            ids (List[int], optional):
+                Id of the candidate theses. Defaults to None, every these.
+
+            facet_index_path (str, optional):
+                folder of the index. Defaults to FACET_INDEX_PATH.
+
+        Returns:
+            List[int]: the Id, in the order of ids if given
+    """
+    facet_ids = get_facet_index(facet_index_path).get_ids(filters)
+
+    if ids is None:
+        return facet_ids.tolist()
+
+    keep = np.isin(np.array(ids, dtype=np.int64), facet_ids)
+    return [doc_id for doc_id, kept in zip(ids, keep.tolist()) if kept]
@@ -1,8 +1,11 @@
 import pandas as pd
-import requests
+from typing import Dict, Optional
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 import scripts.check_utilities as check_utilities
+import scripts.async_fetcher as async_fetcher
+import scripts.http_cache as http_cache
+import scripts.storage_database as storage_database
 import configparser
 import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -17,56 +20,67 @@ TYPE_TAG_RESUME_THESE_BS   = config["BEAUTIFUL_SOUP"]["TYPE_TAG_RESUME_THESE_BS"
 TAG_METADATA_THESE_BS      = config["BEAUTIFUL_SOUP"]["TAG_METADATA_THESE_BS"]
 TYPE_TAG_METADATA_THESE_BS = config["BEAUTIFUL_SOUP"]["TYPE_TAG_METADATA_THESE_BS"]
 
-def get_metadata_theses_bs(url_these: str):
+def parse_metadata_theses_bs(html: str, url_these: str)-> Optional[Dict[str, str]]:
     """
-        get the title of a these given its url
+        extract the title, the resume and the metadata of a these from its html page
 
         Args:
+            html (str):
+                the html of the these page
+                
             url_these (str):
                 the url thses
-                
-            driver_path (str): 
-                path to the google driver 
-                
-            options (str):
-                options for the google driver
 
         Returns:
-            pd.Dataframe: 
-                ddataframe of metadata and associated value
-                
-        Raise:
-        -------
-            - check_utilities.check_correct_url(url_these) : if the url is in the correct format
+            Dict[str, str]: 
+                record of the these : metadata name and associated value
     """
-    check_utilities.check_correct_url(url_these) # url check
-    
-    response = requests.get(url_these)
-    #soup     = BeautifulSoup(response.text, 'html.parser')
-    soup     = BeautifulSoup(response.text, 'lxml')
+    soup     = BeautifulSoup(html, 'lxml')
 
     if soup:  # Check if the soup object is not None
         # Find the title element, check if it's found, and extract text if present
         title_element = soup.find(TYPE_TAG_TITLE_THESE_BS, {TAG_TITLE_THESE_BS: True})
-        title = title_element.text if title_element else "Missing value"
+        title = title_element.text if title_element else storage_database.MISSING_VALUE
         
         # Find the resume element, check if it's found, and extract text if present
         resume_element = soup.find(TYPE_TAG_RESUME_THESE_BS, {TAG_RESUME_THESE_BS: True})
-        resume = resume_element.text if resume_element else "Missing value"
+        resume = resume_element.text if resume_element else storage_database.MISSING_VALUE
         
         # other metadata
         dict_infos = {}
         for i in soup.find_all(TYPE_TAG_METADATA_THESE_BS, {TAG_METADATA_THESE_BS: True}):
-            infos = i.text.split(":") if i else "Missing value"
+            infos = i.text.split(":") if i else storage_database.MISSING_VALUE
             dict_infos[infos[0].replace("\xa0", "")] = infos[-1].replace("\xa0", "")
         
         dict_infos["title"] = title
         dict_infos["content"] = resume
         dict_infos["url_these"] = url_these
         
-        return pd.DataFrame([dict_infos])
+        return dict_infos
     
     return None
+
+def get_metadata_theses_bs(url_these: str)-> Optional[Dict[str, str]]:
+    """
+        get the title of a these given its url, the page is read through the http cache
+
+        Args:
+            url_these (str):
+                the url thses
+
+        Returns:
+            Dict[str, str]: 
+                record of the these : metadata name and associated value
+                
+        Raise:
+        -------
+            - check_utilities.check_correct_url(url_these) : if the url is in the correct format
+    """
+    check_utilities.check_correct_url(url_these) # url check
+    
+    html = http_cache.fetch(url_these)
+    
+    return parse_metadata_theses_bs(html, url_these)
     
 def get_all_metadata_theses_bs(list_url_these: list):
     """
@@ -94,14 +108,15 @@ def get_all_metadata_theses_bs(list_url_these: list):
     if not isinstance(list_url_these, list):
         raise TypeError(f"The inut must be a list of url link, recieved : {type(list_url_these).__name__}")
     
-    metadata = pd.DataFrame()
+    # one record per these, the dataframe is built once at the end
+    records = []
     for url in tqdm.tqdm(list_url_these):  
         metadata_aux = get_metadata_theses_bs(url)
                 
         if metadata_aux is not None:
-            metadata = pd.concat([metadata, metadata_aux])
+            records.append(metadata_aux)
         
-    return metadata.reset_index(drop=True)
+    return pd.DataFrame.from_records(records)
 
 def get_all_metadata_theses_bs_parallelized(list_url_these: list):
     """
@@ -129,8 +144,8 @@ def get_all_metadata_theses_bs_parallelized(list_url_these: list):
     if not isinstance(list_url_these, list):
         raise TypeError(f"The inut must be a list of url link, recieved : {type(list_url_these).__name__}")
     
-    metadata = pd.DataFrame()
-    
+    # one record per these, the dataframe is built once at the end
+    records = []
     
     # parallelize metadata extraction
     with ThreadPoolExecutor(max_workers=50) as executor:
@@ -138,9 +153,51 @@ def get_all_metadata_theses_bs_parallelized(list_url_these: list):
         print("futures")
         for future in tqdm.tqdm(as_completed(futures)):
             if future.result() is not None:
-                metadata = pd.concat([metadata, future.result()])
+                records.append(future.result())
         
-    return metadata.reset_index(drop=True)
-    
+    return pd.DataFrame.from_records(records)
 
 
+def get_all_metadata_theses_bs_async(list_url_these: list, max_per_host: int = async_fetcher.MAX_PER_HOST, use_cache: bool = True):
+    """
+        get metadata of theses given a list of url, the pages are fetched by the asyncio
+        fetcher (one pooled session, keep alive, at most max_per_host requests at once
+        on theses.fr, timeouts and retries) then parsed
+
+        Args:
+            list_url_these (List(str)):
+                the url thses list
+                
+            max_per_host (int, optional):
+                requests sent at once to the same host. Defaults to MAX_PER_HOST.
+                
+            use_cache (bool, optional):
+                False to download every page instead of reading the http cache. Defaults to True.
+
+        Returns:
+            pd.DataFrame: 
+                dataframe of metadata which each line correspond to a these, the pages
+                that could not be fetched are skipped
+                
+        Example:
+        --------
+            >>> get_all_metadata_theses_bs_async([url_1, url_2, url_3])
+            >>> pd.DataFrame()
+            
+        Raise:
+        ------
+            - if the input is not a list
+            
+    """
+    
+    if not isinstance(list_url_these, list):
+        raise TypeError(f"The inut must be a list of url link, recieved : {type(list_url_these).__name__}")
+    
+    for url in list_url_these:
+        check_utilities.check_correct_url(url) # url check
+    
+    pages = async_fetcher.fetch_pages(list_url_these, max_per_host=max_per_host, use_cache=use_cache)
+    
+    records = [parse_metadata_theses_bs(html, url) for url, html in pages.items() if html is not None]
+    
+    return pd.DataFrame.from_records([record for record in records if record is not None])
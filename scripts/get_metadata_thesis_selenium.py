@@ -1,19 +1,11 @@
 import pandas as pd
+from typing import Dict, Optional
+from bs4 import BeautifulSoup
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
 import scripts.check_utilities as check_utilities
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from selenium.webdriver.chrome.options import Options
-import configparser
-import tqdm
-
-# Read config.ini
-config = configparser.ConfigParser()
-config.read('./scripts/config.ini')
-
-# import config var
-DRIVER_PATH_GOOGLE = config["DRIVER"]["DRIVER_PATH_GOOGLE"]
+import scripts.driver_pool as driver_pool
+import scripts.http_cache as http_cache
+import scripts.storage_database as storage_database
 
 # TAG name for metadata extraction
 TAG_PARENT_THESE_TITLE     = 'div[data-v-d290f8ce]'
@@ -23,163 +15,110 @@ TAG_RESUME                 = "p[data-v-35e8592d]"
 TAG_PARENT_METADATA        = "div[data-v-c8bc896e]"
 TAG_METADATA               = "tr[data-v-276fb210]"
 
-# init chrome driver
-driver_path = Service(DRIVER_PATH_GOOGLE)
+# python functiond
 
-options = Options()
-options.add_argument("--disable-extensions")
-options.add_argument("--disable-gpu")
-options.add_argument("--no-sandbox")
-options.add_argument("--headless")
+def get_metadata_dict(soup: BeautifulSoup)-> Dict[str, str]:
+    """Gather thesis metadata by reading metadata_tag
 
-# python functiond
+    Args:
+        soup (BeautifulSoup): the page rendered by the browser
 
-def get_list_tag_metadata(driver: Service, parent_tag: str, child_tag: str):
+    Returns:
+        Dict[str, str]: metadata name and associated value, empty if the metadata are not found
     """
-        get the parent div which contain sub div with relevant info
+    dict_metadata = {}
+    
+    parent_elem = soup.select_one(TAG_PARENT_METADATA)
+    elements    = parent_elem.select(TAG_METADATA) if parent_elem is not None else []
+    
+    for element in elements:
+        element_splited = element.get_text(" ", strip=True).split(":")
+        if len(element_splited) < 2:
+            print("no metadata")
+            continue
+        tag                  = element_splited[0].strip()
+        name                 = element_splited[1]
+        dict_metadata[tag]   = name
+            
+    return dict_metadata
 
-        Args:
-            driver (str): 
-                the google driver to the web site
-                
-            parent_tag (str):
-                name of the parent div tag : div[name_div_class]
-                
-            child_tag (str):
-                name of the tag we want to extract info : type_object[name_tag]
 
-        Returns:
-            selenium object: 
-                list of info for all the child_tag in parent_tag
-                
-        Raise:
-        -------
-            - check if something has been extract
-            - error du to bad internet connection
- 
-    """
-    try:
-        parent_elem = driver.find_element(By.CSS_SELECTOR, parent_tag)
-        child_elem = parent_elem.find_elements(By.CSS_SELECTOR, child_tag)
-        return child_elem
-    except:
-        print(f"{parent_tag} not found")
-        return None
+def get_rendered_text(soup: BeautifulSoup, parent_tag: str, child_tag: str)-> Optional[str]:
+    """Text of the first child_tag in parent_tag of the rendered page, None if not found"""
+    parent_elem = soup.select_one(parent_tag)
+    child_elem  = parent_elem.select_one(child_tag) if parent_elem is not None else None
+    return child_elem.get_text(" ", strip=True) if child_elem is not None else None
+
 
-def get_tag_metadata(driver: Service, parent_tag: str, child_tag: str):
+def parse_rendered_metadata(html: str, url_these: str)-> Dict[str, str]:
     """
-        get the parent div which contain sub div with relevant info
+        extract the metadata, the title and the content of a these from the html rendered
+        by the browser. The page rendered now and the rendered page read from the http
+        cache go through this parser, a these gets the same record from both
 
         Args:
-            driver (str): 
-                the google driver to the web site
-                
-            parent_tag (str):
-                name of the parent div tag : div[name_div_class]
+            html (str):
+                the page_source of the driver
                 
-            child_tag (str):
-                name of the tag we want to extract info : type_object[name_tag]
+            url_these (str):
+                the url thses
 
         Returns:
-            selenium object (selenium): 
-                info for the one child_tag in parent_tag
-                
-        Raise:
-        -----
-            - check if something has been extract
-            - error du to bad internet connection     
-               
-        Example:
-            >>> get_tag_metadata(driver_goole, 
-                                    parent_tag = "div[data-v-c8bc896e]", 
-                                    child_tag = "tr[data-v-276fb210]")
-                                    
+            Dict[str, str]: 
+                record of the these : metadata, title, content and url
     """
-    try:
-        parent_elem = driver.find_element(By.CSS_SELECTOR, parent_tag)
-        child_elem = parent_elem.find_element(By.CSS_SELECTOR, child_tag)
-        return child_elem
-    except:
-        print(f"{parent_tag} not found")
-        return None
-        
+    soup          = BeautifulSoup(html, "lxml")
+    dict_metadata = get_metadata_dict(soup)
     
+    content = get_rendered_text(soup, TAG_PARENT_THESE_RESUME, TAG_RESUME)
+    title   = get_rendered_text(soup, TAG_PARENT_THESE_TITLE, TAG_TITLE)
     
-def get_metadata_dict(driver_these: str):
-    """Gather thesis metadata by reading metadata_tag
-
-    Args:
-        driver_these (str): _description_
-
-    Returns:
-        _type_: _description_
-    """
-    dict_metadata = {}
-    
-    elements = get_list_tag_metadata(driver_these, TAG_PARENT_METADATA, TAG_METADATA)
+    dict_metadata["content"]   = content if content is not None else storage_database.MISSING_VALUE
+    dict_metadata["title"]     = title if title is not None else storage_database.MISSING_VALUE
+    dict_metadata["url_these"] = url_these
     
-    if elements:
-        for element in elements:
-            try:
-                element_splited      = element.text.split(":")
-                tag                  = element_splited[0].strip()
-                name                 = element_splited[1]
-                dict_metadata[tag]   = name
-            except:
-                print("no metadata")
-            
-        return dict_metadata
-    else:
-        return {}
+    return dict_metadata
 
 
-def get_metadata_theses(url_these: str, driver_these: Service):
+def get_metadata_theses(url_these: str, driver_these: webdriver.Chrome)-> Dict[str, str]:
     """
-        get the title of a these given its url
+        get the title of a these given its url, the rendered page is kept in the http
+        cache under its own key (http_cache.get_rendered_key) and parsed with
+        parse_rendered_metadata
 
         Args:
         -------
             url_these (str):
                 the url thses
                 
-            driver_theses (Service): 
+            driver_theses (webdriver.Chrome): 
                 the driver to connect to the url 
 
         Returns:
         --------
-            str: 
-                title of the these
+            Dict[str, str]: 
+                record of the these : metadata, title, content and url
     """
     
     check_utilities.check_correct_url(url_these)
     # init driver with new url
     driver_these.get(url_these)
+    html = driver_these.page_source
     
-    dict_metadata = get_metadata_dict(driver_these) 
-    
-    # get title
-    content       = get_tag_metadata(driver_these, TAG_PARENT_THESE_RESUME, TAG_RESUME)
-    title         = get_tag_metadata(driver_these, TAG_PARENT_THESE_TITLE, TAG_TITLE)
+    # the rendered page is kept apart from the pages downloaded without browser
+    cache = http_cache.get_http_cache()
+    if cache is not None:
+        cache.store(http_cache.get_rendered_key(url_these), html)
     
-    try: # avoid crash if bad connection
-        dict_metadata["content"]  = content.text 
-    except:
-        dict_metadata["content"]  =  "Missing Value"
-        
-    try: # avoid crash if bad connection
-        dict_metadata["title"]    = title.text
-    except:
-        dict_metadata["title"]    = "Missing Value"
-        
-    dict_metadata["url_these"]    = url_these
-    
-        
-    return pd.DataFrame([dict_metadata])
+    return parse_rendered_metadata(html, url_these)
     
     
 def get_all_metadata_thesis(list_url_these: list):
     """
-        get metadata of theses given a list of url
+        get metadata of theses given a list of url, the pages are shared between the
+        warm drivers of the driver pool (POOL_SIZE in config.ini). The pages rendered less
+        than TTL seconds ago are read from the http cache and parsed without browser, a
+        rendered page has no validators : a stale one is rendered again
 
         Args:
         -------
@@ -205,18 +144,19 @@ def get_all_metadata_thesis(list_url_these: list):
     if not isinstance(list_url_these, list):
         raise TypeError(f"The inut must be a list of url link, recieved : {type(list_url_these).__name__}")
     
-    driver_path = Service(DRIVER_PATH_GOOGLE)
-    driver_these = webdriver.Chrome(service=driver_path, options=options)
-
-    metadata = pd.DataFrame()
-    for url in tqdm.tqdm(list_url_these):  
-        metadata_aux = get_metadata_theses(url, driver_these)
-                
-        if metadata_aux is not None:
-            metadata = pd.concat([metadata, metadata_aux])
-    driver_these.quit()
-        
-    return metadata.reset_index(drop=True)
+    cache   = http_cache.get_http_cache()
+    entries = {url: cache.lookup(http_cache.get_rendered_key(url)) for url in dict.fromkeys(list_url_these)} if cache is not None else {}
+    entries = {url: entry for url, entry in entries.items() if entry is not None and cache.is_fresh(entry)}
+    
+    # one record per these, the dataframe is built once at the end
+    browser_url = [url for url in dict.fromkeys(list_url_these) if url not in entries]
+    records     = dict(zip(browser_url, driver_pool.get_driver_pool().map(get_metadata_theses, browser_url)))
+    
+    for url, entry in entries.items():
+        records[url] = parse_rendered_metadata(cache.hit(entry), url)
+    
+    records = [records.get(url) for url in dict.fromkeys(list_url_these)]
+    return pd.DataFrame.from_records([record for record in records if record is not None])
     
 
     
@@ -3,12 +3,15 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
+from typing import Iterator, List, Optional, Tuple
+import math
 import os
+import re
 import scripts.check_utilities as check_utilities
+import scripts.driver_pool as driver_pool
 import configparser
-import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Read config.ini
@@ -22,6 +25,12 @@ PATH_THESES_HEAD   = config["DRIVER"]["PATH_THESES_HEAD"]
 PATH_THESES_TAIL   = config["DRIVER"]["PATH_THESES_TAIL"]
 TAG_PARENT         = config["DRIVER"]["TAG_PARENT"]
 TAG_HREF           = config["DRIVER"]["TAG_HREF"]
+MAX_RESULT_PAGES   = config["DRIVER"].getint("MAX_RESULT_PAGES")
+
+# page number and page size in the url query, total hits in the text of the result page
+PAGE_PATTERN       = re.compile(r"([?&]page=)\d+")
+NB_PATTERN         = re.compile(r"[?&]nb=(\d+)")
+HITS_PATTERN       = re.compile(r"(\d[\d \u00a0\u202f]*)\s*r[ée]sultats?", re.IGNORECASE)
 
 # Check if correct driver path
 if not os.path.exists(DRIVER_PATH_GOOGLE):
@@ -81,7 +90,9 @@ def init_chrome_driver(url_web_site: str, driver_path: Service = driver_path, op
 
 def get_url_request(query: str):
     """
-        Given a query, build the correct url to access the theses web site
+        Given a query, build the correct url to access the theses web site, the query
+        is made canonical (lowercase, single spaces) so that the same subject typed
+        differently is one url query in the store
 
         Args:
             query (str): 
@@ -98,7 +109,7 @@ def get_url_request(query: str):
     if len(query) == 0:
         raise TypeError(f"The query recieved is empty, no theses will be found")
     
-    query = query.split()
+    query = check_utilities.canonical_query(query).split()
     model_query = ""
     for i in range(len(query)-1):
         model_query += query[i] + "+"
@@ -142,17 +153,21 @@ def get_link_theses(div: webdriver.remote.webelement.WebElement):
         
     return url_theses
 
-def get_all_url_theses(query: str):
+def get_all_url_theses(query: str, max_pages: int = MAX_RESULT_PAGES):
     """
-        Combined function to automatically get the these url from the theses.fr website
+        Combined function to automatically get the these url from the theses.fr website,
+        every result page up to max_pages is read, see iter_url_theses
 
         Args:
             url_query (str): 
                 the user request
+                
+            max_pages (int, optional): 
+                number of result pages read at most. Defaults to MAX_RESULT_PAGES.
 
         Returns:
             List[str]: 
-                list of the theses url
+                list of the theses url, in the order of the result pages
                 
             url_query (str):
                 the url path the the theses.fr website
@@ -164,49 +179,179 @@ def get_all_url_theses(query: str):
             
     """
     
-    if not isinstance(query, str):
-        raise TypeError(f"Query given is not a string, recieved : {type(query).__name__}")
-    
-    if len(query.split()) == 0:
-        raise TypeError(f"The query is empty")
+    # warm drivers of the pool instead of a new browser for each search
+    pages = sorted(iter_url_theses(query, max_pages))
+    url_theses = [url for _, page_url_theses in pages for url in page_url_theses]
+            
+    return list(dict.fromkeys(url_theses)), get_url_request(query)
+
+def get_page_url(url_query: str, page: int)-> str:
+    """
+        url of a result page of a url query
+
+        Args:
+            url_query (str): 
+                the url query, on the first page
+                
+            page (int): 
+                the number of the page, from 1
+
+        Returns:
+            str: 
+                the url of the page
+                
+        Example:
+        --------
+            >>> get_page_url("https://theses.fr/resultats?q=water&page=1&nb=100", 3)
+            "https://theses.fr/resultats?q=water&page=3&nb=100"
+    """
+    return PAGE_PATTERN.sub(lambda match: f"{match.group(1)}{page}", url_query)
+
+
+def get_total_hits(driver: webdriver.Chrome)-> Optional[int]:
+    """
+        number of theses found for the query, read in the text of the result page
+
+        Args:
+            driver (webdriver.Chrome): 
+                the driver on a result page
+
+        Returns:
+            Optional[int]: 
+                the number of theses, None if it is not displayed
+    """
+    try:
+        hits = HITS_PATTERN.search(driver.find_element(By.TAG_NAME, "body").text)
+    except Exception:
+        return None
     
-    url_query = get_url_request(query) # convert query into url theses query
+    return int(re.sub(r"\D", "", hits.group(1))) if hits else None
+
+
+def get_page_url_theses(driver: webdriver.Chrome)-> List[str]:
+    """
+        url of the theses of the result page loaded in the driver, in the order of the page
+
+        Args:
+            driver (webdriver.Chrome): 
+                the driver on a result page
+
+        Returns:
+            List[str]: 
+                the url of the theses, empty for a page without result
+    """
+    try:
+        parent_div = get_parent_div(driver)
+    except TimeoutException: # page after the last result
+        return []
     
-    driver = init_chrome_driver(url_query)
+    url_theses = []
+    for div in parent_div.find_elements(By.TAG_NAME, 'div'):
+        url_theses += get_link_theses(div)
+        
+    return list(dict.fromkeys(url_theses))
+
+
+def crawl_result_page(page_url: str)-> List[str]:
+    """
+        url of the theses of one result page, read by a driver of the pool
+
+        Args:
+            page_url (str): 
+                the url of the result page
+
+        Returns:
+            List[str]: 
+                the url of the theses
+    """
+    with driver_pool.get_driver_pool().driver() as driver:
+        driver.get(page_url)
+        return get_page_url_theses(driver)
+
+
+def read_first_page(url_query: str, max_pages: int = MAX_RESULT_PAGES)-> Tuple[List[str], int, bool]:
+    """
+        Read the first result page of a url query and the number of theses found
+
+        Args:
+            url_query (str): 
+                the url query, on the first page
+                
+            max_pages (int, optional): 
+                number of result pages crawled at most. Defaults to MAX_RESULT_PAGES.
+
+        Returns:
+            Tuple[List[str], int, bool]: 
+                the url of the theses of the first page, the number of pages to read and
+                True if these pages hold every theses found (not capped by max_pages)
+    """
+    with driver_pool.get_driver_pool().driver() as driver:
+        driver.get(url_query)
+        url_theses = get_page_url_theses(driver)
+        total_hits = get_total_hits(driver)
     
-    parent_div    = get_parent_div(driver)
-    child_divs = parent_div.find_elements(By.TAG_NAME, 'div')
-    url_theses  = []
+    page_size = int(NB_PATTERN.search(url_query).group(1)) if NB_PATTERN.search(url_query) else max(len(url_theses), 1)
+    if total_hits is not None:
+        nb_pages    = min(max_pages, max(1, math.ceil(total_hits / page_size)))
+        is_complete = math.ceil(total_hits / page_size) <= max_pages
+    else: # unknown total, the next pages are read only if the first one is full
+        nb_pages    = max_pages if len(url_theses) >= page_size else 1
+        is_complete = nb_pages == 1
     
-    for div in tqdm.tqdm(child_divs):
-        url_aux = get_link_theses(div)
-        if len(url_aux)>0:
-            url_theses += url_aux
-            
-    driver.quit()
-            
-    return list(set(url_theses)), url_query
+    print(f"result pages : {total_hits if total_hits is not None else 'unknown number of'} theses found, {nb_pages} pages of {page_size} read")
+    return url_theses, nb_pages, is_complete
+
 
-def get_all_url_theses_parallelize(query: str):
+def iter_next_pages(url_query: str, nb_pages: int)-> Iterator[Tuple[int, List[str]]]:
     """
-        Combined function to automatically get the these url from the theses.fr website
+        Read the result pages 2 to nb_pages at once with the drivers of the pool
 
         Args:
             url_query (str): 
-                the user request
+                the url query, on the first page
+                
+            nb_pages (int): 
+                number of result pages to read
 
-        Returns:
-            List[str]: 
-                list of the theses url
+        Yields:
+            Tuple[int, List[str]]: 
+                the number of the page and the url of its theses, in the order the pages are read,
+                a page that failed is not yielded
+    """
+    if nb_pages <= 1:
+        return
+    
+    with ThreadPoolExecutor(max_workers=driver_pool.get_driver_pool().size) as executor:
+        futures = {executor.submit(crawl_result_page, get_page_url(url_query, page)): page for page in range(2, nb_pages + 1)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as error:
+                print(f"result page {futures[future]} failed, {type(error).__name__}")
+
+
+def iter_url_theses(query: str, max_pages: int = MAX_RESULT_PAGES)-> Iterator[Tuple[int, List[str]]]:
+    """
+        Crawl the result pages of a query : the first page gives the number of theses found,
+        the next pages (at most max_pages in all) are read at once by the drivers of the pool
+        and their url are yielded as soon as a page is read, so that the metadata of the first
+        pages are fetched while the last pages are still read
+
+        Args:
+            query (str): 
+                the user request
                 
-            url_query (str):
-                the url path the the theses.fr website
+            max_pages (int, optional): 
+                number of result pages crawled at most. Defaults to MAX_RESULT_PAGES.
+
+        Yields:
+            Tuple[int, List[str]]: 
+                the number of the page and the url of its theses, the pages come in the order they are read
                 
         Raise:
         -----
             - if the query is not a string
             - if the query is empty or only space
-            
     """
     
     if not isinstance(query, str):
@@ -216,27 +361,35 @@ def get_all_url_theses_parallelize(query: str):
         raise TypeError(f"The query is empty")
     
     url_query = get_url_request(query) # convert query into url theses query
+    check_utilities.check_correct_url(url_query) # url check
     
-    driver = init_chrome_driver(url_query)
-    
-    parent_div    = get_parent_div(driver)
-    child_divs = parent_div.find_elements(By.TAG_NAME, 'div')
-    url_theses  = []
+    url_theses, nb_pages, _ = read_first_page(url_query, max_pages)
+    yield 1, url_theses
     
-    # parallelize url extraction
-    with ThreadPoolExecutor(max_workers=30) as executor:
-        futures = [executor.submit(get_link_theses, div) for div in tqdm.tqdm(child_divs)]
-        print("futures")
-        results = []
-        for future in tqdm.tqdm(as_completed(futures)):
-            if len(future.result())>0:
-                results.append(future.result()[0])
-            
-        driver.quit()
-            
-    return list(set(results)), url_query
-
+    yield from iter_next_pages(url_query, nb_pages)
 
 
+def get_result_listing(url_query: str, max_pages: int = MAX_RESULT_PAGES)-> Tuple[List[str], bool]:
+    """
+        url of every theses listed for a url query already in the store, used by the refresh
 
+        Args:
+            url_query (str): 
+                the url query, on the first page
+                
+            max_pages (int, optional): 
+                number of result pages crawled at most. Defaults to MAX_RESULT_PAGES.
 
+        Returns:
+            Tuple[List[str], bool]: 
+                the url of the theses in the order of the results, and True if the listing is
+                complete (every page read), a these missing from an incomplete listing may still
+                be on theses.fr
+    """
+    check_utilities.check_correct_url(url_query) # url check
+    
+    url_theses, nb_pages, is_complete = read_first_page(url_query, max_pages)
+    pages = sorted([(1, url_theses)] + list(iter_next_pages(url_query, nb_pages)))
+    
+    url_theses = [url for _, page_url_theses in pages for url in page_url_theses]
+    return list(dict.fromkeys(url_theses)), is_complete and len(pages) == nb_pages
@@ -1,276 +1,876 @@
-import os
-from typing import Union, List, Dict
-import pandas as pd
-# libraries HuggingFace, LangChain, Faiss
-from langchain_community.vectorstores import FAISS
-from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-
-
-# TOOLS FOR LANGCHAIN//FAISS
-
-######################### useless for now
-def get_transformer_path_model(model_name_path: str)-> str:
-    """
-        Function to automatically get the path to the transformer model folder if
-        it exists
-
-        Args:
-            model_name (str):
-                name of the transformer model
-
-        Returns:
-            (str): the path to the transformer model folder on the repo
-            
-        Raise:
-        -----
-        - if model_path_name doesn't exist
-    """
-    
-    
-    if not os.path.exists(model_name_path):
-        raise TypeError("{} doesn't exist, make sure you downloaded the model on the correct folder -> {}".format(model_name_path, model_name_path))
-    return model_name_path
-
-#########################
-
-def get_len_key_dict(dico: dict)->List[int]:
-    """Get list of len values for each keys in the dict
-
-        Args:
-            dico (dict): 
-                the dict we want to len of value
-
-        Returns:
-            list: 
-                the list of length
-                
-        Raise:
-        ------
-        - if dico is not a dict
-        - if the dict is empty
-        
-    """
-    if not isinstance(dico, dict):
-        raise TypeError(f"wrong type object, expected dict, got : {type(dico).__name__}")
-    
-    if len(dico.keys()) == 0:
-        raise TypeError(f"dict empty no key found : {dico.keys()}")
-
-    list_len = []
-    for cle, valeur in dico.items():
-        list_len.append(len(valeur))
-    return list_len
-
-def create_document_paragraphs(paragraphs: Dict[str, list]):
-    """
-        In order to create a vector store we need to 
-        stores our documents in a Document object understandable for
-        vector store. By defaut metadata if filled with Id which are integer
-
-        Args:
-            paragraphs (Dict[str, list])):
-                dict of documents must contains the following key : "content"
-                other keys will be put in metadata
-
-        Returns:
-            documents (Document):
-                Document object
-                
-        Raise:
-        -------
-        - if paragraphs not a dict
-        - if values associated to keys are not list of the same length
-        - if "content" not a key in paragraphs
-
-        Example:
-            >>> create_document_paragraphs({"content": ["sentence 1", "sentence 2"], "id_metadata" : ["id1", "id2"]})
-            >>> result: [
-                            Document(metadata={"id_metadata": id1}, page_content= "sentence 1"),
-                            Document(metadata={"id_metadata": id2}, page_content= "sentence 1")
-                        ]
-    """
-    
-    if not isinstance(paragraphs, dict):
-        raise TypeError(f"wrong type object, expected dict, got : {type(paragraphs).__name__}")
-    
-    list_length_value_key = get_len_key_dict(paragraphs)
-    unique_length         = set(list_length_value_key)
-    
-    if len(unique_length) > 1:
-        raise TypeError(f"list for each keys should be the same length, here the list of length for each key : {list_length_value_key}")
-    
-    if "content" not in paragraphs.keys():
-        raise TypeError(f"the dict paragraphs should contain a key named 'content' corresponding to the text you want to embed, found : {paragraphs.keys()}")
-    
-    documents = []
-
-    for i in range(len(paragraphs["content"])):
-        metad = {}
-        for key in paragraphs.keys():
-            if key != "content":
-                metad[key] = paragraphs[key][i]
-            
-        doc = Document(
-                        page_content = paragraphs["content"][i],
-                        metadata = metad
-                        )
-
-
-        documents.append(doc)
-
-    return documents
-            
-
-def create_vector_store(paragraphs: Union[Dict[str, str], 
-                                            pd.DataFrame, 
-                                            List[Dict[str, str]], 
-                                            List[pd.DataFrame]],
-                        embeddings: HuggingFaceEmbeddings)-> FAISS:
-
-    """
-        We need to create vector stores and save before using because training takes
-        few minutes. LangChain method here
-
-        Args:
-            paragraphs:
-                dict should contain "content" key with list of text we want to vectorize
-                other keys will be refered as metadata associated to text in content
-                
-            embeddings (HuggingFaceEmbeddings):
-                the embbeding model we want from huggingface
-                
-        Returns:
-            db (FAISS):
-                the face vector store
-                
-        Example:
-        ---------
-            >>> embeddings = HuggingFaceEmbeddings(model_name= "all-MiniLM-L6-v2")
-        >>> create_vector_store(paragraphs = {"content": [text1, text2, text3],
-                                                  "metadata_1" : [metadata_text_1, metadata_text_2, metadata_text_3]},
-                                embeddings = embeddings)
-    """
-    if not isinstance(embeddings, HuggingFaceEmbeddings):
-        raise TypeError(f"wrong type object, expected HuggingFaceEmbeddings, got : {type(embeddings).__name__}")
-    
-
-    #create Document object for vector stores
-    documents = create_document_paragraphs(paragraphs)
-
-    db = FAISS.from_documents(documents, embeddings)
-    
-    print(f"Vector Database: {db.index.ntotal} docs")
-    
-    return db
-
-def save_vector_store(db : FAISS, path_store_db : str):
-    """
-        save a vector store locally given the object, its name and path to store
-
-        Args:
-            db (str): 
-                the vector store object
-                
-            path_store_db (str): 
-                the path we want to store it
-                
-        Returns:
-            None
-            
-        Raise:
-            if db is not FAISS type
-    """
-    
-    path_vector = path_store_db 
-    
-    if not isinstance(db, FAISS):
-        raise TypeError(f"wrong type object, expected FAISS, got : {type(db).__name__}")
-
-    if not os.path.exists(path_store_db):
-        print("Vector_Store folder doesn't exist")
-        print("Vector_Store folder created in {}".format(path_store_db))
-
-    elif os.path.exists(path_vector):
-        print("be carefull {} already exists and is being replaced".format(path_vector))
-
-    print("{} stored in {}".format(path_store_db, path_vector))
-    
-    db.save_local(path_vector)
-    
-
-def load_vector_store(vector_store_path: str, embeddings: HuggingFaceEmbeddings)->FAISS:
-    """
-        Load a vector store given a path and embedding
-        FAISS vectore store
-
-        Args:
-            vector_store_path (str): 
-                path where the vector store is
-                
-            embeddings (str): 
-                name of the embedder, could be None for images vector store for example
-
-        Returns:
-            db (FAISS): 
-                the index vector store
-                
-        Raise:
-        ------
-            if embeddings not HuggingFaceEmbeddings type
-            if vector_store_path doesn't exist
-    """
-    if not isinstance(embeddings, HuggingFaceEmbeddings):
-        raise TypeError(f"wrong type object, expected HuggingFaceEmbeddings, got : {type(embeddings).__name__}")
-
-    if not os.path.exists(vector_store_path):
-        raise TypeError("Error : vector store doesn't exist, make sure you provided the correct path : {vector_store_path}")
-    
-    return FAISS.load_local(vector_store_path, embeddings, allow_dangerous_deserialization=True)
-    
-            
-
-def create_list_metadata(metadata_dict: dict):
-    """
-        Given a dict of list, we create a list of dicts
-        in order to create a metadata dict for each elements
-
-        Args:
-            metadata_dict (dict): 
-                the dict of list with each keys with the same length of values
-                
-        Returns:
-            list_dict_metadata (List[dict]):
-                the list of dict for each element
-                
-        Example:
-            >>> create_list_meatadata(metadata_dict = {"id" : [id0, id1, id2], "label" : ["label0", "label1", "label2"]})
-            >>> list_dict_metadata = [{"id": id0, "label": "label0"}, {"id": id1, "label": "label1"}, {"id": id2, "label": "label2"}]
-    """
-    
-    if not isinstance(metadata_dict, dict):
-        raise TypeError(f"wrong type object, expected dict, got : {type(metadata_dict).__name__}")
-    
-    list_length_value_key = get_len_key_dict(metadata_dict)
-    unique_length         = set(list_length_value_key)
-    
-    if len(unique_length) > 1:
-        raise TypeError(f"list for each keys should be the same length, here the list of length for each key : {list_length_value_key}")
-    
-    if len(metadata_dict.keys()) == 0:
-        raise TypeError(f"metadata_dict is empty : {metadata_dict.keys()}")
-    
-
-    list_dict_metadata = []
-    n = list(unique_length)[0]
-    
-    for i in range(n):
-        aux_dict = {}
-        for key in metadata_dict.keys():
-            aux_dict[key] = metadata_dict[key][i]
-        list_dict_metadata.append(aux_dict)
-            
-    return list_dict_metadata
-    
-
-
+import os
+import json
+import time
+import shutil
+import itertools
+from typing import Union, List, Dict
+import numpy as np
+import pandas as pd
+import configparser
+# libraries HuggingFace, LangChain, Faiss
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import sys
+sys.path.append('..')
+import scripts.sqlite_docstore as sqlite_docstore
+import scripts.embedding_pipeline as embedding_pipeline
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+INDEX_TYPE           = config["VECTOR_STORE"]["INDEX_TYPE"].upper()
+IVF_NLIST            = config["VECTOR_STORE"].getint("IVF_NLIST")
+PQ_M                 = config["VECTOR_STORE"].getint("PQ_M")
+PQ_NBITS             = config["VECTOR_STORE"].getint("PQ_NBITS")
+HNSW_M               = config["VECTOR_STORE"].getint("HNSW_M")
+HNSW_EF_CONSTRUCTION = config["VECTOR_STORE"].getint("HNSW_EF_CONSTRUCTION")
+NPROBE               = config["VECTOR_STORE"].getint("NPROBE")
+EF_SEARCH            = config["VECTOR_STORE"].getint("EF_SEARCH")
+VECTOR_PRECISION     = config["VECTOR_STORE"]["VECTOR_PRECISION"].lower()
+RERANK_FACTOR        = config["VECTOR_STORE"].getint("RERANK_FACTOR")
+
+INDEX_TYPES          = ["FLAT", "IVF", "HNSW", "IVFPQ"]
+# scalar quantizer of the stored vectors, None keeps the float32 vectors
+PRECISIONS           = {"float32": None,
+                        "float16": faiss.ScalarQuantizer.QT_fp16,
+                        "int8"   : faiss.ScalarQuantizer.QT_8bit}
+
+# files of the vector store : the FAISS index and the Id of the store of each vector
+INDEX_FILE           = "index.faiss"
+IDS_FILE             = "index_ids.npy"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+# exact float32 copy of the vectors of a reduced precision index, read from disk to re-score candidates
+EXACT_VECTORS_FILE   = "vectors_f32.bin"
+# version of the files above, bumped by each save once they are all in place, watched by the reload
+VERSION_FILE         = "index_version.json"
+# seconds a load waits for a save in progress to put all the files in place
+LOAD_WAIT_SECONDS    = 10
+LOAD_RETRY_DELAY     = 0.1
+
+
+# TOOLS FOR LANGCHAIN//FAISS
+
+######################### useless for now
+def get_transformer_path_model(model_name_path: str)-> str:
+    """
+        Function to automatically get the path to the transformer model folder if
+        it exists
+
+        Args:
+            model_name (str):
+                name of the transformer model
+
+        Returns:
+            (str): the path to the transformer model folder on the repo
+            
+        Raise:
+        -----
+        - if model_path_name doesn't exist
+    """
+    
+    
+    if not os.path.exists(model_name_path):
+        raise TypeError("{} doesn't exist, make sure you downloaded the model on the correct folder -> {}".format(model_name_path, model_name_path))
+    return model_name_path
+
+#########################
+
+def create_faiss_index(vectors: np.ndarray, 
+                       index_type: str = INDEX_TYPE,
+                       nlist: int = IVF_NLIST,
+                       pq_m: int = PQ_M,
+                       pq_nbits: int = PQ_NBITS,
+                       hnsw_m: int = HNSW_M,
+                       hnsw_ef_construction: int = HNSW_EF_CONSTRUCTION,
+                       precision: str = VECTOR_PRECISION)-> faiss.Index:
+    """
+        Create an empty FAISS index of the given type, trained on the vectors if the
+        type needs training (IVF, IVFPQ, int8). The vectors are not added to the index.
+        FLAT is the exact brute force search, IVF, HNSW and IVFPQ are approximate.
+        Small corpus can't train an IVF, the number of lists is reduced, and the index
+        falls back to FLAT if there are not enough vectors at all.
+        With a float16 or int8 precision, FLAT, IVF and HNSW store scalar quantized
+        vectors (2 or 4 times less memory), IVFPQ is already compressed
+
+        Args:
+            vectors (np.ndarray):
+                the float32 vectors (n, d) used for training
+                
+            index_type (str, optional):
+                FLAT, IVF, HNSW or IVFPQ. Defaults to INDEX_TYPE.
+                
+            nlist (int, optional):
+                number of inverted lists of IVF and IVFPQ. Defaults to IVF_NLIST.
+                
+            pq_m (int, optional):
+                number of sub quantizers of IVFPQ, must divide the dimension. Defaults to PQ_M.
+                
+            pq_nbits (int, optional):
+                bits per sub quantizer code of IVFPQ. Defaults to PQ_NBITS.
+                
+            hnsw_m (int, optional):
+                number of neighbors per node of HNSW. Defaults to HNSW_M.
+                
+            hnsw_ef_construction (int, optional):
+                size of the candidate list while building HNSW. Defaults to HNSW_EF_CONSTRUCTION.
+                
+            precision (str, optional):
+                float32, float16 or int8. Defaults to VECTOR_PRECISION.
+
+        Returns:
+            faiss.Index: the index, trained if needed
+            
+        Raise:
+        ------
+            - if index_type is unknown
+            - if precision is unknown
+            - if vectors is not a 2 dimensions array
+    """
+    index_type = index_type.upper()
+    precision  = precision.lower()
+    
+    if index_type not in INDEX_TYPES:
+        raise TypeError(f"unknown index type {index_type}, expected one of : {INDEX_TYPES}")
+    
+    if precision not in PRECISIONS:
+        raise TypeError(f"unknown precision {precision}, expected one of : {list(PRECISIONS.keys())}")
+    
+    if not isinstance(vectors, np.ndarray) or vectors.ndim != 2:
+        raise TypeError(f"vectors should be a 2 dimensions np.ndarray, recieved : {type(vectors).__name__}")
+    
+    n, d = vectors.shape
+    # faiss needs at least 39 training points per centroid
+    nlist = min(nlist, n // 39)
+    
+    if index_type in ["IVF", "IVFPQ"] and (nlist < 1 or (index_type == "IVFPQ" and n < 39 * 2**pq_nbits)):
+        print(f"not enough vectors ({n}) to train a {index_type} index, FLAT index used")
+        index_type = "FLAT"
+    
+    quantizer_type = PRECISIONS[precision]
+    
+    if index_type == "FLAT":
+        index = faiss.IndexFlatL2(d) if quantizer_type is None else faiss.IndexScalarQuantizer(d, quantizer_type)
+        
+    elif index_type == "HNSW":
+        index = faiss.IndexHNSWFlat(d, hnsw_m) if quantizer_type is None else faiss.IndexHNSWSQ(d, quantizer_type, hnsw_m)
+        index.hnsw.efConstruction = hnsw_ef_construction
+        
+    elif index_type == "IVF":
+        if quantizer_type is None:
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(faiss.IndexFlatL2(d), d, nlist, quantizer_type)
+        
+    else:
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(d), d, nlist, pq_m, pq_nbits)
+        
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+        
+    set_search_parameters(index)
+    
+    return index
+
+def is_compressed_index(index: faiss.Index)-> bool:
+    """
+        Check if the index stores approximate vectors (scalar or product quantization)
+
+        Args:
+            index (faiss.Index):
+                the FAISS index
+
+        Returns:
+            bool: True if the stored vectors are not the exact float32 vectors
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+        
+    return isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer, faiss.IndexIVFPQ, faiss.IndexPQ))
+
+def keep_exact_vectors(db: FAISS, vectors: np.ndarray):
+    """
+        Keep the float32 vectors just added to a reduced precision index, they are
+        written next to the index by save_vector_store to re-score the candidates
+        of a search. Nothing is kept for a float32 index
+
+        Args:
+            db (FAISS):
+                the vector store the vectors were added to
+                
+            vectors (np.ndarray):
+                the float32 vectors, in the order they were added
+    """
+    if not is_compressed_index(db.index):
+        return
+    
+    vectors = np.array(vectors, dtype=np.float32)
+    if db._normalize_L2:
+        faiss.normalize_L2(vectors)
+        
+    if not hasattr(db, "pending_exact_vectors"):
+        db.pending_exact_vectors = []
+    db.pending_exact_vectors.append(vectors)
+
+def save_exact_vectors(db: FAISS, path_store_db: str)-> str:
+    """
+        Write the float32 vectors kept by keep_exact_vectors in a temp file of the vector
+        store folder : the vectors of the file of a loaded vector store followed by the new
+        ones, or only the new ones for a new vector store. The file in use is not modified,
+        save_vector_store moves the temp file in place with the other files of the index
+
+        Args:
+            db (FAISS):
+                the vector store
+                
+            path_store_db (str):
+                the vector store folder
+
+        Returns:
+            str: the file to put in place of EXACT_VECTORS_FILE (the file itself if unchanged),
+            None if there is no exact vectors file for this index
+    """
+    exact_file = os.path.join(path_store_db, EXACT_VECTORS_FILE)
+    pending    = getattr(db, "pending_exact_vectors", [])
+    db.pending_exact_vectors = []
+    
+    if not is_compressed_index(db.index):
+        return None
+    
+    nb_pending = sum(vectors.shape[0] for vectors in pending)
+    nb_in_file = os.path.getsize(exact_file) // (4 * db.index.d) if os.path.exists(exact_file) else 0
+    
+    if nb_pending == 0 and nb_in_file == db.index.ntotal:
+        return exact_file
+    
+    if nb_pending != db.index.ntotal and nb_in_file + nb_pending != db.index.ntotal:
+        print(f"{EXACT_VECTORS_FILE} doesn't match the index, re-scoring disabled until : python -m scripts.maintenance rebuild")
+        return None
+    
+    temp_file = f"{exact_file}.tmp"
+    if nb_pending != db.index.ntotal: # vectors appended to the ones of the loaded vector store
+        shutil.copyfile(exact_file, temp_file)
+    
+    with open(temp_file, "ab" if nb_pending != db.index.ntotal else "wb") as f:
+        for vectors in pending:
+            f.write(vectors.tobytes())
+    return temp_file
+
+def load_exact_vectors(vector_store_path: str, index: faiss.Index):
+    """
+        Map the float32 vectors of a reduced precision index, the file is read from
+        disk only for the rows used to re-score
+
+        Args:
+            vector_store_path (str):
+                the vector store folder
+                
+            index (faiss.Index):
+                the loaded FAISS index
+
+        Returns:
+            np.memmap: the (ntotal, d) vectors, None if the index is float32 or the file doesn't match
+    """
+    exact_file = os.path.join(vector_store_path, EXACT_VECTORS_FILE)
+    
+    if not is_compressed_index(index) or not os.path.exists(exact_file) or index.ntotal == 0:
+        return None
+    
+    if os.path.getsize(exact_file) != 4 * index.d * index.ntotal:
+        print(f"{EXACT_VECTORS_FILE} doesn't match the index, re-scoring disabled")
+        return None
+    
+    return np.memmap(exact_file, dtype=np.float32, mode="r", shape=(index.ntotal, index.d))
+
+def set_search_parameters(index: faiss.Index, nprobe: int = NPROBE, ef_search: int = EF_SEARCH):
+    """
+        Set the search parameters of an approximate index, nprobe for IVF indexes
+        and efSearch for HNSW. Nothing to set for FLAT
+
+        Args:
+            index (faiss.Index):
+                the FAISS index
+                
+            nprobe (int, optional):
+                number of inverted lists visited per query. Defaults to NPROBE.
+                
+            ef_search (int, optional):
+                size of the candidate list of HNSW per query. Defaults to EF_SEARCH.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+        
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+
+def get_search_parameters(index: faiss.Index, selector: faiss.IDSelector = None)-> faiss.SearchParameters:
+    """
+        Search parameters of a query on the index, with the parameters of the index
+        type (nprobe, efSearch) so that they are not lost when a selector is given
+
+        Args:
+            index (faiss.Index):
+                the FAISS index
+                
+            selector (faiss.IDSelector, optional):
+                restrict the search to some positions. Defaults to None.
+
+        Returns:
+            faiss.SearchParameters: the search parameters
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    
+    return faiss.SearchParameters(sel=selector)
+
+def get_len_key_dict(dico: dict)->List[int]:
+    """Get list of len values for each keys in the dict
+
+        Args:
+            dico (dict): 
+                the dict we want to len of value
+
+        Returns:
+            list: 
+                the list of length
+                
+        Raise:
+        ------
+        - if dico is not a dict
+        - if the dict is empty
+        
+    """
+    if not isinstance(dico, dict):
+        raise TypeError(f"wrong type object, expected dict, got : {type(dico).__name__}")
+    
+    if len(dico.keys()) == 0:
+        raise TypeError(f"dict empty no key found : {dico.keys()}")
+
+    list_len = []
+    for cle, valeur in dico.items():
+        list_len.append(len(valeur))
+    return list_len
+
+def create_document_paragraphs(paragraphs: Dict[str, list]):
+    """
+        In order to create a vector store we need to 
+        stores our documents in a Document object understandable for
+        vector store. By defaut metadata if filled with Id which are integer
+
+        Args:
+            paragraphs (Dict[str, list])):
+                dict of documents must contains the following key : "content"
+                other keys will be put in metadata
+
+        Returns:
+            documents (Document):
+                Document object
+                
+        Raise:
+        -------
+        - if paragraphs not a dict
+        - if values associated to keys are not list of the same length
+        - if "content" not a key in paragraphs
+
+        Example:
+            >>> create_document_paragraphs({"content": ["sentence 1", "sentence 2"], "id_metadata" : ["id1", "id2"]})
+            >>> result: [
+                            Document(metadata={"id_metadata": id1}, page_content= "sentence 1"),
+                            Document(metadata={"id_metadata": id2}, page_content= "sentence 1")
+                        ]
+    """
+    
+    if not isinstance(paragraphs, dict):
+        raise TypeError(f"wrong type object, expected dict, got : {type(paragraphs).__name__}")
+    
+    list_length_value_key = get_len_key_dict(paragraphs)
+    unique_length         = set(list_length_value_key)
+    
+    if len(unique_length) > 1:
+        raise TypeError(f"list for each keys should be the same length, here the list of length for each key : {list_length_value_key}")
+    
+    if "content" not in paragraphs.keys():
+        raise TypeError(f"the dict paragraphs should contain a key named 'content' corresponding to the text you want to embed, found : {paragraphs.keys()}")
+    
+    documents = []
+
+    for i in range(len(paragraphs["content"])):
+        metad = {}
+        for key in paragraphs.keys():
+            if key != "content":
+                metad[key] = paragraphs[key][i]
+            
+        doc = Document(
+                        page_content = paragraphs["content"][i],
+                        metadata = metad
+                        )
+
+
+        documents.append(doc)
+
+    return documents
+            
+
+def create_vector_store(paragraphs: Union[Dict[str, str], 
+                                            pd.DataFrame, 
+                                            List[Dict[str, str]], 
+                                            List[pd.DataFrame]],
+                        embeddings: embedding_pipeline.SentenceTransformerEmbeddings,
+                        ids: List[str],
+                        index_type: str = INDEX_TYPE,
+                        nlist: int = IVF_NLIST,
+                        precision: str = VECTOR_PRECISION,
+                        batch_size: int = embedding_pipeline.BATCH_SIZE,
+                        num_workers: int = embedding_pipeline.NUM_WORKERS)-> FAISS:
+
+    """
+        We need to create vector stores and save before using because training takes
+        few minutes. LangChain method here
+
+        Args:
+            paragraphs:
+                dict should contain "content" key with list of text we want to vectorize
+                other keys will be refered as metadata associated to text in content
+                
+            embeddings (SentenceTransformerEmbeddings):
+                the embbeding model we want from huggingface, see embedding_pipeline
+                
+            ids (List[str]):
+                the docstore id of each document, the Id of its these in the store
+                
+            index_type (str, optional):
+                FLAT, IVF, HNSW or IVFPQ, see create_faiss_index. Defaults to INDEX_TYPE.
+                
+            nlist (int, optional):
+                number of inverted lists of IVF and IVFPQ, see create_faiss_index. Defaults to IVF_NLIST.
+                
+            precision (str, optional):
+                float32, float16 or int8, see create_faiss_index. Defaults to VECTOR_PRECISION.
+                
+            batch_size (int, optional):
+                number of texts embedded at once by a process. Defaults to BATCH_SIZE.
+                
+            num_workers (int, optional):
+                number of embedding processes, see embedding_pipeline. Defaults to NUM_WORKERS.
+                
+        Returns:
+            db (FAISS):
+                the face vector store
+                
+        Example:
+        ---------
+            >>> embeddings = SentenceTransformerEmbeddings(SentenceTransformer("all-MiniLM-L6-v2"), "all-MiniLM-L6-v2")
+        >>> create_vector_store(paragraphs = {"content": [text1, text2, text3],
+                                                  "metadata_1" : [metadata_text_1, metadata_text_2, metadata_text_3]},
+                                embeddings = embeddings, ids = ["1", "2", "3"])
+    """
+    if not isinstance(embeddings, embedding_pipeline.SentenceTransformerEmbeddings):
+        raise TypeError(f"wrong type object, expected SentenceTransformerEmbeddings, got : {type(embeddings).__name__}")
+    
+
+    #create Document object for vector stores
+    documents = create_document_paragraphs(paragraphs)
+
+    if len(documents) == 0:
+        raise TypeError("no paragraph to embed, the vector store can't be created")
+
+    texts     = [doc.page_content for doc in documents]
+    metadatas = [doc.metadata for doc in documents]
+    ids       = [str(docstore_id) for docstore_id in ids]
+
+    if len(ids) != len(texts):
+        raise TypeError(f"wrong number of ids, expected {len(texts)}, found : {len(ids)}")
+    
+    # IVF indexes are trained before adding vectors, the first batches are kept until there are
+    # enough vectors to train, the following batches are streamed in the index
+    nb_training = 39 * max(nlist, 2**PQ_NBITS if index_type.upper() == "IVFPQ" else 0) if index_type.upper() in ["IVF", "IVFPQ"] else 1
+    buffer      = []
+    db          = None
+    
+    def add_batch(batch_start: int, vectors: np.ndarray):
+        batch_end = batch_start + vectors.shape[0]
+        db.add_embeddings(zip(texts[batch_start:batch_end], vectors.tolist()), 
+                          metadatas=metadatas[batch_start:batch_end], 
+                          ids=ids[batch_start:batch_end])
+        keep_exact_vectors(db, vectors)
+    
+    batches = embedding_pipeline.embed_batches(texts, embeddings.model, batch_size, num_workers,
+                                               normalize_embeddings=embeddings.normalize_embeddings)
+    for batch_start, vectors in itertools.chain(batches, [(len(texts), None)]):
+        
+        if db is None:
+            if vectors is not None:
+                buffer.append((batch_start, vectors))
+            
+            # enough vectors to train or no more batch
+            if vectors is None or sum(batch[1].shape[0] for batch in buffer) >= nb_training:
+                index = create_faiss_index(np.vstack([batch[1] for batch in buffer]), index_type, nlist, precision=precision)
+                db    = FAISS(embedding_function   = embeddings, 
+                              index                = index, 
+                              docstore             = InMemoryDocstore(), 
+                              index_to_docstore_id = {})
+                for buffered_start, buffered_vectors in buffer:
+                    add_batch(buffered_start, buffered_vectors)
+                buffer = []
+                
+        elif vectors is not None:
+            add_batch(batch_start, vectors)
+    
+    print(f"Vector Database: {db.index.ntotal} docs, {type(db.index).__name__} index")
+    
+    return db
+
+def add_to_vector_store(db: FAISS,
+                        paragraphs: Dict[str, list],
+                        ids: List[str],
+                        batch_size: int = embedding_pipeline.BATCH_SIZE,
+                        num_workers: int = embedding_pipeline.NUM_WORKERS)-> FAISS:
+    """
+        Embed only the given paragraphs and append them to an existing vector store,
+        the documents already in the store are not embedded again
+
+        Args:
+            db (FAISS):
+                the loaded vector store
+                
+            paragraphs (Dict[str, list]):
+                dict should contain "content" key with list of text we want to vectorize
+                other keys will be refered as metadata associated to text in content
+                
+            ids (List[str]):
+                the docstore id of each new document
+                
+            batch_size (int, optional):
+                number of texts embedded at once by a process. Defaults to BATCH_SIZE.
+                
+            num_workers (int, optional):
+                number of embedding processes, see embedding_pipeline. Defaults to NUM_WORKERS.
+                
+        Returns:
+            db (FAISS):
+                the updated vector store
+                
+        Raise:
+        ------
+            - if db is not FAISS type
+            - if the embeddings of db are not SentenceTransformerEmbeddings
+            - if the number of ids is not the number of paragraphs
+    """
+    if not isinstance(db, FAISS):
+        raise TypeError(f"wrong type object, expected FAISS, got : {type(db).__name__}")
+    
+    embeddings = db.embedding_function
+    if not isinstance(embeddings, embedding_pipeline.SentenceTransformerEmbeddings):
+        raise TypeError(f"wrong type object, expected SentenceTransformerEmbeddings, got : {type(embeddings).__name__}")
+    
+    documents = create_document_paragraphs(paragraphs)
+    
+    if len(ids) != len(documents):
+        raise TypeError(f"one id per paragraph is expected, got {len(ids)} ids for {len(documents)} paragraphs")
+    
+    texts     = [doc.page_content for doc in documents]
+    metadatas = [doc.metadata for doc in documents]
+    
+    # the batches are streamed in the index as soon as they are embedded
+    for batch_start, vectors in embedding_pipeline.embed_batches(texts, embeddings.model, batch_size, num_workers,
+                                                                 normalize_embeddings=embeddings.normalize_embeddings):
+        batch_end = batch_start + vectors.shape[0]
+        db.add_embeddings(zip(texts[batch_start:batch_end], vectors.tolist()), 
+                          metadatas=metadatas[batch_start:batch_end], 
+                          ids=ids[batch_start:batch_end])
+        keep_exact_vectors(db, vectors)
+    
+    print(f"Vector Database: {len(documents)} docs added, {db.index.ntotal} docs")
+    
+    return db
+
+def save_vector_store(db : FAISS, path_store_db : str):
+    """
+        save a vector store locally given the object, its name and path to store.
+        Only the FAISS index and the docstore ids are saved, the documents are
+        read from the SQLite store when loaded, no pickle file is written
+
+        Args:
+            db (str): 
+                the vector store object
+                
+            path_store_db (str): 
+                the path we want to store it
+                
+        Returns:
+            None
+            
+        Raise:
+            if db is not FAISS type
+            if the docstore ids are not Id of the store
+    """
+    
+    path_vector = path_store_db 
+    
+    if not isinstance(db, FAISS):
+        raise TypeError(f"wrong type object, expected FAISS, got : {type(db).__name__}")
+    
+    docstore_ids = [db.index_to_docstore_id[i] for i in range(db.index.ntotal)]
+    if not all(docstore_id.isdigit() for docstore_id in docstore_ids):
+        raise TypeError("the docstore ids should be the Id of the store, rebuild the vector store with the Id as ids")
+
+    if not os.path.exists(path_store_db):
+        print("Vector_Store folder doesn't exist")
+        print("Vector_Store folder created in {}".format(path_store_db))
+        os.makedirs(path_store_db)
+
+    elif os.path.exists(path_vector):
+        print("be carefull {} already exists and is being replaced".format(path_vector))
+
+    print("{} stored in {}".format(path_store_db, path_vector))
+    
+    write_vector_store_files(path_vector, db.index, np.array(docstore_ids, dtype=np.int64), save_exact_vectors(db, path_vector))
+
+
+def write_vector_store_files(path_store_db: str, index: faiss.Index, docstore_ids: np.ndarray, exact_vectors_file: str):
+    """
+        Write the files of a vector store : every file is written aside first, then they
+        are moved in place between two bumps of the version file, a load never pairs
+        the index of a save with the ids of another
+
+        Args:
+            path_store_db (str):
+                the vector store folder
+                
+            index (faiss.Index):
+                the FAISS index
+                
+            docstore_ids (np.ndarray):
+                the Id of the store of each vector of the index
+                
+            exact_vectors_file (str):
+                the file to put in place of EXACT_VECTORS_FILE, None to remove it
+    """
+    index_file = os.path.join(path_store_db, INDEX_FILE)
+    ids_file   = os.path.join(path_store_db, IDS_FILE)
+    faiss.write_index(index, f"{index_file}.tmp")
+    with open(f"{ids_file}.tmp", "wb") as f:
+        np.save(f, np.asarray(docstore_ids, dtype=np.int64))
+    
+    files = {index_file: f"{index_file}.tmp",
+             ids_file  : f"{ids_file}.tmp",
+             os.path.join(path_store_db, EXACT_VECTORS_FILE): exact_vectors_file,
+             # the pickled docstore of the previous format doesn't match the new index anymore
+             os.path.join(path_store_db, LEGACY_DOCSTORE_FILE): None}
+    
+    version = (read_store_version(path_store_db) or {}).get("version", 0) + 1
+    write_store_version(path_store_db, version, index.ntotal, saving=True)
+    for target, source in files.items():
+        if source is None and os.path.exists(target):
+            os.remove(target)
+        elif source is not None and source != target:
+            os.replace(source, target)
+    write_store_version(path_store_db, version, index.ntotal, saving=False)
+
+
+def remove_from_vector_store(vector_store_path: str, ids: List[int])-> int:
+    """
+        Remove the vectors of some Id of the store from a saved vector store, nothing is
+        embedded again : the vectors kept are read back (from the exact vectors file for a
+        reduced precision index, from the index otherwise) and added again to the emptied
+        index, its training is kept. The caller holds the store lock
+
+        Args:
+            vector_store_path (str):
+                the vector store folder
+                
+            ids (List[int]):
+                the Id of the store to remove
+
+        Returns:
+            int: number of vectors removed
+    """
+    ids_file = os.path.join(vector_store_path, IDS_FILE)
+    if not os.path.exists(ids_file): # no vector store, or the pickle format rebuilt from the store anyway
+        return 0
+    
+    index        = faiss.read_index(os.path.join(vector_store_path, INDEX_FILE))
+    docstore_ids = np.load(ids_file, allow_pickle=False)
+    keep         = ~np.isin(docstore_ids, np.asarray(ids, dtype=np.int64))
+    nb_removed   = int((~keep).sum())
+    
+    if nb_removed == 0:
+        return 0
+    
+    if is_compressed_index(index):
+        exact_vectors = load_exact_vectors(vector_store_path, index)
+        if exact_vectors is None:
+            print(f"no {EXACT_VECTORS_FILE} to remove {nb_removed} vectors from {vector_store_path}, run : python -m scripts.maintenance rebuild")
+            return 0
+        vectors = np.array(exact_vectors[keep], dtype=np.float32)
+    else:
+        index_ivf = faiss.try_extract_index_ivf(index)
+        if index_ivf is not None: # an IVF index reconstructs its vectors by position with a direct map only
+            index_ivf.make_direct_map()
+        vectors = index.reconstruct_n(0, index.ntotal)[keep]
+        if index_ivf is not None:
+            index_ivf.make_direct_map(False)
+    
+    index.reset()
+    if vectors.shape[0] > 0:
+        index.add(vectors)
+    
+    exact_vectors_file = None
+    if is_compressed_index(index):
+        exact_vectors_file = os.path.join(vector_store_path, f"{EXACT_VECTORS_FILE}.tmp")
+        vectors.tofile(exact_vectors_file)
+    
+    write_vector_store_files(vector_store_path, index, docstore_ids[keep], exact_vectors_file)
+    print(f"Vector Database: {nb_removed} docs removed, {index.ntotal} docs")
+    
+    return nb_removed
+
+
+def read_store_version(vector_store_path: str)-> dict:
+    """
+        Version of the files of a vector store, see save_vector_store
+
+        Args:
+            vector_store_path (str):
+                the vector store folder
+
+        Returns:
+            dict: version, ntotal and saving (True while the files are moved in place),
+            None for a vector store saved without version file
+    """
+    try:
+        with open(os.path.join(vector_store_path, VERSION_FILE), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_store_version(vector_store_path: str, version: int, ntotal: int, saving: bool):
+    """Replace the version file of a vector store at once"""
+    version_file = os.path.join(vector_store_path, VERSION_FILE)
+    with open(f"{version_file}.tmp", "w") as f:
+        json.dump({"version": version, "ntotal": ntotal, "saving": saving}, f)
+    os.replace(f"{version_file}.tmp", version_file)
+    
+
+def load_vector_store(vector_store_path: str, embeddings: Embeddings,
+                      database_path: str = sqlite_docstore.storage_database.DATABASE_PATH)->FAISS:
+    """
+        Load a vector store given a path and embedding
+        FAISS vectore store. The documents are not loaded, they are read lazily
+        in the SQLite store by their Id. A vector store saved in the previous
+        pickle format is still loaded until it is rebuilt.
+        The index, the ids and the exact vectors (db.exact_vectors) come from the
+        same save : the load is done again if a save moved files meanwhile
+
+        Args:
+            vector_store_path (str): 
+                path where the vector store is
+                
+            embeddings (str): 
+                name of the embedder, could be None for images vector store for example
+                
+            database_path (str, optional): 
+                the SQLite store with the documents. Defaults to DATABASE_PATH.
+
+        Returns:
+            db (FAISS): 
+                the index vector store
+                
+        Raise:
+        ------
+            if embeddings not Embeddings type
+            if vector_store_path doesn't exist
+    """
+    if not isinstance(embeddings, Embeddings):
+        raise TypeError(f"wrong type object, expected Embeddings, got : {type(embeddings).__name__}")
+
+    if not os.path.exists(vector_store_path):
+        raise TypeError("Error : vector store doesn't exist, make sure you provided the correct path : {vector_store_path}")
+    
+    if os.path.exists(os.path.join(vector_store_path, IDS_FILE)):
+        start = time.time()
+        while True:
+            version       = read_store_version(vector_store_path)
+            index         = faiss.read_index(os.path.join(vector_store_path, INDEX_FILE))
+            docstore_ids  = np.load(os.path.join(vector_store_path, IDS_FILE), allow_pickle=False)
+            exact_vectors = load_exact_vectors(vector_store_path, index)
+            is_same_save  = read_store_version(vector_store_path) == version and index.ntotal == docstore_ids.shape[0]
+            
+            if is_same_save and (version is None or not version["saving"]):
+                break
+            
+            if time.time() - start > LOAD_WAIT_SECONDS: # save stopped while moving the files
+                if index.ntotal != docstore_ids.shape[0]:
+                    raise TypeError(f"the index and the ids of {vector_store_path} don't match, run : python -m scripts.maintenance rebuild")
+                print(f"vector store {vector_store_path} left incomplete by a save, run : python -m scripts.maintenance rebuild")
+                break
+            time.sleep(LOAD_RETRY_DELAY)
+            
+        db = FAISS(embedding_function   = embeddings,
+                   index                = index,
+                   docstore             = sqlite_docstore.SQLiteDocstore(database_path),
+                   index_to_docstore_id = {i: str(docstore_id) for i, docstore_id in enumerate(docstore_ids.tolist())})
+        db.exact_vectors = exact_vectors
+    else:
+        print("vector store in the pickle format, run : python -m scripts.maintenance rebuild")
+        db = FAISS.load_local(vector_store_path, embeddings, allow_dangerous_deserialization=True)
+        db.exact_vectors = load_exact_vectors(vector_store_path, db.index)
+        
+    set_search_parameters(db.index)
+    
+    return db
+    
+            
+
+def create_list_metadata(metadata_dict: dict):
+    """
+        Given a dict of list, we create a list of dicts
+        in order to create a metadata dict for each elements
+
+        Args:
+            metadata_dict (dict): 
+                the dict of list with each keys with the same length of values
+                
+        Returns:
+            list_dict_metadata (List[dict]):
+                the list of dict for each element
+                
+        Example:
+            >>> create_list_meatadata(metadata_dict = {"id" : [id0, id1, id2], "label" : ["label0", "label1", "label2"]})
+            >>> list_dict_metadata = [{"id": id0, "label": "label0"}, {"id": id1, "label": "label1"}, {"id": id2, "label": "label2"}]
+    """
+    
+    if not isinstance(metadata_dict, dict):
+        raise TypeError(f"wrong type object, expected dict, got : {type(metadata_dict).__name__}")
+    
+    list_length_value_key = get_len_key_dict(metadata_dict)
+    unique_length         = set(list_length_value_key)
+    
+    if len(unique_length) > 1:
+        raise TypeError(f"list for each keys should be the same length, here the list of length for each key : {list_length_value_key}")
+    
+    if len(metadata_dict.keys()) == 0:
+        raise TypeError(f"metadata_dict is empty : {metadata_dict.keys()}")
+    
+
+    list_dict_metadata = []
+    n = list(unique_length)[0]
+    
+    for i in range(n):
+        aux_dict = {}
+        for key in metadata_dict.keys():
+            aux_dict[key] = metadata_dict[key][i]
+        list_dict_metadata.append(aux_dict)
+            
+    return list_dict_metadata
+    
+
+
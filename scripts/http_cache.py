@@ -0,0 +1,275 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Optional
+import requests
+import configparser
+
+# Read config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+HTTP_CACHE_ENABLED = config["HTTP_CACHE"].getboolean("ENABLED")
+HTTP_CACHE_PATH    = config["HTTP_CACHE"]["HTTP_CACHE_PATH"]
+HTTP_CACHE_TTL     = config["HTTP_CACHE"].getfloat("TTL")
+TIMEOUT            = config["FETCHER"].getfloat("TIMEOUT")
+
+# url of a cached page, sha256 of its body, validators of the server and time of the last fetch or revalidation
+CacheEntry = namedtuple("CacheEntry", ["url", "digest", "etag", "last_modified", "fetched_at", "size"])
+
+STAT_NAMES = ["requests", "fresh", "revalidated", "misses", "bytes_saved", "bytes_downloaded"]
+
+# key of the pages rendered by the browser, not the html downloaded without browser of the same url
+RENDERED_PREFIX = "rendered:"
+
+
+class HttpCache:
+    """
+        On disk cache of the theses pages shared by every query : the bodies are stored
+        gzipped under the sha256 of their content (objects/ab/abcd....gz, the same page
+        reached by two url is stored once), an sqlite index maps each url to its body
+        and to the ETag / Last-Modified of the server.
+        A page fetched less than ttl seconds ago is served without any request, an older
+        one is revalidated with a conditional request, a 304 serves the stored body.
+
+        Example:
+        --------
+            >>> cache = get_http_cache()
+            >>> entry = cache.lookup(url_these)
+            >>> if entry is not None and cache.is_fresh(entry):
+            >>>     html = cache.hit(entry)
+            >>> else:
+            >>>     response = requests.get(url_these, headers=cache.conditional_headers(entry))
+            >>>     html = cache.not_modified(entry) if response.status_code == 304 else cache.store(url_these, response.text, ...)
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH, ttl: float = HTTP_CACHE_TTL):
+
+        if not isinstance(path, str):
+            raise TypeError(f"wrong type, path should be str, found : {type(path).__name__}")
+
+        self.path = path
+        self.ttl  = ttl
+        os.makedirs(os.path.join(self.path, "objects"), exist_ok=True)
+
+        self._lock  = threading.Lock()
+        self._stats = dict.fromkeys(STAT_NAMES, 0)
+        self._conn  = sqlite3.connect(os.path.join(self.path, "index.db"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS pages (
+                                url TEXT PRIMARY KEY,
+                                digest TEXT NOT NULL,
+                                etag TEXT,
+                                last_modified TEXT,
+                                fetched_at REAL NOT NULL,
+                                size INTEGER NOT NULL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_digest ON pages(digest)")
+        self._conn.commit()
+
+    def _object_file(self, digest: str)-> str:
+        return os.path.join(self.path, "objects", digest[:2], f"{digest}.gz")
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                self._stats[name] += count
+
+    def lookup(self, url: str)-> Optional[CacheEntry]:
+        """Get the cache entry of a url
+
+            Args:
+                url (str):
+                    the url of the page
+
+            Returns:
+                Optional[CacheEntry]: the entry, None if the page was never cached or its body is lost
+        """
+        self._count(requests=1)
+        with self._lock:
+            row = self._conn.execute("SELECT url, digest, etag, last_modified, fetched_at, size FROM pages WHERE url = ?", (url,)).fetchone()
+
+        if row is None or not os.path.exists(self._object_file(row[1])):
+            return None
+        return CacheEntry(*row)
+
+    def is_fresh(self, entry: CacheEntry)-> bool:
+        """True if the page was fetched or revalidated less than ttl seconds ago"""
+        return time.time() - entry.fetched_at < self.ttl
+
+    def conditional_headers(self, entry: Optional[CacheEntry])-> Dict[str, str]:
+        """Headers of a conditional request revalidating a stale entry
+
+            Args:
+                entry (Optional[CacheEntry]):
+                    the stale entry, None for a page not cached
+
+            Returns:
+                Dict[str, str]: If-None-Match and If-Modified-Since, empty without validators
+        """
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def read(self, entry: CacheEntry)-> str:
+        """Body of a cache entry"""
+        with gzip.open(self._object_file(entry.digest), "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def hit(self, entry: CacheEntry)-> str:
+        """Body of a fresh entry, served without any request"""
+        self._count(fresh=1, bytes_saved=entry.size)
+        return self.read(entry)
+
+    def not_modified(self, entry: CacheEntry)-> str:
+        """Body of an entry revalidated by a 304, fresh again for ttl seconds"""
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), entry.url))
+            self._conn.commit()
+        self._count(revalidated=1, bytes_saved=entry.size)
+        return self.read(entry)
+
+    def store(self, url: str, body: str, etag: Optional[str] = None, last_modified: Optional[str] = None)-> str:
+        """Cache the body of a page downloaded in full
+
+            Args:
+                url (str):
+                    the url of the page
+
+                body (str):
+                    the body of the page
+
+                etag (Optional[str], optional):
+                    ETag header of the response. Defaults to None.
+
+                last_modified (Optional[str], optional):
+                    Last-Modified header of the response. Defaults to None.
+
+            Returns:
+                str: the body
+        """
+        if not isinstance(body, str):
+            raise TypeError(f"wrong type, body should be str, found : {type(body).__name__}")
+
+        data   = body.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        self._count(misses=1, bytes_downloaded=len(data))
+
+        object_file = self._object_file(digest)
+        if not os.path.exists(object_file):
+            os.makedirs(os.path.dirname(object_file), exist_ok=True)
+            tmp_file = f"{object_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, object_file)
+
+        with self._lock:
+            previous = self._conn.execute("SELECT digest FROM pages WHERE url = ?", (url,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO pages (url, digest, etag, last_modified, fetched_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+                               (url, digest, etag, last_modified, time.time(), len(data)))
+            self._conn.commit()
+
+            # the previous body of the page is removed once no url points to it
+            orphan = previous is not None and previous[0] != digest and \
+                     self._conn.execute("SELECT 1 FROM pages WHERE digest = ? LIMIT 1", (previous[0],)).fetchone() is None
+
+        if orphan and os.path.exists(self._object_file(previous[0])):
+            os.remove(self._object_file(previous[0]))
+        return body
+
+    def stats(self)-> dict:
+        """Counters of the process : lookups, fresh hits, 304, full downloads, bytes
+        not downloaded thanks to the cache and bytes downloaded
+
+            Returns:
+                dict: the counters
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def report(self, since: Optional[dict] = None)-> dict:
+        """Print the hit rate and the bytes saved, since a previous stats() for one ingest
+
+            Args:
+                since (Optional[dict], optional):
+                    counters at the start of the ingest. Defaults to None.
+
+            Returns:
+                dict: the counters of the period
+        """
+        stats = self.stats()
+        if since is not None:
+            stats = {name: stats[name] - since.get(name, 0) for name in STAT_NAMES}
+
+        hits = stats["fresh"] + stats["revalidated"]
+        print(f"http cache : {hits}/{stats['requests']} pages from the cache ({hits / max(stats['requests'], 1):.0%}, "
+              f"{stats['fresh']} fresh, {stats['revalidated']} revalidated), "
+              f"{stats['bytes_saved'] / 1024**2:.1f} MB saved, {stats['bytes_downloaded'] / 1024**2:.1f} MB downloaded")
+        return stats
+
+
+def get_rendered_key(url: str)-> str:
+    """Key of the page of url rendered by the browser, never fetched nor revalidated with requests"""
+    return f"{RENDERED_PREFIX}{url}"
+
+
+def fetch(url: str, timeout: float = TIMEOUT, entry: Optional[CacheEntry] = None)-> str:
+    """Get the html of a page through the cache of the process with requests, no
+    request for a fresh page, a conditional one for a stale page
+
+        Args:
+            url (str):
+                the url of the page
+
+            timeout (float, optional):
+                timeout of the request in seconds. Defaults to TIMEOUT.
+
+            entry (Optional[CacheEntry], optional):
+                the entry of the page if already looked up. Defaults to None.
+
+        Returns:
+            str: the html
+    """
+    cache = get_http_cache()
+    if cache is None:
+        return requests.get(url, timeout=timeout).text
+
+    entry = cache.lookup(url) if entry is None else entry
+    if entry is not None and cache.is_fresh(entry):
+        return cache.hit(entry)
+
+    response = requests.get(url, headers=cache.conditional_headers(entry), timeout=timeout)
+    if response.status_code == 304 and entry is not None:
+        return cache.not_modified(entry)
+
+    if response.status_code != 200: # error pages are not cached
+        return response.text
+
+    return cache.store(url, response.text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+# cache of the process, opened at the first page
+_CACHE      = None
+_CACHE_LOCK = threading.Lock()
+
+def get_http_cache()-> Optional[HttpCache]:
+    """Get the http cache of the process
+
+        Returns:
+            Optional[HttpCache]: the shared cache, None if it is disabled in config.ini
+    """
+    global _CACHE
+    if not HTTP_CACHE_ENABLED:
+        return None
+
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = HttpCache()
+        return _CACHE
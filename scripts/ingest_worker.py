@@ -0,0 +1,91 @@
+import argparse
+import time
+import traceback
+import sys
+sys.path.append('..')
+import scripts.job_queue as job_queue
+import scripts.storage_database as storage_database
+import scripts.driver_pool as driver_pool
+import scripts.utilities_database as utilities_database
+import configparser
+
+# Ingestion worker : runs the new queries submitted by the app (scrape -> store -> embed)
+# one after the other, so that the web workers only serve the searches.
+# Run from the root of the repo, next to the app :
+#   python -m scripts.ingest_worker
+#   python -m scripts.ingest_worker --bs4 --once
+
+# Read config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+POLL_INTERVAL = config["JOBS"].getfloat("POLL_INTERVAL")
+
+
+def run_job(job: dict, use_bs4: bool = False):
+    """Ingest the query of a job, its progress is saved in the job queue
+
+        Args:
+            job (dict):
+                the job claimed in the queue
+
+            use_bs4 (bool, optional):
+                scrape the theses pages with the asyncio fetcher instead of the driver pool. Defaults to False.
+    """
+    print(f"job {job['id']} : ingesting '{job['query']}'")
+    start = time.perf_counter()
+    job_queue.set_progress_reporter(lambda stage, done, total: job_queue.update_job(job["id"], stage, done, total))
+    # waiting for the store lock is not a dead worker, the job keeps its heartbeat
+    storage_database.set_lock_wait_callback(lambda: job_queue.touch_job(job["id"]))
+    try:
+        # ingested meanwhile by an earlier job (submitted between the check of the app and this one)
+        if utilities_database.query_already_exist(job["url_query"]):
+            print(f"job {job['id']} : '{job['query']}' already in the store")
+            job_queue.finish_job(job["id"])
+            return
+        
+        if use_bs4:
+            utilities_database.update_database_bs4(job["query"])
+        else:
+            utilities_database.update_database_selenium(job["query"])
+        job_queue.finish_job(job["id"])
+        print(f"job {job['id']} : done in {time.perf_counter() - start:.1f}s")
+
+    except Exception as error: # the worker goes on with the next jobs
+        traceback.print_exc()
+        job_queue.finish_job(job["id"], error=f"{type(error).__name__} : {error}")
+
+    finally:
+        job_queue.set_progress_reporter(None)
+        storage_database.set_lock_wait_callback(None)
+        if not use_bs4:
+            print(f"driver pool : {driver_pool.get_driver_pool().stats()}")
+
+
+def main(use_bs4: bool, once: bool, poll_interval: float):
+
+    if not use_bs4:
+        driver_pool.warm_up_in_background()
+    print(f"ingest worker ready, queue {job_queue.JOB_DATABASE_PATH}")
+
+    while True:
+        job = job_queue.claim_job()
+
+        if job is not None:
+            run_job(job, use_bs4)
+            continue
+
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="run the ingestion jobs submitted by the app")
+    parser.add_argument("--bs4", action="store_true", help="scrape the theses pages with the asyncio fetcher instead of the driver pool")
+    parser.add_argument("--once", action="store_true", help="stop when the queue is empty")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="seconds between two looks at an empty queue")
+    args = parser.parse_args()
+
+    main(args.bs4, args.once, args.poll_interval)
@@ -0,0 +1,274 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+import configparser
+
+# Read config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+JOB_DATABASE_PATH = config["JOBS"]["JOB_DATABASE_PATH"]
+JOB_TIMEOUT       = config["JOBS"].getfloat("JOB_TIMEOUT")
+
+TABLE_JOBS     = "jobs"
+STATUS_QUEUED  = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE    = "done"
+STATUS_FAILED  = "failed"
+
+# python functions
+
+@contextmanager
+def open_jobs(database_path: str = JOB_DATABASE_PATH):
+    """Open a connection to the job queue, the jobs table is created if needed.
+    The connection is in autocommit mode, a claim takes the write lock itself
+
+        Args:
+            database_path (str, optional):
+                path to the SQLite file of the queue. Defaults to JOB_DATABASE_PATH.
+
+        Yields:
+            sqlite3.Connection: the opened connection
+    """
+    folder = os.path.dirname(database_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    conn = sqlite3.connect(database_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {TABLE_JOBS} (
+                            id               INTEGER PRIMARY KEY AUTOINCREMENT,
+                            query            TEXT NOT NULL,
+                            url_query        TEXT NOT NULL,
+                            status           TEXT NOT NULL,
+                            stage            TEXT,
+                            done             INTEGER DEFAULT 0,
+                            total            INTEGER DEFAULT 0,
+                            error            TEXT,
+                            created_at       REAL,
+                            started_at       REAL,
+                            stage_started_at REAL,
+                            updated_at       REAL,
+                            finished_at      REAL,
+                            nb_requests      INTEGER DEFAULT 1
+                        )""")
+        if "nb_requests" not in [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE_JOBS})")]:
+            conn.execute(f"ALTER TABLE {TABLE_JOBS} ADD COLUMN nb_requests INTEGER DEFAULT 1")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_JOBS}_status ON {TABLE_JOBS} (status, id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_JOBS}_url_query ON {TABLE_JOBS} (url_query, status)")
+        yield conn
+    finally:
+        conn.close()
+
+
+def submit_job(query: str, url_query: str, database_path: str = JOB_DATABASE_PATH)-> int:
+    """Queue the ingestion of a new query, it is run by python -m scripts.ingest_worker.
+    Single flight : if the url query is already queued or running, no job is added and
+    the caller gets the id of that job, it waits on and shares its result
+
+        Args:
+            query (str):
+                the user query
+
+            url_query (str):
+                the canonical url query on theses.fr, key of the single flight
+
+            database_path (str, optional):
+                path to the SQLite file of the queue. Defaults to JOB_DATABASE_PATH.
+
+        Returns:
+            int: the id of the job, new or in flight
+
+        Raise:
+        ------
+            - if query is not a string
+    """
+    if not isinstance(query, str):
+        raise TypeError(f"wrong type, query should be str, found : {type(query).__name__}")
+
+    now = time.time()
+    with open_jobs(database_path) as conn:
+        # the lookup and the insert are one write transaction, two submits can't both add a job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT id FROM {TABLE_JOBS} WHERE url_query = ? AND status IN (?, ?) ORDER BY id LIMIT 1",
+                               (url_query, STATUS_QUEUED, STATUS_RUNNING)).fetchone()
+            if row is not None:
+                conn.execute(f"UPDATE {TABLE_JOBS} SET nb_requests = nb_requests + 1 WHERE id = ?", (row["id"],))
+                job_id = row["id"]
+            else:
+                job_id = conn.execute(f"INSERT INTO {TABLE_JOBS} (query, url_query, status, stage, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                      (query, url_query, STATUS_QUEUED, STATUS_QUEUED, now, now)).lastrowid
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    return job_id
+
+
+def claim_job(job_timeout: float = JOB_TIMEOUT, database_path: str = JOB_DATABASE_PATH)-> Optional[dict]:
+    """Take the oldest queued job, a running job without progress for job_timeout seconds
+    (its worker died) is taken again. Several workers can claim at once, a job is given once
+
+        Args:
+            job_timeout (float, optional):
+                seconds without progress after which a running job is run again. Defaults to JOB_TIMEOUT.
+
+            database_path (str, optional):
+                path to the SQLite file of the queue. Defaults to JOB_DATABASE_PATH.
+
+        Returns:
+            Optional[dict]: the job, None if the queue is empty
+    """
+    now = time.time()
+    with open_jobs(database_path) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT * FROM {TABLE_JOBS} WHERE status = ? OR (status = ? AND updated_at < ?) ORDER BY id LIMIT 1",
+                               (STATUS_QUEUED, STATUS_RUNNING, now - job_timeout)).fetchone()
+            if row is not None:
+                conn.execute(f"UPDATE {TABLE_JOBS} SET status = ?, stage = ?, done = 0, total = 0, started_at = ?, "
+                             f"stage_started_at = ?, updated_at = ? WHERE id = ?", (STATUS_RUNNING, "starting", now, now, now, row["id"]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    return dict(row) if row is not None else None
+
+
+def update_job(job_id: int, stage: str, done: int = 0, total: int = 0, database_path: str = JOB_DATABASE_PATH):
+    """Save the progress of a running job, the time of the stage restarts when the stage changes
+
+        Args:
+            job_id (int):
+                the id of the job
+
+            stage (str):
+                the current stage : listing, scraping, storing, embedding...
+
+            done (int, optional):
+                items of the stage done. Defaults to 0.
+
+            total (int, optional):
+                items of the stage known so far. Defaults to 0.
+    """
+    now = time.time()
+    with open_jobs(database_path) as conn:
+        conn.execute(f"UPDATE {TABLE_JOBS} SET stage_started_at = CASE WHEN stage = ? THEN stage_started_at ELSE ? END, "
+                     f"stage = ?, done = ?, total = ?, updated_at = ? WHERE id = ?", (stage, now, stage, int(done), int(total), now, job_id))
+
+
+def touch_job(job_id: int, database_path: str = JOB_DATABASE_PATH):
+    """Heartbeat of a running job that waits without progress (ex : for the store lock),
+    its stage and counts are kept, it is not run again by another worker after JOB_TIMEOUT
+
+        Args:
+            job_id (int):
+                the id of the job
+    """
+    with open_jobs(database_path) as conn:
+        conn.execute(f"UPDATE {TABLE_JOBS} SET updated_at = ? WHERE id = ? AND status = ?", (time.time(), job_id, STATUS_RUNNING))
+
+
+def finish_job(job_id: int, error: Optional[str] = None, database_path: str = JOB_DATABASE_PATH):
+    """Mark a job done, or failed with its error
+
+        Args:
+            job_id (int):
+                the id of the job
+
+            error (Optional[str], optional):
+                the error of a failed job. Defaults to None.
+    """
+    status = STATUS_DONE if error is None else STATUS_FAILED
+    now    = time.time()
+    with open_jobs(database_path) as conn:
+        conn.execute(f"UPDATE {TABLE_JOBS} SET status = ?, stage = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                     (status, status, error, now, now, job_id))
+
+
+def get_job(job_id: int, database_path: str = JOB_DATABASE_PATH)-> Optional[dict]:
+    """Get a job with its progress : stage, counts, seconds elapsed and remaining time of
+    the stage estimated from its rate, position in the queue for a queued job
+
+        Args:
+            job_id (int):
+                the id of the job
+
+            database_path (str, optional):
+                path to the SQLite file of the queue. Defaults to JOB_DATABASE_PATH.
+
+        Returns:
+            Optional[dict]: the job, None if the id is unknown
+    """
+    with open_jobs(database_path) as conn:
+        row = conn.execute(f"SELECT * FROM {TABLE_JOBS} WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["position"] = conn.execute(f"SELECT COUNT(*) FROM {TABLE_JOBS} WHERE status = ? AND id < ?",
+                                       (STATUS_QUEUED, job_id)).fetchone()[0] if job["status"] == STATUS_QUEUED else 0
+
+    now = job["finished_at"] or time.time()
+    job["elapsed"] = now - (job["started_at"] or job["created_at"])
+    job["eta"]     = None
+    if job["status"] == STATUS_RUNNING and 0 < job["done"] < job["total"]:
+        job["eta"] = (now - job["stage_started_at"]) / job["done"] * (job["total"] - job["done"])
+    return job
+
+
+def get_jobs_stats(database_path: str = JOB_DATABASE_PATH)-> dict:
+    """Number of jobs by status, and requests that joined a job in flight instead of
+    starting their own ingestion
+
+        Returns:
+            dict: status -> number of jobs, and coalesced -> number of requests
+    """
+    with open_jobs(database_path) as conn:
+        stats = {status: count for status, count in conn.execute(f"SELECT status, COUNT(*) FROM {TABLE_JOBS} GROUP BY status")}
+        stats["coalesced"] = conn.execute(f"SELECT COALESCE(SUM(nb_requests - 1), 0) FROM {TABLE_JOBS}").fetchone()[0]
+    return stats
+
+
+# progress reporter of the job run by this process, set by the ingest worker
+_REPORTER = None
+
+def set_progress_reporter(reporter: Optional[Callable[[str, int, int], None]]):
+    """Set the function called by report_progress, None to stop reporting
+
+        Args:
+            reporter (Optional[Callable[[str, int, int], None]]):
+                called with (stage, done, total)
+    """
+    global _REPORTER
+    _REPORTER = reporter
+
+
+def report_progress(stage: str, done: int = 0, total: int = 0):
+    """Report the progress of the ingestion to the job of the process, nothing is
+    done outside of the ingest worker. A failing report never stops the ingestion
+
+        Args:
+            stage (str):
+                the current stage
+
+            done (int, optional):
+                items of the stage done. Defaults to 0.
+
+            total (int, optional):
+                items of the stage known so far. Defaults to 0.
+    """
+    if _REPORTER is None:
+        return
+    try:
+        _REPORTER(stage, done, total)
+    except Exception as error:
+        print(f"job queue : progress not saved, {type(error).__name__} : {error}")
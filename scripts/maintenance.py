@@ -0,0 +1,67 @@
+import argparse
+import sys
+sys.path.append('..')
+import scripts.utilities_database as utilities_database
+import scripts.storage_database as storage_database
+import scripts.embedding_pipeline as embedding_pipeline
+import scripts.bm25_index as bm25_index
+import scripts.facet_index as facet_index
+import scripts.deduplication as deduplication
+import scripts.get_metadata_thesis_bs4 as get_metadata_thesis_bs4
+import scripts.get_metadata_thesis_selenium as get_metadata_thesis_selenium
+
+# Maintenance commands, run from the root of the repo :
+#   python -m scripts.maintenance rebuild
+#   python -m scripts.maintenance bm25
+#   python -m scripts.maintenance facets
+#   python -m scripts.maintenance dedup
+#   python -m scripts.maintenance refresh
+#   python -m scripts.maintenance export
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands of the theses store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    parser_rebuild = subparsers.add_parser("rebuild", help="embed again every these of the store and rebuild the vector store")
+    parser_rebuild.add_argument("--batch-size", type=int, default=embedding_pipeline.BATCH_SIZE, help="theses embedded at once by a process")
+    parser_rebuild.add_argument("--workers", type=int, default=embedding_pipeline.NUM_WORKERS, help="number of embedding processes")
+    
+    subparsers.add_parser("bm25", help="rebuild the BM25 index only, nothing is embedded")
+    subparsers.add_parser("facets", help="rebuild the facet index only, nothing is embedded")
+    subparsers.add_parser("dedup", help="link the duplicates of the store to their original these and remove them from the indexes")
+    
+    parser_refresh = subparsers.add_parser("refresh", help="read again the results of the stale queries, scrape and embed only their new theses")
+    parser_refresh.add_argument("--older-than", type=float, default=utilities_database.REFRESH_AFTER, help="seconds since the last refresh of a stale query")
+    parser_refresh.add_argument("--max-queries", type=int, default=utilities_database.MAX_REFRESH_QUERIES, help="queries refreshed at most")
+    parser_refresh.add_argument("--selenium", action="store_true", help="scrape the new theses with the driver pool instead of the asyncio fetcher")
+    
+    parser_export = subparsers.add_parser("export", help="export the store into an excel file")
+    parser_export.add_argument("--path", default=storage_database.EXCEL_EXPORT_PATH, help="path of the excel file, not the legacy excel store")
+    
+    args = parser.parse_args()
+    
+    if args.command == "rebuild":
+        utilities_database.rebuild_db(batch_size=args.batch_size, num_workers=args.workers)
+        
+    elif args.command == "bm25":
+        with storage_database.store_lock():
+            bm25_index.update_bm25_index(storage_database.load_all_theses(), rebuild=True)
+        
+    elif args.command == "facets":
+        with storage_database.store_lock():
+            facet_index.update_facet_index(storage_database.load_all_theses(), rebuild=True)
+        
+    elif args.command == "dedup":
+        deduplication.deduplicate_store()
+        
+    elif args.command == "refresh":
+        get_all_metadata = get_metadata_thesis_selenium.get_all_metadata_thesis if args.selenium else get_metadata_thesis_bs4.get_all_metadata_theses_bs_async
+        utilities_database.refresh_stale_queries(args.older_than, args.max_queries, get_all_metadata)
+        
+    elif args.command == "export":
+        storage_database.export_to_excel(args.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+import pandas as pd
+
+# a token is a uuid4().hex, anything else is rejected before touching the spill files
+TOKEN_PATTERN        = re.compile(r"[0-9a-f]{32}")
+# seconds between two purges of the expired spill files
+SPILL_PURGE_INTERVAL = 60
+
+
+def is_valid_token(token)-> bool:
+    """True if token has the format of the tokens given by ResultSetCache.put"""
+    return isinstance(token, str) and TOKEN_PATTERN.fullmatch(token) is not None
+
+
+class ResultSetCache:
+    """
+        In memory cache of the result sets displayed on /resultats, each result set
+        is stored under a token carried in the url so that users don't share
+        the same temporary file.
+        The cache is bounded (number of entries and memory), the least recently used
+        entries are evicted first and entries not read for ttl seconds expire.
+        If a spill path is given, evicted entries are written in json on disk
+        (no format running code when read back) and loaded back if requested again
+        before expiring, the expired spill files are purged at startup and on eviction.
+
+        Example:
+        --------
+            >>> cache = ResultSetCache(max_entries=64, max_bytes=256*1024**2, ttl=3600)
+            >>> token = cache.put(url_query, df_request)
+            >>> url_query, df_request = cache.get(token)
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 256 * 1024**2, ttl: float = 3600, spill_path: Optional[str] = None):
+
+        if not isinstance(max_entries, int) or max_entries <= 0:
+            raise TypeError(f"max_entries should be a positive int, recieved : {max_entries}")
+
+        if not isinstance(max_bytes, int) or max_bytes <= 0:
+            raise TypeError(f"max_bytes should be a positive int, recieved : {max_bytes}")
+
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.ttl         = ttl
+        self.spill_path  = spill_path
+        self.nb_bytes    = 0
+        self._last_purge = 0.0
+
+        # token -> (url_query, df, size, last access)
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+        if self.spill_path and not os.path.exists(self.spill_path):
+            os.makedirs(self.spill_path)
+        self._purge_spilled()
+
+    def _spill_file(self, token: str)-> str:
+        if not is_valid_token(token):
+            raise ValueError(f"invalid result set token : {token!r}")
+        return os.path.join(self.spill_path, f"{token}.json")
+
+    def _purge_spilled(self):
+        """Remove the expired spill files, and the pickle files of the previous versions"""
+        if not self.spill_path:
+            return
+
+        self._last_purge = time.time()
+        for name in os.listdir(self.spill_path):
+            spill_file = os.path.join(self.spill_path, name)
+            try:
+                if name.endswith(".pkl") or self._is_expired(os.path.getmtime(spill_file)):
+                    os.remove(spill_file)
+            except OSError: # removed meanwhile by another process
+                pass
+
+    def _is_expired(self, last_access: float)-> bool:
+        return self.ttl is not None and time.time() - last_access > self.ttl
+
+    def _evict(self):
+        """Remove the expired entries, then the least recently used ones until
+        the cache fits in its bounds. Must be called with the lock held
+        """
+        for token in [token for token, entry in self._entries.items() if self._is_expired(entry[3])]:
+            self.nb_bytes -= self._entries.pop(token)[2]
+
+        while self._entries and (len(self._entries) > self.max_entries or self.nb_bytes > self.max_bytes):
+            token, (url_query, df, size, last_access) = self._entries.popitem(last=False)
+            self.nb_bytes -= size
+
+            if self.spill_path:
+                spill_file = self._spill_file(token)
+                with open(f"{spill_file}.tmp", "w", encoding="utf-8") as f:
+                    json.dump({"url_query": url_query, "df": df.to_json(orient="split")}, f)
+                os.replace(f"{spill_file}.tmp", spill_file)
+
+        if self.spill_path and time.time() - self._last_purge > SPILL_PURGE_INTERVAL:
+            self._purge_spilled()
+
+    def _load_spilled(self, token: str)-> Optional[Tuple[str, pd.DataFrame]]:
+        """Load back a result set written on disk, the file is removed
+        because the entry goes back in memory
+        """
+        if not self.spill_path:
+            return None
+
+        spill_file = self._spill_file(token)
+        if not os.path.exists(spill_file):
+            return None
+
+        if self._is_expired(os.path.getmtime(spill_file)):
+            os.remove(spill_file)
+            return None
+
+        with open(spill_file, "r", encoding="utf-8") as f:
+            spilled = json.load(f)
+        os.remove(spill_file)
+
+        # the metadata are kept as strings ("2015" is not converted to a number)
+        df = pd.read_json(io.StringIO(spilled["df"]), orient="split", dtype=False, convert_dates=False)
+        return spilled["url_query"], df
+
+    def _insert(self, token: str, url_query: str, df: pd.DataFrame):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        self._entries[token] = (url_query, df, size, time.time())
+        self.nb_bytes += size
+        self._evict()
+
+    def put(self, url_query: str, df: pd.DataFrame)-> str:
+        """Store a result set and get the token to retrieve it
+
+            Args:
+                url_query (str):
+                    the url query of the result set
+
+                df (pd.DataFrame):
+                    the theses of the result set
+
+            Returns:
+                str: the token of the result set
+
+            Raise:
+            ------
+                - if df is not a DataFrame
+        """
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError(f"wrong type, df should be pd.DataFrame, found : {type(df).__name__}")
+
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._insert(token, url_query, df)
+        return token
+
+    def get(self, token: str)-> Optional[Tuple[str, pd.DataFrame]]:
+        """Get a result set given its token
+
+            Args:
+                token (str):
+                    the token returned by put
+
+            Returns:
+                Tuple[str, pd.DataFrame]: the url query and the theses, None if the token
+                is unknown, expired or malformed
+        """
+        if not is_valid_token(token):
+            return None
+
+        with self._lock:
+            entry = self._entries.get(token)
+
+            if entry is not None and self._is_expired(entry[3]):
+                self.nb_bytes -= self._entries.pop(token)[2]
+                return None
+
+            if entry is not None:
+                url_query, df, size, _ = entry
+                self._entries[token] = (url_query, df, size, time.time())
+                self._entries.move_to_end(token)
+                return url_query, df
+
+            spilled = self._load_spilled(token)
+            if spilled is None:
+                return None
+
+            self._insert(token, *spilled)
+            return spilled
+
+
+class LRUCache:
+    """
+        Thread safe least recently used cache with a bounded number of entries,
+        hits and misses are counted.
+
+        Example:
+        --------
+            >>> cache = LRUCache(max_entries=1024)
+            >>> cache.put(("all-MiniLM-L6-v2", "machine learning"), vector)
+            >>> cache.get(("all-MiniLM-L6-v2", "machine learning"))
+            >>> cache.stats()
+            {"nb_entries": 1, "max_entries": 1024, "hits": 1, "misses": 0}
+    """
+
+    def __init__(self, max_entries: int = 1024):
+
+        if not isinstance(max_entries, int) or max_entries <= 0:
+            raise TypeError(f"max_entries should be a positive int, recieved : {max_entries}")
+
+        self.max_entries = max_entries
+        self.hits        = 0
+        self.misses      = 0
+
+        self._entries = OrderedDict()
+        self._lock    = threading.Lock()
+
+    def get(self, key):
+        """Get the value of a key, None if the key is not cached"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Cache a value, the least recently used entry is evicted if the cache is full"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry, the counters are kept"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self)-> dict:
+        """Number of entries, hits and misses of the cache"""
+        with self._lock:
+            return {"nb_entries" : len(self._entries),
+                    "max_entries": self.max_entries,
+                    "hits"       : self.hits,
+                    "misses"     : self.misses}
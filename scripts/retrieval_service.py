@@ -0,0 +1,459 @@
+import os
+import time
+import threading
+from typing import Dict, List, Tuple
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from sentence_transformers import SentenceTransformer
+import sys
+sys.path.append('..')
+import scripts.get_vector_store as get_vector_store
+import scripts.sqlite_docstore as sqlite_docstore
+import scripts.result_cache as result_cache
+import scripts.embedding_pipeline as embedding_pipeline
+import configparser
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+EXACT_SEARCH_MAX_SIZE        = config["SEARCH"].getint("EXACT_SEARCH_MAX_SIZE")
+RESULT_SET_MATRIX_CACHE_SIZE = config["CACHE"].getint("RESULT_SET_MATRIX_CACHE_SIZE")
+
+# files of a vector store saved without version file, a change on one of them reloads the index
+VECTOR_STORE_FILES = [get_vector_store.INDEX_FILE, get_vector_store.IDS_FILE, get_vector_store.LEGACY_DOCSTORE_FILE,
+                      get_vector_store.EXACT_VECTORS_FILE]
+
+
+def exact_top_k(query_vector: np.ndarray, matrix: np.ndarray, norms: np.ndarray, k: int)-> Tuple[np.ndarray, np.ndarray]:
+    """Exact k nearest rows of a matrix by L2 distance, ||x||² - 2 x.q + ||q||² for every
+    row with one matrix-vector product, then a partial sort of the k smallest
+
+        Args:
+            query_vector (np.ndarray):
+                the (d,) query vector
+
+            matrix (np.ndarray):
+                the (n, d) float32 vectors
+
+            norms (np.ndarray):
+                the squared norm of each row of matrix
+
+            k (int):
+                number of rows to return
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the k closest rows, the closest first, and their squared distance
+    """
+    distances = norms - 2 * (matrix @ query_vector) + query_vector @ query_vector
+    k         = min(k, matrix.shape[0])
+    top       = np.argpartition(distances, k - 1)[:k] if matrix.shape[0] > k else np.arange(matrix.shape[0])
+    top       = top[np.argsort(distances[top], kind="stable")]
+
+    return top, distances[top]
+
+
+class RetrievalService:
+    """
+        Long lived holder of the embedding model and of the vector store, shared by
+        every request and thread of the process. The model is loaded once, the
+        vector store is loaded once and reloaded only when its files change on disk
+        (after an update of the database for example).
+        Load and search timings are kept to check the cost of a request.
+
+        Example:
+        --------
+            >>> service = get_retrieval_service("all-MiniLM-L6-v2", "./static/vector_store")
+            >>> service.similarity_search("machine learning", 10)
+            [Document, Document...]
+            >>> service.stats()
+    """
+
+    def __init__(self, model_name: str, vector_store_path: str):
+
+        if not isinstance(model_name, str):
+            raise TypeError(f"wrong type object, expected str, got : {type(model_name).__name__}")
+
+        if not isinstance(vector_store_path, str):
+            raise TypeError(f"wrong type object, expected str, got : {type(vector_store_path).__name__}")
+
+        self.model_name        = model_name
+        self.vector_store_path = vector_store_path
+
+        self._embeddings       = None
+        self._db               = None
+        self._db_version       = None
+        # (vector store, docstore id -> position in the index, version, exact vectors), swapped together on reload
+        self._loaded           = (None, {}, None, None)
+        self._lock             = threading.RLock()
+        # (version, positions) -> (positions, vectors, squared norms) of a result set
+        self._matrix_cache     = result_cache.LRUCache(RESULT_SET_MATRIX_CACHE_SIZE)
+
+        self.timings = {"model_load_seconds"  : None,
+                        "index_load_seconds"  : None,
+                        "nb_index_loads"      : 0,
+                        "nb_searches"         : 0,
+                        "nb_exact_searches"   : 0,
+                        "last_search_seconds" : None,
+                        "total_search_seconds": 0.0}
+
+    @property
+    def embeddings(self)-> embedding_pipeline.SentenceTransformerEmbeddings:
+        """The embedding model, loaded at the first call only. The SentenceTransformer
+        embeds the queries and the batches of theses of the process"""
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    start = time.perf_counter()
+                    self._embeddings = embedding_pipeline.SentenceTransformerEmbeddings(SentenceTransformer(self.model_name), self.model_name)
+                    self.timings["model_load_seconds"] = time.perf_counter() - start
+                    print(f"embedding model {self.model_name} loaded in {self.timings['model_load_seconds']:.2f}s")
+        return self._embeddings
+
+    def get_files_version(self)-> Tuple[float, ...]:
+        """Modification time of the version file bumped by each save of the vector store,
+        or of every file of a vector store saved without it, used to detect a new index on disk
+
+            Returns:
+                Tuple[float, ...]: the mtime of each file, None for missing files
+        """
+        version_file = os.path.join(self.vector_store_path, get_vector_store.VERSION_FILE)
+        if os.path.exists(version_file):
+            return (os.path.getmtime(version_file),)
+        
+        version = []
+        for name in VECTOR_STORE_FILES:
+            path = os.path.join(self.vector_store_path, name)
+            version.append(os.path.getmtime(path) if os.path.exists(path) else None)
+        return tuple(version)
+
+    def get_vector_store(self)-> FAISS:
+        """The vector store, loaded from disk at the first call or if the files changed
+
+            Returns:
+                FAISS: the vector store
+        """
+        version = self.get_files_version()
+
+        if self._db is None or version != self._db_version:
+            with self._lock:
+                if self._db is None or version != self._db_version:
+                    start = time.perf_counter()
+                    db = get_vector_store.load_vector_store(self.vector_store_path, self.embeddings)
+                    # a load during a save waits for its files, the version read before is then
+                    # older than the loaded files and the next call loads them again
+                    position_of_id = {docstore_id: position for position, docstore_id in db.index_to_docstore_id.items()}
+                    exact_vectors  = db.exact_vectors
+                    # an IVF index reconstructs the vectors of a result set by position with a direct
+                    # map only, built here once before the index is shared with the request threads
+                    index_ivf = faiss.try_extract_index_ivf(db.index)
+                    if exact_vectors is None and index_ivf is not None:
+                        index_ivf.make_direct_map()
+                    # swap the references, requests already searching keep the previous index
+                    self._db, self._db_version, self._loaded = db, version, (db, position_of_id, version, exact_vectors)
+                    self._matrix_cache.clear()
+                    self.timings["index_load_seconds"] = time.perf_counter() - start
+                    self.timings["nb_index_loads"]    += 1
+                    print(f"vector store {self.vector_store_path} loaded in {self.timings['index_load_seconds']:.2f}s, {db.index.ntotal} docs")
+        return self._db
+
+    def get_loaded_vector_store(self)-> Tuple[FAISS, Dict[str, int], Tuple[float, ...], np.ndarray]:
+        """The vector store, the position of each docstore id in its index, the
+        version of the files and the exact vectors of a reduced precision index,
+        all come from the same load
+
+            Returns:
+                Tuple[FAISS, Dict[str, int], Tuple[float, ...], np.ndarray]: the vector store, the positions,
+                the version and the float32 vectors (None for a float32 index)
+        """
+        self.get_vector_store()
+        return self._loaded
+
+    def get_version(self)-> Tuple[float, ...]:
+        """Version of the loaded vector store, it changes each time the index is reloaded
+
+            Returns:
+                Tuple[float, ...]: the version
+        """
+        return self.get_loaded_vector_store()[2]
+
+    def get_positions(self, ids: List[int], position_of_id: Dict[str, int])-> np.ndarray:
+        """Positions in the FAISS index of the documents given their Id in the store
+
+            Args:
+                ids (List[int]):
+                    the Id of the documents
+
+                position_of_id (Dict[str, int]):
+                    position of each docstore id in the index
+
+            Returns:
+                np.ndarray: the positions, the Id not indexed are skipped
+        """
+        positions = [position_of_id[str(i)] for i in ids if str(i) in position_of_id]
+        return np.array(positions, dtype=np.int64)
+
+    def _record_search(self, elapsed: float, exact: bool = False):
+        with self._lock:
+            self.timings["nb_searches"]          += 1
+            self.timings["nb_exact_searches"]    += int(exact)
+            self.timings["last_search_seconds"]   = elapsed
+            self.timings["total_search_seconds"] += elapsed
+
+    def embed_query(self, query: str)-> np.ndarray:
+        """Embed a query with the resident model
+
+            Args:
+                query (str):
+                    the query string
+
+            Returns:
+                np.ndarray: the float32 vector of the query
+        """
+        return np.array(self.embeddings.embed_query(query), dtype=np.float32)
+
+    def rescore(self, query_vector: np.ndarray, indices: np.ndarray, exact_vectors: np.ndarray, k: int)-> Tuple[np.ndarray, np.ndarray]:
+        """Sort candidates of a reduced precision index by their exact L2 distance,
+        only the rows of the candidates are read in the float32 vectors
+
+            Args:
+                query_vector (np.ndarray):
+                    the (1, d) query vector, normalized like the index
+
+                indices (np.ndarray):
+                    positions in the index of the candidates
+
+                exact_vectors (np.ndarray):
+                    the (ntotal, d) float32 vectors of the index
+
+                k (int):
+                    number of positions to return
+
+            Returns:
+                Tuple[np.ndarray, np.ndarray]: the k closest positions, the closest first, and their exact distance
+        """
+        indices   = np.sort(indices[indices != -1]) # sorted rows are read sequentially in the memmap
+        distances = ((exact_vectors[indices] - query_vector) ** 2).sum(axis=1)
+        order     = np.argsort(distances, kind="stable")[:k]
+        return indices[order], distances[order]
+
+    def get_result_set_matrix(self, db: FAISS, positions: np.ndarray, exact_vectors: np.ndarray,
+                              version: Tuple[float, ...])-> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Vectors of a result set as one contiguous matrix, kept in a LRU cache until
+        the index is reloaded. The vectors are read in the float32 copy of a reduced
+        precision index, otherwise they are reconstructed from the FAISS index
+
+            Args:
+                db (FAISS):
+                    the vector store
+
+                positions (np.ndarray):
+                    positions in the index of the documents of the result set
+
+                exact_vectors (np.ndarray):
+                    the float32 vectors of a reduced precision index, None for a float32 index
+
+                version (Tuple[float, ...]):
+                    version of the loaded vector store
+
+            Returns:
+                Tuple[np.ndarray, np.ndarray, np.ndarray]: the sorted positions, their (n, d)
+                vectors and the squared norm of each vector
+        """
+        positions = np.unique(positions)
+        key       = (version, positions.tobytes())
+        cached    = self._matrix_cache.get(key)
+
+        if cached is not None:
+            return cached
+
+        if exact_vectors is not None:
+            matrix = np.ascontiguousarray(exact_vectors[positions], dtype=np.float32)
+        else: # the direct map of an IVF index is built by get_vector_store
+            matrix = db.index.reconstruct_batch(positions)
+
+        cached = (positions, matrix, np.einsum("ij,ij->i", matrix, matrix))
+        self._matrix_cache.put(key, cached)
+        return cached
+
+    def exact_search(self, query_vector: np.ndarray, positions: np.ndarray, k: int, db: FAISS,
+                     exact_vectors: np.ndarray, version: Tuple[float, ...])-> Tuple[np.ndarray, np.ndarray]:
+        """Exact L2 search over the vectors of a result set, one matrix-vector product
+        and a partial sort of the k smallest distances
+
+            Args:
+                query_vector (np.ndarray):
+                    the (d,) query vector, normalized like the index
+
+                positions (np.ndarray):
+                    positions in the index of the documents of the result set
+
+                k (int):
+                    number of positions to return
+
+                db, exact_vectors, version:
+                    see get_result_set_matrix
+
+            Returns:
+                Tuple[np.ndarray, np.ndarray]: the k closest positions, the closest first, and their distance
+        """
+        positions, matrix, norms = self.get_result_set_matrix(db, positions, exact_vectors, version)
+        top, distances = exact_top_k(query_vector, matrix, norms, k)
+
+        return positions[top], distances
+
+    def search_ids(self, query_vector: np.ndarray, k: int, ids: List[int], with_distances: bool = False)-> List[str]:
+        """Search the k nearest documents of the query vector among the given Id only,
+        an ID selector restricts the FAISS search so documents of other result sets
+        are never returned, without Id the whole index is searched.
+        Result sets of at most EXACT_SEARCH_MAX_SIZE documents are searched exactly with
+        numpy on their cached vectors, larger ones with the FAISS index.
+        With a float16, int8 or PQ index, RERANK_FACTOR * k candidates are searched
+        and sorted again by their exact distance
+
+            Args:
+                query_vector (np.ndarray):
+                    the vector of the query
+
+                k (int):
+                    number of documents to return
+
+                ids (List[int]):
+                    Id in the store of the candidate documents, None for every document of the index
+
+                with_distances (bool, optional):
+                    return the L2 distance of each document too. Defaults to False.
+
+            Returns:
+                List[str]: the docstore ids of the documents, the most similar first,
+                (docstore id, distance) tuples if with_distances
+        """
+        db, position_of_id, version, exact_vectors = self.get_loaded_vector_store()
+
+        start = time.perf_counter()
+        positions = self.get_positions(ids, position_of_id) if ids is not None else np.arange(db.index.ntotal, dtype=np.int64)
+        if len(positions) == 0:
+            if ids is not None and len(ids) > 0:
+                print("none of the theses is in the vector store, run : python -m scripts.maintenance rebuild")
+            return []
+
+        query_vector = np.array([query_vector], dtype=np.float32)
+        if db._normalize_L2:
+            faiss.normalize_L2(query_vector)
+
+        if len(positions) <= EXACT_SEARCH_MAX_SIZE:
+            indices, distances = self.exact_search(query_vector[0], positions, k, db, exact_vectors, version)
+            self._record_search(time.perf_counter() - start, exact=True)
+            return self.get_docstore_ids(db, indices, distances, with_distances)
+
+        rescoring = exact_vectors is not None and get_vector_store.RERANK_FACTOR > 0
+        nb_search = k * get_vector_store.RERANK_FACTOR if rescoring else k
+
+        params = get_vector_store.get_search_parameters(db.index, faiss.IDSelectorBatch(positions) if ids is not None else None)
+        distances, indices = db.index.search(query_vector, min(nb_search, len(positions)), params=params)
+        if rescoring:
+            indices, distances = self.rescore(query_vector, indices[0], exact_vectors, k)
+        else:
+            indices, distances = indices[0], distances[0]
+        self._record_search(time.perf_counter() - start)
+
+        return self.get_docstore_ids(db, indices, distances, with_distances)
+
+    def get_docstore_ids(self, db: FAISS, indices: np.ndarray, distances: np.ndarray, with_distances: bool)-> List[str]:
+        """Docstore ids of the positions found by a search, -1 positions are skipped"""
+        if with_distances:
+            return [(db.index_to_docstore_id[i], distance) for i, distance in zip(indices.tolist(), distances.tolist()) if i != -1]
+        return [db.index_to_docstore_id[i] for i in indices.tolist() if i != -1]
+
+    def get_documents(self, docstore_ids: List[str])-> List[Document]:
+        """Get the documents of the vector store given their docstore id
+
+            Args:
+                docstore_ids (List[str]):
+                    the docstore ids
+
+            Returns:
+                List[Document]: the documents in the same order
+        """
+        db = self.get_vector_store()
+
+        if isinstance(db.docstore, sqlite_docstore.SQLiteDocstore): # one query on the store for all the hits
+            return db.docstore.search_many(docstore_ids)
+        return [db.docstore.search(docstore_id) for docstore_id in docstore_ids]
+
+    def similarity_search(self, query: str, k: int, filter: dict = None, ids: List[int] = None)-> List[Document]:
+        """Search the k most similar documents of the vector store
+
+            Args:
+                query (str):
+                    the query string to search for
+
+                k (int):
+                    number of documents to return
+
+                filter (dict, optional):
+                    filter on the metadata. Defaults to None.
+
+                ids (List[int], optional):
+                    Id in the store of the documents of the current result set, the search
+                    is restricted to them. Defaults to None, the whole vector store.
+
+            Returns:
+                List[Document]: the most similar documents
+        """
+        if ids is not None:
+            return self.get_documents(self.search_ids(self.embed_query(query), k, ids))
+
+        db = self.get_vector_store()
+
+        start = time.perf_counter()
+        result_docs = db.similarity_search(query, k, filter=filter or None)
+        self._record_search(time.perf_counter() - start)
+
+        return result_docs
+
+    def stats(self)-> Dict[str, float]:
+        """Load and search timings of the service
+
+            Returns:
+                Dict[str, float]: the timings
+        """
+        with self._lock:
+            stats = dict(self.timings)
+        stats["mean_search_seconds"] = stats["total_search_seconds"] / stats["nb_searches"] if stats["nb_searches"] else None
+        stats["model_name"]          = self.model_name
+        stats["vector_store_path"]   = self.vector_store_path
+        stats["nb_docs"]             = self._db.index.ntotal if self._db is not None else None
+        stats["index"]               = type(self._db.index).__name__ if self._db is not None else None
+        stats["rescoring"]           = self._loaded[3] is not None and get_vector_store.RERANK_FACTOR > 0
+        stats["result_set_matrices"] = self._matrix_cache.stats()
+        return stats
+
+
+# one service per (model, vector store) in the process
+_SERVICES      = {}
+_SERVICES_LOCK = threading.Lock()
+
+def get_retrieval_service(model_name: str, vector_store_path: str)-> RetrievalService:
+    """Get the retrieval service of the process for a model and a vector store,
+    it is created at the first call
+
+        Args:
+            model_name (str):
+                name of the embedding model
+
+            vector_store_path (str):
+                path where the vector store is
+
+        Returns:
+            RetrievalService: the shared service
+    """
+    key = (model_name, os.path.abspath(vector_store_path))
+
+    with _SERVICES_LOCK:
+        if key not in _SERVICES:
+            _SERVICES[key] = RetrievalService(model_name, vector_store_path)
+        return _SERVICES[key]
@@ -1,128 +1,436 @@
-import pandas as pd
-import numpy as np
-from typing import Union, List, Dict, Tuple
-from rank_bm25 import BM25Okapi
-
-# libraries HuggingFace, LangChain, Faiss
-from langchain_huggingface import HuggingFaceEmbeddings
-import sys
-sys.path.append('..')
-import scripts.get_vector_store as get_vector_store
-
-
-
-
-def get_bm25_similar_paragraphs(query: Union[str, List[str]],
-                                paragraphs: List[str],
-                                nb_results: int = 5):# -> List[Tuple[str, float]]:
-    """
-    Get similar paragraphs based on the query using the BM25 model.
-
-    Args:
-        query: Union[str, List[str]]
-            The query string to search for.
-
-        paragraphs: List[str]
-            A list of paragraphs to search within.
-
-        nb_results: int
-            The number of similar paragraphs to return. Default is 5.
-
-        sanity_check: bool
-            Whether to check if the test names are in the dictionary. Default is True.
-
-    Returns:
-        List[Tuple[str, float]]
-            A list of tuples with the matched paragraphs and their similarity scores.
-
-    Examples:
-    --------
-    >>> get_bm25_similar_paragraphs("This is a test sentence", ["This is a test sentence", "This is another test sentence"], nb_results=1)
-    [('This is a test sentence', 0, 1.0)]
-    """
-    query = query.split()
-
-    bm25 = BM25Okapi(paragraphs)
-    bm25_scores = bm25.get_scores(query)
-
-    similar_paragraphs = [(paragraphs[idx], idx, score) for \
-                           idx, score in enumerate(bm25_scores)]
-
-
-    return sorted(similar_paragraphs, key=lambda x: x[2], reverse=True)[:nb_results]
-
-def get_hugging_face_similar_paragraphs(query: Union[str, List[str]],
-                                        paragraphs: List[str],
-                                        filter,
-                                        model_path : str,
-                                        vector_store_path: str,
-                                        nb_results: int = 5
-                                        ):# -> List[Tuple[str, float]]:
-    """
-        Get similar paragraphs based on the query using the HuggingFaceTransformer and
-        Faiss as vector stores. Note that we don't need to tokenize sequences
-
-        Args:
-            query: Union[str, List[str]]
-                The query string to search for.
-
-            paragraphs: List[str]
-                A list of paragraphs to search within.
-
-            name_vector_store: str
-                name of the vector store, either requirement (faiss_index_req_desc) or test description (faiss_index_test_desc)
-
-            nb_results: int
-                The number of similar paragraphs to return. Default is 5.
-
-            sanity_check: bool
-                Whether to check if the test names are in the dictionary. Default is True.
-
-        Returns:
-            List[Tuple[str, float]]
-                A list of tuples with the matched paragraphs and their similarity scores.
-
-        Examples:
-        --------
-            >>> get_hugging_face_similar_paragraphs("This is a test sentence", ["This is a test sentence", "This is another test sentence"], "faiss_index_req_desc",
-                                            nb_results=1)
-            [Document, Document...]
-
-    """
-    
-    #load local vector stores
-    embeddings = HuggingFaceEmbeddings(model_name= model_path)
-    db = get_vector_store.load_vector_store(vector_store_path, embeddings)
-
-    result_docs = db.similarity_search(query, len(paragraphs), filter=filter)
-
-    return result_docs[:nb_results]
-
-
-def get_similar_paragraphs(query: str,                     
-                             paragraphs: Union[Dict[str, str], 
-                                                    pd.DataFrame, 
-                                                    List[Dict[str, str]], 
-                                                    List[pd.DataFrame]],
-                             filter,
-                             model: str,
-                             vector_store_path: str,
-                             nb_similar_req: Union[str, int] = 1): #-> Dict[str, str]:
-
-    nb_similar_paragraph = len(paragraphs) if (isinstance(nb_similar_req, str) and nb_similar_req.upper() in ['ALL', 'MAX']) else nb_similar_req
-
-    if model == 'BM25':
-        matching_descriptions = get_bm25_similar_paragraphs(query, paragraphs, 
-                                                            nb_similar_paragraph)
-        
-    elif model == 'all-MiniLM-L6-v2':
-        matching_descriptions = get_hugging_face_similar_paragraphs(query, paragraphs, filter, "all-MiniLM-L6-v2", vector_store_path, 
-                                                                    nb_similar_paragraph)
-
-    else:
-        print("------------------\nERROR \n--------------------\nplease enter a valid model name")
-        print("BM25 or AllMini")
-        return None
-
-    return matching_descriptions
-
+import hashlib
+import threading
+import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, List, Dict, Tuple
+import sys
+sys.path.append('..')
+import scripts.retrieval_service as retrieval_service
+import scripts.result_cache as result_cache
+import scripts.bm25_index as bm25_index
+import scripts.facet_index as facet_index
+import scripts.storage_database as storage_database
+import scripts.sqlite_docstore as sqlite_docstore
+import configparser
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+MODEL_EMBEDDING            = config["DEFAULT"]["MODEL_EMBEDDING"]
+QUERY_EMBEDDING_CACHE_SIZE = config["CACHE"].getint("QUERY_EMBEDDING_CACHE_SIZE")
+QUERY_RESULTS_CACHE_SIZE   = config["CACHE"].getint("QUERY_RESULTS_CACHE_SIZE")
+FUSION                     = config["SEARCH"]["FUSION"].upper()
+RRF_K                      = config["SEARCH"].getint("RRF_K")
+DENSE_WEIGHT               = config["SEARCH"].getfloat("DENSE_WEIGHT")
+HYBRID_DEPTH               = config["SEARCH"].getint("HYBRID_DEPTH")
+FUSIONS                    = ["RRF", "WEIGHTED"]
+
+# (model, query) -> query vector
+EMBEDDING_CACHE = result_cache.LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+# (model, vector store, index version, query, digest of the result set ids, k) -> ranked docstore ids
+RESULTS_CACHE   = result_cache.LRUCache(QUERY_RESULTS_CACHE_SIZE)
+# index version of the cached ranked ids of each vector store, read and updated by the request threads
+_RESULTS_CACHE_VERSION      = {}
+_RESULTS_CACHE_VERSION_LOCK = threading.Lock()
+# the dense and the BM25 retrievers of a HYBRID search run side by side
+HYBRID_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid_search")
+
+
+
+
+def get_bm25_similar_paragraphs(query: Union[str, List[str]],
+                                paragraphs: List[str],
+                                nb_results: int = 5,
+                                ids: List[int] = None,
+                                bm25_index_path: str = bm25_index.BM25_INDEX_PATH):# -> List[Document]:
+    """
+    Get similar paragraphs based on the query using the persisted BM25 index of the store.
+
+    Args:
+        query: Union[str, List[str]]
+            The query string to search for.
+
+        paragraphs: List[str]
+            A list of paragraphs to search within, only used for the number of results.
+
+        nb_results: int
+            The number of similar paragraphs to return. Default is 5.
+
+        ids: List[int]
+            Id in the store of the theses of the current result set, the search only
+            runs over them. Default is None, every these of the index.
+
+        bm25_index_path: str
+            Folder of the BM25 index. Default is BM25_INDEX_PATH.
+
+    Returns:
+        List[Document]
+            The theses containing terms of the query, the best first, their BM25
+            score is in the metadata.
+
+    Examples:
+    --------
+    >>> get_bm25_similar_paragraphs("deep learning", df["content"].tolist(), nb_results=1, ids=df["Id"].tolist())
+    [Document(metadata={"Id": 12, "bm25_score": 7.1, ...}, page_content="...")]
+    """
+    if isinstance(query, list):
+        query = " ".join(query)
+
+    scores    = dict(bm25_index.get_bm25_index(bm25_index_path).search(query, nb_results, ids))
+    documents = sqlite_docstore.SQLiteDocstore().search_many([str(doc_id) for doc_id in scores])
+
+    for document in documents:
+        document.metadata["bm25_score"] = scores[int(document.id)]
+
+    return documents
+
+def get_query_embedding(query: str, service: retrieval_service.RetrievalService):
+    """
+        Embed the query with the model of the service, the vectors of the queries
+        already seen are taken from the cache
+
+        Args:
+            query: str
+                The query string.
+
+            service: RetrievalService
+                The retrieval service with the embedding model.
+
+        Returns:
+            np.ndarray
+                The vector of the query.
+    """
+    key          = (service.model_name, query)
+    query_vector = EMBEDDING_CACHE.get(key)
+
+    if query_vector is None:
+        query_vector = service.embed_query(query)
+        EMBEDDING_CACHE.put(key, query_vector)
+
+    return query_vector
+
+def get_ids_key(ids: List[int]):
+    """
+        Key of a set of candidate Id in the ranked ids cache : their number and a 16 bytes
+        digest, the list itself is neither kept in the cache nor hashed as a tuple
+
+        Args:
+            ids: List[int]
+                Id in the store of the candidates, None for the whole store.
+
+        Returns:
+            Tuple[int, bytes]
+                The key, None for the whole store.
+    """
+    if ids is None:
+        return None
+
+    ids = np.asarray(ids, dtype=np.int64)
+    return (ids.shape[0], hashlib.blake2b(ids.tobytes(), digest_size=16).digest())
+
+def get_ranked_ids(query: str, 
+                   service: retrieval_service.RetrievalService, 
+                   ids: List[int], 
+                   nb_results: int,
+                   with_distances: bool = False):
+    """
+        Docstore ids of the nb_results documents of the result set the most similar to the
+        query. Ranked ids are cached per index version, the cache is emptied when the
+        vector store is reloaded so that results of a previous index are never served.
+        The result set is keyed by the digest of its ids, see get_ids_key
+
+        Args:
+            query: str
+                The query string.
+
+            service: RetrievalService
+                The retrieval service with the vector store.
+
+            ids: List[int]
+                Id in the store of the theses of the result set, None for the whole store.
+
+            nb_results: int
+                The number of ids to return.
+
+            with_distances: bool
+                Return the L2 distance of each id too. Default is False.
+
+        Returns:
+            List[str]
+                The docstore ids, the most similar first, (docstore id, distance) if with_distances.
+    """
+    version     = service.get_version()
+    service_key = (service.model_name, service.vector_store_path)
+
+    with _RESULTS_CACHE_VERSION_LOCK:
+        if _RESULTS_CACHE_VERSION.get(service_key, version) != version:
+            RESULTS_CACHE.clear()
+        _RESULTS_CACHE_VERSION[service_key] = version
+
+    key        = service_key + (version, query, get_ids_key(ids), nb_results, with_distances)
+    ranked_ids = RESULTS_CACHE.get(key)
+
+    if ranked_ids is None:
+        ranked_ids = service.search_ids(get_query_embedding(query, service), nb_results, ids, with_distances)
+        RESULTS_CACHE.put(key, ranked_ids)
+
+    return ranked_ids
+
+def get_cache_stats():
+    """
+        Hits and misses of the query embedding and ranked ids caches
+
+        Returns:
+            Dict[str, dict]
+                The stats of each cache.
+    """
+    return {"query_embedding_cache": EMBEDDING_CACHE.stats(),
+            "query_results_cache"  : RESULTS_CACHE.stats()}
+
+def get_hugging_face_similar_paragraphs(query: Union[str, List[str]],
+                                        paragraphs: List[str],
+                                        filter,
+                                        model_path : str,
+                                        vector_store_path: str,
+                                        nb_results: int = 5,
+                                        ids: List[int] = None
+                                        ):# -> List[Tuple[str, float]]:
+    """
+        Get similar paragraphs based on the query using the HuggingFaceTransformer and
+        Faiss as vector stores. Note that we don't need to tokenize sequences
+
+        Args:
+            query: Union[str, List[str]]
+                The query string to search for.
+
+            paragraphs: List[str]
+                A list of paragraphs to search within.
+
+            name_vector_store: str
+                name of the vector store, either requirement (faiss_index_req_desc) or test description (faiss_index_test_desc)
+
+            nb_results: int
+                The number of similar paragraphs to return. Default is 5.
+
+            ids: List[int]
+                Id in the store of the theses of the current result set, the search only
+                runs over them. Default is None, the whole vector store is searched.
+
+        Returns:
+            List[Tuple[str, float]]
+                A list of tuples with the matched paragraphs and their similarity scores.
+
+        Raise:
+        ------
+            - if nb_results is not a positive int
+
+        Examples:
+        --------
+            >>> get_hugging_face_similar_paragraphs("This is a test sentence", ["This is a test sentence", "This is another test sentence"], "faiss_index_req_desc",
+                                            nb_results=1)
+            [Document, Document...]
+
+    """
+    
+    if not isinstance(nb_results, (int, np.integer)) or nb_results <= 0:
+        raise TypeError(f"nb_results should be a positive int, recieved : {nb_results}")
+
+    # model and vector store are resident in the process, loaded once and reloaded if the index changed on disk
+    service = retrieval_service.get_retrieval_service(model_path, vector_store_path)
+
+    if ids is not None or not filter: # result set or whole store, no over fetch
+        return service.get_documents(get_ranked_ids(query, service, ids, nb_results))
+
+    # metadata filter of the vector store, the whole store is searched
+    return service.similarity_search(query, nb_results, filter=filter)
+
+def normalize_scores(scores: Dict[str, float])-> Dict[str, float]:
+    """
+        Min-max normalization of the scores of a retriever in [0, 1].
+
+        Args:
+            scores: Dict[str, float]
+                Score of each docstore id, the higher the better.
+
+        Returns:
+            Dict[str, float]
+                The normalized scores, 1 for every id if all the scores are equal.
+    """
+    if len(scores) == 0:
+        return {}
+
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {docstore_id: 1.0 for docstore_id in scores}
+
+    return {docstore_id: (score - low) / (high - low) for docstore_id, score in scores.items()}
+
+def fuse_rankings(dense: List[Tuple[str, float]],
+                  lexical: List[Tuple[str, float]],
+                  nb_results: int,
+                  fusion: str = FUSION,
+                  rrf_k: int = RRF_K,
+                  dense_weight: float = DENSE_WEIGHT):
+    """
+        Merge the rankings of the dense and the BM25 retrievers.
+
+        Args:
+            dense: List[Tuple[str, float]]
+                (docstore id, L2 distance) of the dense retriever, the closest first.
+
+            lexical: List[Tuple[str, float]]
+                (docstore id, BM25 score) of the BM25 retriever, the best first.
+
+            nb_results: int
+                The number of ids to return.
+
+            fusion: str
+                RRF, sum of 1 / (rrf_k + rank) in each ranking, or WEIGHTED, weighted sum of the
+                min-max normalized scores. Default is FUSION.
+
+            rrf_k: int
+                Rank offset of RRF. Default is RRF_K.
+
+            dense_weight: float
+                Weight of the dense scores with WEIGHTED, 1 - dense_weight for BM25. Default is DENSE_WEIGHT.
+
+        Returns:
+            List[Tuple[str, float]]
+                (docstore id, fused score), the best first.
+
+        Raise:
+        ------
+            - if fusion is unknown
+    """
+    fusion = fusion.upper()
+    if fusion not in FUSIONS:
+        raise TypeError(f"unknown fusion {fusion}, expected one of : {FUSIONS}")
+
+    fused = {}
+    if fusion == "RRF":
+        for ranking in [dense, lexical]:
+            for rank, (docstore_id, _) in enumerate(ranking, start=1):
+                fused[docstore_id] = fused.get(docstore_id, 0.0) + 1.0 / (rrf_k + rank)
+    else:
+        # the smaller the distance the better
+        dense_scores   = normalize_scores({docstore_id: -distance for docstore_id, distance in dense})
+        lexical_scores = normalize_scores(dict(lexical))
+        for docstore_id in set(dense_scores) | set(lexical_scores):
+            fused[docstore_id] = dense_weight * dense_scores.get(docstore_id, 0.0) + (1 - dense_weight) * lexical_scores.get(docstore_id, 0.0)
+
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:nb_results]
+
+def get_hybrid_similar_paragraphs(query: str,
+                                  paragraphs: List[str],
+                                  model_path: str,
+                                  vector_store_path: str,
+                                  nb_results: int = 5,
+                                  ids: List[int] = None,
+                                  fusion: str = FUSION,
+                                  bm25_index_path: str = bm25_index.BM25_INDEX_PATH):# -> List[Document]:
+    """
+        Get similar paragraphs with the dense and the BM25 retrievers over the same candidates,
+        the two retrievers run concurrently and their rankings are merged by fuse_rankings.
+        Titles and authors are better found by BM25, abstracts by the embeddings.
+
+        Args:
+            query: str
+                The query string to search for.
+
+            paragraphs: List[str]
+                A list of paragraphs to search within, only used for the number of results.
+
+            model_path: str
+                The embedding model of the dense retriever.
+
+            vector_store_path: str
+                The vector store of the dense retriever.
+
+            nb_results: int
+                The number of similar paragraphs to return. Default is 5.
+
+            ids: List[int]
+                Id in the store of the theses of the current result set. Default is None,
+                every these of the store.
+
+            fusion: str
+                RRF or WEIGHTED. Default is FUSION.
+
+            bm25_index_path: str
+                Folder of the BM25 index. Default is BM25_INDEX_PATH.
+
+        Returns:
+            List[Document]
+                The theses, the best first, the fused score is in the metadata.
+
+        Examples:
+        --------
+            >>> get_hybrid_similar_paragraphs("Marie Curie radioactivité", df["content"].tolist(), "all-MiniLM-L6-v2",
+                                              "./static/vector_store", nb_results=10, ids=df["Id"].tolist())
+            [Document, Document...]
+    """
+    service = retrieval_service.get_retrieval_service(model_path, vector_store_path)
+    depth   = max(nb_results, HYBRID_DEPTH)
+
+    # without result set both retrievers search their whole index
+    dense   = HYBRID_EXECUTOR.submit(get_ranked_ids, query, service, ids, depth, True)
+    lexical = HYBRID_EXECUTOR.submit(bm25_index.get_bm25_index(bm25_index_path).search, query, depth, ids)
+
+    lexical = [(str(doc_id), score) for doc_id, score in lexical.result()]
+    fused   = fuse_rankings(dense.result(), lexical, nb_results, fusion)
+
+    scores    = dict(fused)
+    documents = service.get_documents([docstore_id for docstore_id, _ in fused])
+
+    for document in documents:
+        document.metadata["hybrid_score"] = scores.get(document.id)
+
+    return documents
+
+def get_similar_paragraphs(query: str,                     
+                             paragraphs: Union[Dict[str, str], 
+                                                    pd.DataFrame, 
+                                                    List[Dict[str, str]], 
+                                                    List[pd.DataFrame]],
+                             filter,
+                             model: str,
+                             vector_store_path: str,
+                             nb_similar_req: Union[str, int] = 1,
+                             ids: List[int] = None): #-> Dict[str, str]:
+
+    nb_similar_paragraph = len(paragraphs) if (isinstance(nb_similar_req, str) and nb_similar_req.upper() in ['ALL', 'MAX']) else nb_similar_req
+
+    # the filter is resolved into candidate ids before scoring, so every model applies it :
+    # the facets on the facet index, the other keys on the metadata of the store
+    facet_filters    = {key: value for key, value in (filter or {}).items() if key in facet_index.FACETS}
+    metadata_filters = {key: value for key, value in (filter or {}).items() if key not in facet_index.FACETS}
+
+    if len(facet_filters) > 0:
+        ids = facet_index.filter_ids(facet_filters, ids)
+    if len(metadata_filters) > 0 and (ids is None or len(ids) > 0):
+        ids = storage_database.filter_ids(metadata_filters, ids)
+    if ids is not None and len(ids) == 0:
+        return []
+
+    if model == 'BM25':
+        matching_descriptions = get_bm25_similar_paragraphs(query, paragraphs, 
+                                                            nb_similar_paragraph, ids)
+        
+    elif model == 'HYBRID':
+        matching_descriptions = get_hybrid_similar_paragraphs(query, paragraphs, MODEL_EMBEDDING, vector_store_path,
+                                                              nb_similar_paragraph, ids)
+
+    elif model == 'all-MiniLM-L6-v2':
+        matching_descriptions = get_hugging_face_similar_paragraphs(query, paragraphs, None, "all-MiniLM-L6-v2", vector_store_path, 
+                                                                    nb_similar_paragraph, ids)
+
+    else:
+        print("------------------\nERROR \n--------------------\nplease enter a valid model name")
+        print("BM25, AllMini or HYBRID")
+        return None
+
+    return matching_descriptions
+
@@ -0,0 +1,79 @@
+from typing import Dict, List, Union
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+import sys
+sys.path.append('..')
+import scripts.storage_database as storage_database
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+        Docstore of the FAISS vector store reading the documents in the SQLite store.
+        The docstore id of a document is the Id of its these in the store, so nothing
+        but the ids is kept next to the FAISS index : the text and the metadata are
+        fetched from the store only for the documents returned by a search.
+
+        Example:
+        --------
+            >>> docstore = SQLiteDocstore("./static/database/theses.db")
+            >>> docstore.search("12")
+            Document(metadata={"Id": 12, "title": ...}, page_content= "...")
+    """
+
+    def __init__(self, database_path: str = storage_database.DATABASE_PATH):
+
+        if not isinstance(database_path, str):
+            raise TypeError(f"wrong type object, expected str, got : {type(database_path).__name__}")
+
+        self.database_path = database_path
+
+    def search_many(self, search: List[str])-> List[Document]:
+        """Get the documents of several docstore ids with one query on the store
+
+            Args:
+                search (List[str]):
+                    the docstore ids (Id of the store)
+
+            Returns:
+                List[Document]: the documents in the order of the ids, the unknown ids are skipped
+        """
+        ids = [int(docstore_id) for docstore_id in search]
+        if len(ids) == 0:
+            return []
+
+        placeholders = ", ".join(["?"] * len(ids))
+        df_theses = storage_database.read_theses(f"SELECT * FROM {storage_database.TABLE_THESES} "
+                                                 f"WHERE {storage_database.COLUMN_ID} IN ({placeholders})",
+                                                 tuple(ids), self.database_path)
+
+        documents = {}
+        for row in df_theses.to_dict(orient="records"):
+            content = row.pop("content", storage_database.MISSING_VALUE)
+            documents[row[storage_database.COLUMN_ID]] = Document(id= str(row[storage_database.COLUMN_ID]),
+                                                                  page_content= content,
+                                                                  metadata= row)
+
+        return [documents[i] for i in ids if i in documents]
+
+    def search(self, search: str)-> Union[str, Document]:
+        """Get the document of a docstore id
+
+            Args:
+                search (str):
+                    the docstore id (Id of the store)
+
+            Returns:
+                Union[str, Document]: the document, or a message if the id is not in the store
+        """
+        documents = self.search_many([search])
+        if len(documents) == 0:
+            return f"ID {search} not found."
+        return documents[0]
+
+    def add(self, texts: Dict[str, Document])-> None:
+        """Nothing to do, the documents are already in the store under their Id"""
+        return None
+
+    def delete(self, ids: List)-> None:
+        """Nothing to do, the documents stay in the store"""
+        return None
@@ -0,0 +1,685 @@
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import pandas as pd
+import scripts.check_utilities as check_utilities
+import configparser
+
+try:
+    import fcntl
+except ImportError: # Windows, the store lock only serializes the threads of the process
+    fcntl = None
+
+# Load config.ini
+config = configparser.ConfigParser()
+config.read('./scripts/config.ini')
+
+# import config var
+DATABASE_PATH          = config["DEFAULT"]["DATABASE_PATH"]
+EXCEL_QUERY_STORE_PATH = config["DEFAULT"]["EXCEL_QUERY_STORE_PATH"]
+EXCEL_EXPORT_PATH      = config["DEFAULT"]["EXCEL_EXPORT_PATH"]
+
+# one row per these, one row per (query, these) in query_theses, one row per query in queries
+TABLE_THESES        = "theses"
+TABLE_QUERY_THESES  = "query_theses"
+TABLE_QUERIES       = "queries"
+TABLE_LSH_BUCKETS   = "lsh_buckets"
+COLUMN_ID           = "Id"
+COLUMN_URL_QUERY    = "url_query"
+COLUMN_URL_THESE    = "url_these"
+COLUMN_RANK         = "rank"
+COLUMN_CONTENT_HASH = "content_hash"
+# time of the last scrape or refresh of a query, time a these left the results of a query
+COLUMN_LAST_REFRESHED = "last_refreshed"
+COLUMN_REMOVED_AT     = "removed_at"
+INTERNAL_COLUMNS    = [COLUMN_CONTENT_HASH]
+MISSING_VALUE       = "Missing value"
+MISSING_VALUES      = [MISSING_VALUE, "Missing Value", ""]
+
+# python functions
+
+def quote_identifier(name: str)-> str:
+    """Quote a column name for SQLite, the scraped metadata names contain
+    spaces, slashes and accents (ex : 'Auteur / Autrice')
+
+        Args:
+            name (str):
+                the column name
+
+        Returns:
+            str: the quoted column name
+
+        Raise:
+        ------
+            - if name is not a string
+    """
+    if not isinstance(name, str):
+        raise TypeError(f"wrong type, column name should be str, found : {type(name).__name__}")
+
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_missing_value(value)-> bool:
+    return not isinstance(value, str) or value.strip() in MISSING_VALUES
+
+
+def create_tables(conn: sqlite3.Connection):
+    """Create the theses table (one row per these), the query_theses membership table
+    (the theses found by each url query, in the order of the results), the queries
+    table (last refresh of each url query), the LSH buckets of the deduplication and
+    their indexes if they don't exist yet
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+    """
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {TABLE_THESES} (
+                        {COLUMN_ID}           INTEGER PRIMARY KEY,
+                        {COLUMN_URL_THESE}    TEXT,
+                        {COLUMN_CONTENT_HASH} TEXT
+                    )""")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {TABLE_QUERY_THESES} (
+                        {COLUMN_URL_QUERY}  TEXT,
+                        {COLUMN_ID}         INTEGER,
+                        {COLUMN_RANK}       INTEGER,
+                        {COLUMN_REMOVED_AT} REAL,
+                        PRIMARY KEY ({COLUMN_URL_QUERY}, {COLUMN_ID})
+                    ) WITHOUT ROWID""")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {TABLE_QUERIES} (
+                        {COLUMN_URL_QUERY}      TEXT PRIMARY KEY,
+                        created_at              REAL,
+                        {COLUMN_LAST_REFRESHED} REAL
+                    )""")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {TABLE_LSH_BUCKETS} (
+                        band        INTEGER,
+                        bucket      INTEGER,
+                        {COLUMN_ID} INTEGER
+                    )""")
+
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_THESES}_url_these ON {TABLE_THESES} ({COLUMN_URL_THESE})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_THESES}_content_hash ON {TABLE_THESES} ({COLUMN_CONTENT_HASH})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_QUERY_THESES}_id ON {TABLE_QUERY_THESES} ({COLUMN_ID})")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_LSH_BUCKETS}_bucket ON {TABLE_LSH_BUCKETS} (band, bucket)")
+
+
+def import_excel_store(conn: sqlite3.Connection, excel_path: str = EXCEL_QUERY_STORE_PATH):
+    """Import the excel store of the previous versions (one row per url query and these)
+    in a new database : the url queries are made canonical, the rows are linked to
+    their query in query_theses and the queries are stale, refreshed by the next run of
+    the refresh
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the new database, in a transaction
+
+            excel_path (str, optional):
+                path of the excel store. Defaults to EXCEL_QUERY_STORE_PATH.
+    """
+    df_excel = pd.read_excel(excel_path)
+    if COLUMN_URL_QUERY in df_excel.columns:
+        df_excel[COLUMN_URL_QUERY] = [check_utilities.canonical_url_query(url_query) if isinstance(url_query, str) else url_query
+                                      for url_query in df_excel[COLUMN_URL_QUERY]]
+
+    insert_theses(conn, df_excel)
+    conn.execute(f"INSERT OR IGNORE INTO {TABLE_QUERIES} ({COLUMN_URL_QUERY}) SELECT DISTINCT {COLUMN_URL_QUERY} FROM {TABLE_QUERY_THESES}")
+
+
+# lock of the writes on the store, the vector store and the indexes, reentrant in a thread
+_STORE_LOCK  = threading.RLock()
+_STORE_DEPTH = threading.local()
+# seconds between two tries of a busy lock, and between two calls of the wait callback
+LOCK_POLL      = 0.1
+LOCK_HEARTBEAT = 10
+# called while the process waits for the store lock, set by the ingest worker (heartbeat of its job)
+_ON_WAIT       = None
+
+def set_lock_wait_callback(on_wait: Optional[Callable[[], None]]):
+    """Set the function called every LOCK_HEARTBEAT seconds while the process waits
+    for the store lock, None to stop calling it
+
+        Args:
+            on_wait (Optional[Callable[[], None]]):
+                ex : the heartbeat of the job of an ingest worker
+    """
+    global _ON_WAIT
+    _ON_WAIT = on_wait
+
+
+def wait_lock(try_acquire: Callable[[float], bool], on_wait: Optional[Callable[[], None]] = None)-> float:
+    """Wait for a lock, on_wait is called every LOCK_HEARTBEAT seconds meanwhile (ex : a
+    worker waiting for the store keeps the heartbeat of its job). A failing on_wait
+    never stops the wait
+
+        Args:
+            try_acquire (Callable[[float], bool]):
+                takes the lock or gives up after the given seconds, True if taken
+
+            on_wait (Optional[Callable[[], None]], optional):
+                called while waiting. Defaults to None.
+
+        Returns:
+            float: seconds waited
+    """
+    start = last_call = time.perf_counter()
+    while not try_acquire(LOCK_POLL):
+        if on_wait is not None and time.perf_counter() - last_call >= LOCK_HEARTBEAT:
+            try:
+                on_wait()
+            except Exception as error:
+                print(f"store lock : wait callback failed, {type(error).__name__} : {error}")
+            last_call = time.perf_counter()
+    return time.perf_counter() - start
+
+
+def try_flock(lock_file, timeout: float)-> bool:
+    """Take the exclusive flock of lock_file, or sleep timeout seconds if another process holds it"""
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        time.sleep(timeout)
+        return False
+
+@contextmanager
+def store_lock(database_path: str = DATABASE_PATH, on_wait: Optional[Callable[[], None]] = None):
+    """Serialize the writes on the store and its indexes : the threads of the process
+    wait on a reentrant lock, the processes (app, ingest workers, maintenance) on an
+    exclusive flock of DATABASE_PATH.lock. A function holding the lock can call
+    another one taking it. While waiting, on_wait is called every LOCK_HEARTBEAT seconds
+
+        Args:
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+            on_wait (Optional[Callable[[], None]], optional):
+                called while waiting for the lock. Defaults to the callback of set_lock_wait_callback.
+
+        Example:
+        --------
+            >>> with store_lock():
+            >>>     df_new = deduplication.append_deduplicated(df)
+            >>>     update_db(df_new)
+    """
+    on_wait = _ON_WAIT if on_wait is None else on_wait
+    wait_lock(lambda timeout: _STORE_LOCK.acquire(timeout=timeout), on_wait)
+    try:
+        depth     = getattr(_STORE_DEPTH, "depth", 0)
+        lock_file = None
+
+        if depth == 0 and fcntl is not None:
+            folder = os.path.dirname(database_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+
+            lock_file = open(f"{database_path}.lock", "a")
+            waited    = wait_lock(lambda timeout: try_flock(lock_file, timeout), on_wait)
+            if waited > 1:
+                print(f"store lock : waited {waited:.1f}s for another process")
+
+        _STORE_DEPTH.depth = depth + 1
+        try:
+            yield
+        finally:
+            _STORE_DEPTH.depth = depth
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+    finally:
+        _STORE_LOCK.release()
+
+
+def setup_database(database_path: str = DATABASE_PATH):
+    """Create the tables of the store. If the database
+    doesn't exist yet, it is created and filled with the legacy excel store if
+    there is one
+
+        Args:
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+    """
+    is_new_database = not os.path.exists(database_path)
+
+    folder = os.path.dirname(database_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    conn = sqlite3.connect(database_path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            create_tables(conn)
+
+        if is_new_database and os.path.exists(EXCEL_QUERY_STORE_PATH):
+            print(f"database created, importing the excel store {EXCEL_QUERY_STORE_PATH}")
+            with conn:
+                import_excel_store(conn)
+    finally:
+        conn.close()
+
+
+# databases set up by the process, the schema is checked once and not on every connection
+_SCHEMA_READY      = set()
+_SCHEMA_READY_LOCK = threading.Lock()
+
+@contextmanager
+def open_database(database_path: str = DATABASE_PATH):
+    """Open a connection to the SQLite store, the transaction is commited
+    when leaving the context and rolled back if an error is raised.
+    The first connection of the process to a database sets it up, see setup_database
+
+        Args:
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Yields:
+            sqlite3.Connection: the opened connection
+    """
+    with _SCHEMA_READY_LOCK:
+        schema_key = os.path.abspath(database_path)
+        if schema_key not in _SCHEMA_READY or not os.path.exists(database_path):
+            setup_database(database_path)
+            _SCHEMA_READY.add(schema_key)
+
+    conn = sqlite3.connect(database_path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def get_columns(conn: sqlite3.Connection)-> List[str]:
+    """Get the list of columns of the theses table
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+        Returns:
+            List[str]: the columns name
+    """
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE_THESES})")]
+
+
+def add_missing_columns(conn: sqlite3.Connection, columns: List[str]):
+    """The metadata scraped on theses.fr are not the same for every these,
+    new columns are added to the table when a new metadata name shows up
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+            columns (List[str]):
+                the columns we want to insert
+    """
+    existing_columns = get_columns(conn)
+
+    for column in columns:
+        if column not in existing_columns:
+            conn.execute(f"ALTER TABLE {TABLE_THESES} ADD COLUMN {quote_identifier(column)} TEXT")
+            existing_columns.append(column)
+
+
+def get_ids_by_url(conn: sqlite3.Connection, urls: List[str])-> Dict[str, int]:
+    """Id of the theses of the store with the given urls, lookup on the url_these index
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+            urls (List[str]):
+                the urls of the theses, the missing ones are skipped
+
+        Returns:
+            Dict[str, int]: url -> Id of the theses found
+    """
+    urls    = list({url for url in urls if not is_missing_value(url)})
+    ids     = {}
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        rows  = conn.execute(f"SELECT {COLUMN_URL_THESE}, {COLUMN_ID} FROM {TABLE_THESES} "
+                             f"WHERE {COLUMN_URL_THESE} IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+        ids.update(rows)
+    return ids
+
+
+def insert_query_theses(conn: sqlite3.Connection, url_queries: List[str], ids: List[int]):
+    """Link theses to the url queries that found them, the rank of a these is its
+    position in the results of the query, a link already stored is kept
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+            url_queries (List[str]):
+                the url query of each these
+
+            ids (List[int]):
+                the Id of each these
+    """
+    ranks = {}
+    links = []
+    for url_query, doc_id in zip(url_queries, ids):
+        if url_query not in ranks:
+            ranks[url_query] = conn.execute(f"SELECT COALESCE(MAX({COLUMN_RANK}), -1) + 1 FROM {TABLE_QUERY_THESES} "
+                                            f"WHERE {COLUMN_URL_QUERY} = ?", (url_query,)).fetchone()[0]
+        links.append((url_query, int(doc_id), ranks[url_query]))
+        ranks[url_query] += 1
+
+    conn.executemany(f"INSERT OR IGNORE INTO {TABLE_QUERY_THESES} ({COLUMN_URL_QUERY}, {COLUMN_ID}, {COLUMN_RANK}) VALUES (?, ?, ?)", links)
+    # a query not scraped through update_query_search (excel import) is stale until its first refresh
+    conn.executemany(f"INSERT OR IGNORE INTO {TABLE_QUERIES} ({COLUMN_URL_QUERY}) VALUES (?)", [(url_query,) for url_query in ranks])
+
+
+def insert_theses(conn: sqlite3.Connection, df_theses: pd.DataFrame)-> pd.DataFrame:
+    """Append theses to the store, a stable Id is given to each new these. A these is
+    stored once : a row whose url_these is already in the store (or earlier in df_theses)
+    is not inserted again. If df_theses has a url_query column, each row is linked to its
+    query in query_theses
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+            df_theses (pd.DataFrame):
+                the rows to append
+
+        Returns:
+            pd.DataFrame: the new theses with their Id
+
+        Raise:
+        ------
+            - if df_theses is not a DataFrame
+    """
+    if not isinstance(df_theses, pd.DataFrame):
+        raise TypeError(f"wrong type, df_theses should be pd.DataFrame, found : {type(df_theses).__name__}")
+
+    df_theses   = df_theses.drop(columns=[COLUMN_ID], errors="ignore").reset_index(drop=True)
+    df_theses   = df_theses.astype(object).where(df_theses.notna(), None)
+    url_queries = df_theses.pop(COLUMN_URL_QUERY).tolist() if COLUMN_URL_QUERY in df_theses.columns else None
+    urls        = df_theses[COLUMN_URL_THESE].tolist() if COLUMN_URL_THESE in df_theses.columns else [None] * df_theses.shape[0]
+
+    # Id of every row : the these of the store with the same url, or a new Id
+    known_ids = get_ids_by_url(conn, urls)
+    next_id   = conn.execute(f"SELECT COALESCE(MAX({COLUMN_ID}), 0) + 1 FROM {TABLE_THESES}").fetchone()[0]
+    ids, is_new = [], []
+    for url in urls:
+        if not is_missing_value(url) and url in known_ids:
+            ids.append(known_ids[url])
+            is_new.append(False)
+            continue
+        if not is_missing_value(url):
+            known_ids[url] = next_id
+        ids.append(next_id)
+        is_new.append(True)
+        next_id += 1
+
+    df_new = df_theses[is_new].reset_index(drop=True)
+    df_new.insert(0, COLUMN_ID, [doc_id for doc_id, new in zip(ids, is_new) if new])
+
+    if df_new.shape[0] > 0:
+        columns = [str(column) for column in df_new.columns if column != COLUMN_ID]
+        add_missing_columns(conn, columns)
+
+        columns_sql  = ", ".join(quote_identifier(column) for column in [COLUMN_ID] + columns)
+        values_sql   = ", ".join(["?"] * (len(columns) + 1))
+        conn.executemany(f"INSERT INTO {TABLE_THESES} ({columns_sql}) VALUES ({values_sql})",
+                         df_new.itertuples(index=False, name=None))
+
+    if url_queries is not None:
+        insert_query_theses(conn, url_queries, ids)
+        df_new[COLUMN_URL_QUERY] = [url_query for url_query, new in zip(url_queries, is_new) if new]
+
+    return df_new
+
+
+def get_query_theses(conn: sqlite3.Connection, url_query: str)-> List[Tuple[str, int, Optional[float]]]:
+    """Theses linked to a url query, with the time they left its results
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+            url_query (str):
+                the url query on theses.fr
+
+        Returns:
+            List[Tuple[str, int, Optional[float]]]: url_these, Id and removed_at (None if still listed) of each these
+    """
+    return conn.execute(f"SELECT t.{COLUMN_URL_THESE}, t.{COLUMN_ID}, q.{COLUMN_REMOVED_AT} FROM {TABLE_QUERY_THESES} q "
+                        f"JOIN {TABLE_THESES} t ON t.{COLUMN_ID} = q.{COLUMN_ID} WHERE q.{COLUMN_URL_QUERY} = ?", (url_query,)).fetchall()
+
+
+def set_removed_theses(conn: sqlite3.Connection, url_query: str, removed_ids: List[int], listed_ids: List[int]):
+    """Flag the theses that left the results of a url query, they are kept in the store
+    but not displayed for the query anymore, and unflag the ones listed again
+
+        Args:
+            conn (sqlite3.Connection):
+                connection to the database
+
+            url_query (str):
+                the url query on theses.fr
+
+            removed_ids (List[int]):
+                Id of the theses not listed anymore
+
+            listed_ids (List[int]):
+                Id of the theses listed
+    """
+    now = time.time()
+    conn.executemany(f"UPDATE {TABLE_QUERY_THESES} SET {COLUMN_REMOVED_AT} = ? WHERE {COLUMN_URL_QUERY} = ? AND {COLUMN_ID} = ? "
+                     f"AND {COLUMN_REMOVED_AT} IS NULL", [(now, url_query, int(doc_id)) for doc_id in removed_ids])
+    conn.executemany(f"UPDATE {TABLE_QUERY_THESES} SET {COLUMN_REMOVED_AT} = NULL WHERE {COLUMN_URL_QUERY} = ? AND {COLUMN_ID} = ? "
+                     f"AND {COLUMN_REMOVED_AT} IS NOT NULL", [(url_query, int(doc_id)) for doc_id in listed_ids])
+
+
+def mark_query_refreshed(url_query: str, database_path: str = DATABASE_PATH):
+    """Save the time of the scrape or refresh of a url query
+
+        Args:
+            url_query (str):
+                the url query on theses.fr
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+    """
+    now = time.time()
+    with open_database(database_path) as conn:
+        conn.execute(f"INSERT INTO {TABLE_QUERIES} ({COLUMN_URL_QUERY}, created_at, {COLUMN_LAST_REFRESHED}) VALUES (?, ?, ?) "
+                     f"ON CONFLICT({COLUMN_URL_QUERY}) DO UPDATE SET {COLUMN_LAST_REFRESHED} = excluded.{COLUMN_LAST_REFRESHED}",
+                     (url_query, now, now))
+
+
+def get_stale_queries(older_than: float, database_path: str = DATABASE_PATH)-> List[str]:
+    """Url queries not refreshed for older_than seconds, the never refreshed ones first
+
+        Args:
+            older_than (float):
+                seconds since the last refresh
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            List[str]: the stale url queries, the oldest first
+    """
+    with open_database(database_path) as conn:
+        rows = conn.execute(f"SELECT {COLUMN_URL_QUERY} FROM {TABLE_QUERIES} "
+                            f"WHERE {COLUMN_LAST_REFRESHED} IS NULL OR {COLUMN_LAST_REFRESHED} < ? "
+                            f"ORDER BY COALESCE({COLUMN_LAST_REFRESHED}, 0)", (time.time() - older_than,)).fetchall()
+    return [row[0] for row in rows]
+
+
+def append_theses(df_theses: pd.DataFrame, database_path: str = DATABASE_PATH)-> pd.DataFrame:
+    """Append new theses to the store, existing rows are never rewritten and only
+    the theses with the same url are merged, see deduplication.append_deduplicated
+
+        Args:
+            df_theses (pd.DataFrame):
+                the rows to append
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            pd.DataFrame: the new theses with their Id
+    """
+    with open_database(database_path) as conn:
+        return insert_theses(conn, df_theses)
+
+
+def query_already_exist(url_query: str, database_path: str = DATABASE_PATH)-> bool:
+    """Check if the url query has already been scraped, lookup on the
+    primary key of query_theses, or of queries for a query without result
+
+        Args:
+            url_query (str):
+                the url query on theses.fr
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            bool: True if the query is in the store
+    """
+    with open_database(database_path) as conn:
+        row = conn.execute(f"SELECT 1 FROM {TABLE_QUERY_THESES} WHERE {COLUMN_URL_QUERY} = ? LIMIT 1", (url_query,)).fetchone()
+        if row is None:
+            row = conn.execute(f"SELECT 1 FROM {TABLE_QUERIES} WHERE {COLUMN_URL_QUERY} = ?", (url_query,)).fetchone()
+    return row is not None
+
+
+def read_theses(sql: str, params: tuple = (), database_path: str = DATABASE_PATH)-> pd.DataFrame:
+    """Run a select on the theses table and fill the missing metadata
+    the same way the excel store did, the deduplication columns are dropped
+
+        Args:
+            sql (str):
+                the select query
+
+            params (tuple, optional):
+                the query parameters. Defaults to ().
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            pd.DataFrame: the selected theses
+    """
+    with open_database(database_path) as conn:
+        df_theses = pd.read_sql_query(sql, conn, params=params)
+
+    df_theses = df_theses.drop(columns=INTERNAL_COLUMNS, errors="ignore")
+    columns = [column for column in df_theses.columns if column != COLUMN_ID]
+    df_theses[columns] = df_theses[columns].fillna(MISSING_VALUE)
+    return df_theses
+
+
+def load_query_theses(url_query: str, database_path: str = DATABASE_PATH)-> pd.DataFrame:
+    """Load the theses found for a url query, in the order of the results,
+    through the query_theses membership table. The theses flagged as removed
+    by a refresh are left out
+
+        Args:
+            url_query (str):
+                the url query on theses.fr
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            pd.DataFrame: the theses of the query
+    """
+    df_theses = read_theses(f"SELECT t.* FROM {TABLE_QUERY_THESES} q JOIN {TABLE_THESES} t ON t.{COLUMN_ID} = q.{COLUMN_ID} "
+                            f"WHERE q.{COLUMN_URL_QUERY} = ? AND q.{COLUMN_REMOVED_AT} IS NULL ORDER BY q.{COLUMN_RANK}", (url_query,), database_path)
+    df_theses[COLUMN_URL_QUERY] = url_query
+    return df_theses
+
+
+def load_all_theses(database_path: str = DATABASE_PATH)-> pd.DataFrame:
+    """Load the whole store, each these once
+
+        Args:
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            pd.DataFrame: all the theses
+    """
+    return read_theses(f"SELECT * FROM {TABLE_THESES} ORDER BY {COLUMN_ID}", (), database_path)
+
+
+def filter_ids(filter: Dict[str, object], ids: List[int] = None, database_path: str = DATABASE_PATH)-> List[int]:
+    """Id of the theses whose metadata match the filter, among the given Id.
+    A missing metadata matches MISSING_VALUE, like in the documents of the docstore
+
+        Args:
+            filter (Dict[str, object]):
+                metadata name -> value, or list of accepted values
+
+            ids (List[int], optional):
+                Id of the candidate theses. Defaults to None, every these.
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            List[int]: the Id, in the order of ids if given
+
+        Raise:
+        ------
+            - if a metadata name is not a column of the theses table
+    """
+    with open_database(database_path) as conn:
+        columns = get_columns(conn)
+        unknown = [key for key in filter if key not in columns or key in INTERNAL_COLUMNS]
+        if len(unknown) > 0:
+            raise TypeError(f"wrong filter, unknown metadata : {unknown}")
+
+        conditions, params = [], []
+        for key, value in filter.items():
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            conditions.append(f"COALESCE({quote_identifier(key)}, ?) IN ({', '.join(['?'] * len(values))})")
+            params.extend([MISSING_VALUE] + [str(v) for v in values])
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        matching = {row[0] for row in conn.execute(f"SELECT {COLUMN_ID} FROM {TABLE_THESES} {where}", params)}
+
+    if ids is None:
+        return sorted(matching)
+    return [doc_id for doc_id in ids if doc_id in matching]
+
+
+def export_to_excel(excel_path: str = EXCEL_EXPORT_PATH, database_path: str = DATABASE_PATH)-> str:
+    """Export the store into an excel file, the excel file is only an export
+    it is never read back by the app. It can't overwrite the legacy excel store,
+    which would be imported again by a new database
+
+        Args:
+            excel_path (str, optional):
+                where to write the excel file. Defaults to EXCEL_EXPORT_PATH.
+
+            database_path (str, optional):
+                path to the SQLite file. Defaults to DATABASE_PATH.
+
+        Returns:
+            str: the path of the excel file
+
+        Raise:
+        ------
+            - if excel_path is the legacy excel store
+    """
+    if os.path.abspath(excel_path) == os.path.abspath(EXCEL_QUERY_STORE_PATH):
+        raise ValueError(f"the export can't overwrite the legacy excel store {EXCEL_QUERY_STORE_PATH}, choose another path")
+
+    # one row per these of each query, like the excel store
+    df_theses = read_theses(f"SELECT t.*, q.{COLUMN_URL_QUERY} FROM {TABLE_QUERY_THESES} q "
+                            f"JOIN {TABLE_THESES} t ON t.{COLUMN_ID} = q.{COLUMN_ID} "
+                            f"WHERE q.{COLUMN_REMOVED_AT} IS NULL ORDER BY q.{COLUMN_URL_QUERY}, q.{COLUMN_RANK}", (), database_path)
+    df_theses.to_excel(excel_path, index=False)
+    print(f"{df_theses.shape[0]} theses exported in {excel_path}")
+    return excel_path
@@ -1,6 +1,7 @@
 import pandas as pd
 import os
-from langchain_community.vectorstores import FAISS
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 import sys
 sys.path.append('../..')
 sys.path.append('..')
@@ -8,7 +9,14 @@ import scripts.get_vector_store as get_vector_store
 import scripts.get_url_theses_selenium as get_url_theses_selenium
 import scripts.get_metadata_thesis_bs4 as get_metadata_thesis_bs4
 import scripts.get_metadata_thesis_selenium as get_metadata_thesis_selenium
-from langchain_huggingface import HuggingFaceEmbeddings
+import scripts.storage_database as storage_database
+import scripts.deduplication as deduplication
+import scripts.retrieval_service as retrieval_service
+import scripts.embedding_pipeline as embedding_pipeline
+import scripts.bm25_index as bm25_index
+import scripts.facet_index as facet_index
+import scripts.http_cache as http_cache
+import scripts.job_queue as job_queue
 import configparser
 
 # Load config.ini
@@ -17,10 +25,14 @@ config.read('./scripts/config.ini')
 
 # import config var
 MODEL_EMBEDDING   = config["DEFAULT"]["MODEL_EMBEDDING"]
+VECTOR_STORE_PATH = config["DEFAULT"]["VECTOR_STORE_PATH"]
+REFRESH_AFTER       = config["REFRESH"].getfloat("REFRESH_AFTER")
+MAX_REFRESH_QUERIES = config["REFRESH"].getint("MAX_REFRESH_QUERIES")
 COLUMN_URL_QUERY = "url_query"
+COLUMN_ID        = storage_database.COLUMN_ID
 
-# load embedding model
-EMBEDDING = HuggingFaceEmbeddings(model_name= MODEL_EMBEDDING)
+# load embedding model, shared with the retrieval service of the process
+EMBEDDING = retrieval_service.get_retrieval_service(MODEL_EMBEDDING, VECTOR_STORE_PATH).embeddings
 
 # python functions
 
@@ -75,41 +87,109 @@ def condense_content_metadata_df(df_metadata: pd.DataFrame):
     return df_metadata
 
 
-def update_db(df, embeddings: HuggingFaceEmbeddings = EMBEDDING):
-    """update the vector store database
+def rebuild_db(embeddings: embedding_pipeline.SentenceTransformerEmbeddings = EMBEDDING, vector_store_path: str = VECTOR_STORE_PATH,
+               batch_size: int = embedding_pipeline.BATCH_SIZE, num_workers: int = embedding_pipeline.NUM_WORKERS):
+    """rebuild the whole vector store from the store, every these is embedded again,
+    the BM25 and the facet indexes are rebuilt too.
+    Maintenance command : python -m scripts.maintenance rebuild
+
+        Args:
+            embeddings (SentenceTransformerEmbeddings, optional): 
+                the embedding model. Defaults to EMBEDDING.
+                
+            vector_store_path (str, optional): 
+                where the vector store is saved. Defaults to VECTOR_STORE_PATH.
+                
+            batch_size (int, optional): 
+                number of theses embedded at once by a process. Defaults to BATCH_SIZE.
+                
+            num_workers (int, optional): 
+                number of embedding processes. Defaults to NUM_WORKERS.
+                
+        Returns:
+            get_vector_store.FAISS: the rebuilt vector store
+    """
+    if not isinstance(embeddings, embedding_pipeline.SentenceTransformerEmbeddings):
+        raise TypeError(f"wrong type, embeddings should be SentenceTransformerEmbeddings, found : {type(embeddings).__name__}")
+    
+    with storage_database.store_lock():
+        df = storage_database.load_all_theses()
+        
+        bm25_index.update_bm25_index(df, rebuild=True)
+        facet_index.update_facet_index(df, rebuild=True)
+        
+        db = get_vector_store.create_vector_store(df.to_dict(orient="list"), embeddings, 
+                                                  ids=df[COLUMN_ID].astype(str).tolist(),
+                                                  batch_size=batch_size, num_workers=num_workers)
+        
+        get_vector_store.save_vector_store(db, vector_store_path)
+        
+        return db
+
+
+def update_db(df, embeddings: embedding_pipeline.SentenceTransformerEmbeddings = EMBEDDING, vector_store_path: str = VECTOR_STORE_PATH):
+    """update the vector store database, the BM25 and the facet indexes, only the theses not already
+    in the index are embedded and appended, the Id of the store is used as docstore id.
+    The vector store is rebuilt if it doesn't exist yet or if its docstore ids are not
+    Id of the store (vector store created before the SQLite store)
 
         Args:
             df (pd.DataFrame): 
-                the updated pd.DataFrame
+                the theses to add, rows of the store with their Id
                 
-            embeddings (HuggingFaceEmbeddings, optional): 
-                str. Defaults to EMBEDDING.
+            embeddings (SentenceTransformerEmbeddings, optional): 
+                the embedding model. Defaults to EMBEDDING.
+                
+            vector_store_path (str, optional): 
+                where the vector store is saved. Defaults to VECTOR_STORE_PATH.
+                
+        Returns:
+            get_vector_store.FAISS: the updated vector store
             
         Raise:
         ------
             - if df not DataFrame
-            - if embeddings not HuggingFaceEmbeddings
+            - if df has no Id column
+            - if embeddings not SentenceTransformerEmbeddings
     """
     if not isinstance(df, pd.DataFrame):
         raise TypeError(f"wrong type, df should be pd.DataFrame, found : {type(df).__name__}")
     
-    if not isinstance(embeddings, HuggingFaceEmbeddings):
-        raise TypeError(f"wrong type, embeddings should be HuggingFaceEmbeddings, found : {type(embeddings).__name__}")
+    if COLUMN_ID not in df.columns:
+        raise TypeError(f"the theses must come from the store with their '{COLUMN_ID}' column, found : {df.columns.tolist()}")
     
+    if not isinstance(embeddings, embedding_pipeline.SentenceTransformerEmbeddings):
+        raise TypeError(f"wrong type, embeddings should be SentenceTransformerEmbeddings, found : {type(embeddings).__name__}")
     
-    # add an index:
-    df["Id"] = list(range(df.shape[0]))
-    
-    df_to_dict = df.to_dict(orient="list")
-    
-    db = get_vector_store.create_vector_store(df_to_dict, embeddings)
-    
-    get_vector_store.save_vector_store(db, "./static/vector_store")
+    # the vector store and the indexes are written by one process at a time
+    with storage_database.store_lock():
+        db = load_vector_store(vector_store_path, embeddings)
+        
+        if db is None or not all(docstore_id.isdigit() for docstore_id in db.index_to_docstore_id.values()):
+            print("vector store missing or not built on the store ids, full rebuild")
+            return rebuild_db(embeddings, vector_store_path)
+        
+        bm25_index.update_bm25_index(df)
+        facet_index.update_facet_index(df)
+        
+        indexed_ids = set(db.index_to_docstore_id.values())
+        df_new      = df[~df[COLUMN_ID].astype(str).isin(indexed_ids)]
+        
+        if df_new.shape[0] == 0:
+            print("no new these to embed")
+            return db
+        
+        db = get_vector_store.add_to_vector_store(db, df_new.to_dict(orient="list"), 
+                                                  ids=df_new[COLUMN_ID].astype(str).tolist())
+        
+        get_vector_store.save_vector_store(db, vector_store_path)
+        
+        return db
     
 def load_vector_store(vector_store_path: str, embeddings: str = EMBEDDING):
     """
-        Load a vector store given a path and embedding
-        FAISS vectore store
+        Load a vector store given a path and embedding,
+        see get_vector_store.load_vector_store
 
         Args:
             vector_store_path (str): 
@@ -119,78 +199,248 @@ def load_vector_store(vector_store_path: str, embeddings: str = EMBEDDING):
                 name of the embedder, could be None for images vector store for example
 
         Returns:
-            db : the index vector store
+            get_vector_store.FAISS: the vector store, None if there is none at vector_store_path
     """
 
-    if os.path.exists(vector_store_path):
-        return FAISS.load_local(vector_store_path, embeddings, allow_dangerous_deserialization=True)
+    if os.path.exists(os.path.join(vector_store_path, get_vector_store.INDEX_FILE)):
+        return get_vector_store.load_vector_store(vector_store_path, embeddings)
     
     else:
         print("Error : vector store doesn't exist, make sure it is stored in stage_yann_avicenne\\Vector_stores")
         return None
     
-def update_excel_query_search(df_theses: pd.DataFrame, df_metadata: pd.DataFrame, url_query: str):
+def update_query_search(df_metadata: pd.DataFrame, url_query: str):
+    """Append the theses scraped for a new url query to the store, the theses already
+    in the store (same url, same or near duplicate abstract) are only linked to the query
+
+        Args:
+            df_metadata (pd.DataFrame): 
+                the scraped theses
+                
+            url_query (str): 
+                the url query on theses.fr
+
+        Returns:
+            pd.DataFrame: the new theses with their Id, the ones to embed
+    """
     
     df_metadata[COLUMN_URL_QUERY] = [url_query]*df_metadata.shape[0]
-    df_theses = pd.concat([df_theses, df_metadata])
     
-    return df_theses.fillna("Missing value")
+    df_new_theses = deduplication.append_deduplicated(df_metadata.fillna(storage_database.MISSING_VALUE))
+    storage_database.mark_query_refreshed(url_query)
+    
+    return df_new_theses
 
 
-def query_already_exist(df, url_query: str):
+def query_already_exist(url_query: str):
+    """Check if the url query has already been scraped (even without result), index lookup in the store
+
+        Args:
+            url_query (str): 
+                the url query on theses.fr
+
+        Returns:
+            bool: True if the query is in the store
+    """
     
-    if COLUMN_URL_QUERY in df.columns:
-        if url_query in df[COLUMN_URL_QUERY].tolist():
-            return True
-    return False
+    return storage_database.query_already_exist(url_query)
 
 
-def update_database_bs4(df_theses, query: str):
-    """Update the database (excle and vector store) if unseen query detescted
+def scrape_theses(query: str, get_all_metadata: Callable[[List[str]], pd.DataFrame])-> pd.DataFrame:
+    """Crawl the result pages of the query and scrape the metadata of the theses of each
+    page as soon as the page is read, the first theses are scraped while the last result
+    pages are still crawled
 
         Args:
-            df_theses (pd.Dataframe): 
-                the dataframe with saved query
+            query (str): 
+                the user query
                 
+            get_all_metadata (Callable[[List[str]], pd.DataFrame]): 
+                the metadata scraper of a list of url, ex : get_metadata_thesis_bs4.get_all_metadata_theses_bs_async
+
+        Returns:
+            pd.DataFrame: the metadata of the theses, in the order of the result pages
+    """
+    
+    seen_url = set()
+    pages    = []
+    scraped  = []
+    cache    = http_cache.get_http_cache()
+    stats    = cache.stats() if cache is not None else None
+    
+    job_queue.report_progress("listing")
+    
+    def report_scraped(nb_theses):
+        scraped.append(nb_theses)
+        job_queue.report_progress("scraping", sum(scraped), len(seen_url))
+    
+    # one batch scraped at a time, the scraper already fetches the pages of a batch concurrently
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for page, url_theses in get_url_theses_selenium.iter_url_theses(query):
+            url_theses = [url for url in dict.fromkeys(url_theses) if url not in seen_url]
+            seen_url.update(url_theses)
+            if len(url_theses) > 0:
+                future = executor.submit(get_all_metadata, url_theses)
+                future.add_done_callback(lambda _, nb_theses=len(url_theses): report_scraped(nb_theses))
+                pages.append((page, future))
+                job_queue.report_progress("scraping", sum(scraped), len(seen_url))
+        
+        frames = [future.result() for _, future in sorted(pages, key=lambda page: page[0])]
+    
+    print(f"scraping : {len(seen_url)} theses from {len(pages)} result pages")
+    if cache is not None: # hit rate and bytes saved of this ingest
+        cache.report(since=stats)
+    return pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+
+
+def update_database_bs4(query: str):
+    """Update the database (store and vector store) if unseen query detescted, a query
+    without result is saved as done with no these
+
+        Args:
             query (str): 
                 the user query
+
+        Returns:
+            pd.DataFrame: the theses appended to the store, empty for a query without result
     """
     
-    list_url_theses, main_query_url= get_url_theses_selenium.get_all_url_theses(query) # get all theses url and the url query
-    # if new request, we extract only info
-    df_metadata = get_metadata_thesis_bs4.get_all_metadata_theses_bs(list_url_theses) # list of dict with info for each url in the list
-    df_metadata = condense_content_metadata_df(df_metadata)
+    main_query_url = get_url_theses_selenium.get_url_request(query) # the url query, key of the query in the store
+    # result pages crawled and theses pages fetched concurrently by the asyncio fetcher, page after page
+    df_metadata = scrape_theses(query, get_metadata_thesis_bs4.get_all_metadata_theses_bs_async)
     
-    # we update the excel dataset
-    df_theses = update_excel_query_search(df_theses, df_metadata, main_query_url)
-    df_theses.to_excel("./static/excel/df_query.xlsx", index=False)
+    if df_metadata.shape[0] == 0: # no these found, the query is saved as done without result
+        print(f"no these found for {main_query_url}")
+        storage_database.mark_query_refreshed(main_query_url)
+        return df_metadata
     
-    # we update the vector store
-    update_db(df_theses)
+    df_metadata = condense_content_metadata_df(df_metadata)
+    
+    # the scraping runs at once with other ingestions, the store and the indexes are written one at a time
+    with storage_database.store_lock():
+        # we append the new theses to the store
+        job_queue.report_progress("storing", 0, df_metadata.shape[0])
+        df_new_theses = update_query_search(df_metadata, main_query_url)
+        
+        # we embed only the new theses in the vector store, not the duplicates
+        update_db(df_new_theses)
     
-    return df_theses
+    return df_new_theses
 
-def update_database_selenium(df_theses, query: str):
-    """Update the database (excle and vector store) if unseen query detescted
+def update_database_selenium(query: str):
+    """Update the database (store and vector store) if unseen query detescted, a query
+    without result is saved as done with no these
 
         Args:
-            df_theses (pd.Dataframe): 
-                the dataframe with saved query
-                
             query (str): 
                 the user query
+
+        Returns:
+            pd.DataFrame: the theses appended to the store, empty for a query without result
     """
     
-    list_url_theses, main_query_url= get_url_theses_selenium.get_all_url_theses(query) # get all theses url and the url query
-    # if new request, we extract only info
-    df_metadata = get_metadata_thesis_selenium.get_all_metadata_thesis(list_url_theses) # list of dict with info for each url in the list
+    main_query_url = get_url_theses_selenium.get_url_request(query) # the url query, key of the query in the store
+    # result pages crawled and theses pages scraped by the driver pool, page after page
+    df_metadata = scrape_theses(query, get_metadata_thesis_selenium.get_all_metadata_thesis)
+    
+    if df_metadata.shape[0] == 0: # no these found, the query is saved as done without result
+        print(f"no these found for {main_query_url}")
+        storage_database.mark_query_refreshed(main_query_url)
+        return df_metadata
+    
     df_metadata = condense_content_metadata_df(df_metadata)
     
-    # we update the excel dataset
-    df_theses = update_excel_query_search(df_theses, df_metadata, main_query_url)
-    df_theses.to_excel("./static/excel/df_query.xlsx", index=False)
+    # the scraping runs at once with other ingestions, the store and the indexes are written one at a time
+    with storage_database.store_lock():
+        # we append the new theses to the store
+        job_queue.report_progress("storing", 0, df_metadata.shape[0])
+        df_new_theses = update_query_search(df_metadata, main_query_url)
+        
+        # we embed only the new theses in the vector store, not the duplicates
+        update_db(df_new_theses)
+    
+    return df_new_theses
+
+
+def refresh_query(url_query: str, get_all_metadata: Callable[[List[str]], pd.DataFrame] = get_metadata_thesis_bs4.get_all_metadata_theses_bs_async)-> dict:
+    """Delta refresh of a url query of the store : only the result listing is read again,
+    the theses listed for the first time are linked to the query if they are already in the
+    store (found by another query), the others are scraped, deduplicated, embedded and indexed.
+    The theses not listed anymore are flagged as removed, only if the whole listing was read
+
+        Args:
+            url_query (str): 
+                the url query on theses.fr
+                
+            get_all_metadata (Callable[[List[str]], pd.DataFrame], optional): 
+                the metadata scraper. Defaults to get_metadata_thesis_bs4.get_all_metadata_theses_bs_async.
+
+        Returns:
+            dict: number of theses listed, scraped, new in the store, linked and removed
+    """
+    url_theses, is_complete = get_url_theses_selenium.get_result_listing(url_query)
+    
+    with storage_database.store_lock(), storage_database.open_database() as conn:
+        stored     = {url: (doc_id, removed_at) for url, doc_id, removed_at in storage_database.get_query_theses(conn, url_query)
+                      if not storage_database.is_missing_value(url)}
+        new_url    = [url for url in url_theses if url not in stored]
+        known_ids  = storage_database.get_ids_by_url(conn, new_url)
+        
+        # theses found by another query, only linked
+        linked_url = [url for url in new_url if url in known_ids]
+        storage_database.insert_query_theses(conn, [url_query] * len(linked_url), [known_ids[url] for url in linked_url])
+        
+        # an empty listing is more likely a change of theses.fr than a query without result
+        listed      = set(url_theses)
+        removed_ids = [doc_id for url, (doc_id, _) in stored.items() if url not in listed] if is_complete and len(url_theses) > 0 else []
+        storage_database.set_removed_theses(conn, url_query, removed_ids, [stored[url][0] for url in url_theses if url in stored] + [known_ids[url] for url in linked_url])
+    
+    scraped_url   = [url for url in new_url if url not in known_ids]
+    df_new_theses = pd.DataFrame()
+    df_metadata   = get_all_metadata(scraped_url) if len(scraped_url) > 0 else pd.DataFrame()
+    if df_metadata.shape[0] > 0:
+        df_metadata = condense_content_metadata_df(df_metadata)
+        with storage_database.store_lock():
+            df_new_theses = update_query_search(df_metadata, url_query)
+            if df_new_theses.shape[0] > 0:
+                update_db(df_new_theses)
     
-    # we update the vector store
-    update_db(df_theses)
+    storage_database.mark_query_refreshed(url_query)
     
-    return df_theses
\ No newline at end of file
+    counts = {"listed": len(url_theses), "scraped": len(scraped_url), "new": df_new_theses.shape[0],
+              "linked": len(linked_url), "removed": len(removed_ids)}
+    print(f"refresh : {url_query} : " + ", ".join(f"{count} {name}" for name, count in counts.items())
+          + ("" if is_complete else " (incomplete listing, no these flagged as removed)"))
+    return counts
+
+
+def refresh_stale_queries(older_than: float = REFRESH_AFTER, max_queries: int = MAX_REFRESH_QUERIES, 
+                          get_all_metadata: Callable[[List[str]], pd.DataFrame] = get_metadata_thesis_bs4.get_all_metadata_theses_bs_async)-> List[dict]:
+    """Delta refresh of the url queries not refreshed for older_than seconds, the oldest first,
+    run on a schedule (cron) : python -m scripts.maintenance refresh
+
+        Args:
+            older_than (float, optional): 
+                seconds since the last refresh. Defaults to REFRESH_AFTER.
+                
+            max_queries (int, optional): 
+                queries refreshed at most by one run. Defaults to MAX_REFRESH_QUERIES.
+                
+            get_all_metadata (Callable[[List[str]], pd.DataFrame], optional): 
+                the metadata scraper. Defaults to get_metadata_thesis_bs4.get_all_metadata_theses_bs_async.
+
+        Returns:
+            List[dict]: the counts of each refreshed query
+    """
+    url_queries = storage_database.get_stale_queries(older_than)[:max_queries]
+    print(f"refresh : {len(url_queries)} stale queries")
+    
+    results = []
+    for url_query in url_queries:
+        try:
+            results.append(refresh_query(url_query, get_all_metadata))
+        except Exception as error: # the next queries are still refreshed
+            print(f"refresh : {url_query} failed, {type(error).__name__} : {error}")
+    
+    return results
+
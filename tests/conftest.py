@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules read ./scripts/config.ini and import scripts.x, the tests run from the root of the repo
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
@@ -0,0 +1,147 @@
+import math
+from collections import Counter
+import pytest
+import scripts.bm25_index as bm25_index
+
+TEXTS = ["Étude de l'apprentissage profond pour la vision",
+         "apprentissage par renforcement et robotique",
+         "traitement de l'eau par filtration membranaire",
+         "filtration de l'eau potable, étude des membranes",
+         "vision par ordinateur et robotique mobile"]
+
+
+def get_bm25_scores(query: str, texts: list, k1: float, b: float)-> dict:
+    """Okapi BM25 of each text computed term by term, the reference of the index"""
+    documents      = [Counter(bm25_index.tokenize(text)) for text in texts]
+    average_length = sum(sum(document.values()) for document in documents) / len(documents)
+    scores         = {}
+    for position, document in enumerate(documents):
+        length = sum(document.values())
+        score  = 0.0
+        for term, query_tf in Counter(bm25_index.tokenize(query)).items():
+            df  = sum(1 for other in documents if term in other)
+            tf  = document.get(term, 0)
+            idf = math.log1p((len(documents) - df + 0.5) / (df + 0.5))
+            score += query_tf * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+        if score > 0:
+            scores[position] = score
+    return scores
+
+
+def test_tokenize():
+    assert bm25_index.tokenize("Étude de l'apprentissage") == ["etude", "de", "apprentissage"]
+    assert bm25_index.tokenize(None) == []
+
+
+def test_search_scores():
+    index = bm25_index.BM25Index()
+    assert index.add(list(range(len(TEXTS))), TEXTS) == len(TEXTS)
+
+    expected = get_bm25_scores("filtration de l'eau", TEXTS, index.k1, index.b)
+    results  = index.search("filtration de l'eau", 10)
+
+    assert [doc_id for doc_id, _ in results] == sorted(expected, key=expected.get, reverse=True)
+    for doc_id, score in results:
+        assert score == pytest.approx(expected[doc_id], rel=1e-5)
+
+
+def test_search_top_k_and_ids():
+    index = bm25_index.BM25Index()
+    index.add([10, 11, 12, 13, 14], TEXTS)
+
+    assert len(index.search("robotique vision apprentissage", 2)) == 2
+    assert [doc_id for doc_id, _ in index.search("robotique", 10, ids=[14, 12])] == [14]
+    assert index.search("inconnu", 10) == []
+    assert index.search("robotique", 0) == []
+
+
+def test_add_skips_indexed_ids():
+    index = bm25_index.BM25Index()
+    index.add([1, 2], TEXTS[:2])
+
+    assert index.add([2, 3, 3], [TEXTS[1], TEXTS[2], TEXTS[2]]) == 1
+    assert len(index) == 3
+
+    with pytest.raises(TypeError):
+        index.add([4], [])
+
+
+def test_incremental_add_equals_full_build():
+    full = bm25_index.BM25Index()
+    full.add(list(range(len(TEXTS))), TEXTS)
+
+    incremental = bm25_index.BM25Index()
+    incremental.add([0, 1], TEXTS[:2])
+    incremental.add([2], TEXTS[2:3])
+    incremental.add([3, 4], TEXTS[3:])
+    assert len(incremental.segments) == 3
+
+    for query in ["eau", "robotique vision", "étude apprentissage"]:
+        assert incremental.search(query, 5) == pytest.approx(full.search(query, 5))
+
+    full.merge()
+    incremental.merge()
+    assert incremental.segments == []
+    assert incremental.term_docs.tolist() == full.term_docs.tolist()
+    assert incremental.term_pointers.tolist() == full.term_pointers.tolist()
+
+
+def test_save_segments_and_load(tmp_path):
+    index = bm25_index.BM25Index(merge_ratio=10, max_segments=10)
+    index.add([0, 1, 2], TEXTS[:3])
+    index.save(str(tmp_path))
+
+    index = bm25_index.BM25Index.load(str(tmp_path))
+    index.merge_ratio = 10
+    index.add([3, 4], TEXTS[3:])
+    index.save(str(tmp_path))
+
+    # the new theses are written in a segment, the index file is not rewritten
+    assert [position for position, _ in bm25_index.get_segment_files(str(tmp_path))] == [3]
+
+    loaded = bm25_index.BM25Index.load(str(tmp_path))
+    assert len(loaded) == 5
+    assert len(loaded.segments) == 1
+    assert loaded.search("robotique", 5) == pytest.approx(index.search("robotique", 5))
+
+
+def test_save_merges_segments(tmp_path):
+    index = bm25_index.BM25Index(max_segments=2)
+    index.add([0], TEXTS[:1])
+    index.save(str(tmp_path))
+
+    index = bm25_index.BM25Index.load(str(tmp_path))
+    index.merge_ratio, index.max_segments = 10, 2
+    index.add([1], TEXTS[1:2])
+    index.save(str(tmp_path))
+    assert len(bm25_index.get_segment_files(str(tmp_path))) == 1
+
+    index.add([2], TEXTS[2:3])
+    index.save(str(tmp_path))
+    assert bm25_index.get_segment_files(str(tmp_path)) == []
+    assert len(bm25_index.BM25Index.load(str(tmp_path))) == 3
+
+
+def test_rebuild_ignores_stale_segments(tmp_path):
+    index = bm25_index.BM25Index()
+    index.add([0, 1], TEXTS[:2])
+    index.save(str(tmp_path))
+
+    index = bm25_index.BM25Index.load(str(tmp_path))
+    index.merge_ratio = 10
+    index.add([2], TEXTS[2:3])
+    index.save(str(tmp_path))
+    (segment_file,) = [path for _, path in bm25_index.get_segment_files(str(tmp_path))]
+    stale = open(segment_file, "rb").read()
+
+    rebuilt = bm25_index.BM25Index()
+    rebuilt.add([0, 1], TEXTS[:2])
+    rebuilt.save(str(tmp_path))
+    # a segment of the previous index left on disk
+    open(segment_file, "wb").write(stale)
+
+    assert len(bm25_index.BM25Index.load(str(tmp_path))) == 2
+
+
+def test_load_missing_index(tmp_path):
+    assert len(bm25_index.BM25Index.load(str(tmp_path / "missing"))) == 0
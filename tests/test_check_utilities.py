@@ -0,0 +1,19 @@
+import pytest
+import scripts.check_utilities as check_utilities
+
+
+def test_canonical_query():
+    assert check_utilities.canonical_query("  Water   Membrane ") == "water membrane"
+    assert check_utilities.canonical_query("water\tmembrane\n") == "water membrane"
+    assert check_utilities.canonical_query("Étude") == "étude"
+    assert check_utilities.canonical_query("   ") == ""
+
+    with pytest.raises(TypeError):
+        check_utilities.canonical_query(None)
+
+
+def test_canonical_url_query():
+    url_query = "https://theses.fr/resultats?q=Water++Membrane&page=1&nb=100&tri=pertinence&domaine=theses"
+
+    assert check_utilities.canonical_url_query(url_query) == "https://theses.fr/resultats?q=water+membrane&page=1&nb=100&tri=pertinence&domaine=theses"
+    assert check_utilities.canonical_url_query(check_utilities.canonical_url_query(url_query)) == check_utilities.canonical_url_query(url_query)
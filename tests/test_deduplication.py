@@ -0,0 +1,84 @@
+import random
+import sqlite3
+import pandas as pd
+import pytest
+import scripts.storage_database as storage_database
+import scripts.deduplication as deduplication
+
+WORDS = [f"mot{i}" for i in range(400)]
+
+
+def get_abstract(seed: int, nb_words: int = 120)-> str:
+    return " ".join(random.Random(seed).choices(WORDS, k=nb_words))
+
+
+def get_these(url: str, title: str, author: str, content: str)-> dict:
+    return {storage_database.COLUMN_URL_THESE: url, "title": title, "Auteur / Autrice": author, "content": content}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "theses.db"))
+    storage_database.create_tables(conn)
+    yield conn
+    conn.close()
+
+
+def test_is_same_these():
+    identity = deduplication.get_identity("https://theses.fr/1", "Filtration membranaire de l'eau", "Marie Curie")
+
+    # same author, or same title, for theses without url or with the same url
+    assert deduplication.is_same_these(identity, deduplication.get_identity("Missing value", "Autre titre", "  Marie CURIE"))
+    assert deduplication.is_same_these(identity, deduplication.get_identity("https://theses.fr/1", "Filtration membranaire de l'eau", "Pierre Curie"))
+    # a boilerplate abstract shared by theses of different authors and titles
+    assert not deduplication.is_same_these(identity, deduplication.get_identity("Missing value", "Autre titre", "Pierre Curie"))
+    # different urls need both the title and the author
+    assert not deduplication.is_same_these(identity, deduplication.get_identity("https://theses.fr/2", "Autre titre", "Marie Curie"))
+    assert deduplication.is_same_these(identity, deduplication.get_identity("https://theses.fr/2", "Filtration membranaire de l'eau", "Marie Curie"))
+    # missing metadata never agree
+    assert not deduplication.is_same_these(deduplication.get_identity(None, None, None), deduplication.get_identity(None, None, None))
+
+
+def test_find_duplicates_in_batch():
+    abstract = get_abstract(0)
+    df = pd.DataFrame([get_these("https://theses.fr/1", "Titre un", "Marie Curie", abstract),
+                       # same url
+                       get_these("https://theses.fr/1", "Titre un", "Marie Curie", "Missing value"),
+                       # same abstract once normalized, same author
+                       get_these("Missing value", "Titre un bis", "Marie Curie", abstract.upper() + " !"),
+                       # truncated abstract, same title
+                       get_these("Missing value", "Titre un", "M. Curie", " ".join(abstract.split()[:100])),
+                       # same abstract, other these
+                       get_these("Missing value", "Autre sujet", "Pierre Curie", abstract),
+                       get_these("https://theses.fr/2", "Titre deux", "Irène Joliot", get_abstract(1))])
+
+    df = deduplication.find_duplicates(None, df, check_store=False)
+
+    assert df["canonical"].tolist() == [None, "row:0", "row:0", "row:0", None, None]
+    assert df[storage_database.COLUMN_CONTENT_HASH][0] == df[storage_database.COLUMN_CONTENT_HASH][2]
+
+
+def test_find_duplicates_in_store(conn):
+    df_store = pd.DataFrame([get_these("https://theses.fr/1", "Titre un", "Marie Curie", get_abstract(0)),
+                             get_these("https://theses.fr/2", "Titre deux", "Irène Joliot", get_abstract(1))])
+    df_new, nb_duplicates = deduplication.insert_deduplicated(conn, df_store)
+    assert df_new[storage_database.COLUMN_ID].tolist() == [1, 2]
+    assert nb_duplicates == 0
+
+    df = pd.DataFrame([get_these("https://theses.fr/2", "Titre deux", "Irène Joliot", "Missing value"),
+                       get_these("Missing value", "Titre un", "Marie Curie", get_abstract(0)),
+                       get_these("Missing value", "Titre deux", "Irène Joliot", get_abstract(1) + " mot1 mot2"),
+                       get_these("Missing value", "Titre trois", "Paul Langevin", get_abstract(2))])
+
+    df = deduplication.find_duplicates(conn, df)
+
+    assert df["canonical"].tolist() == [2, 1, 2, None]
+
+
+def test_find_duplicates_different_abstracts():
+    df = pd.DataFrame([get_these("Missing value", "Titre un", "Marie Curie", get_abstract(seed))
+                       for seed in range(5)])
+
+    df = deduplication.find_duplicates(None, df, check_store=False)
+
+    assert df["canonical"].isna().all()
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scripts.facet_index as facet_index
+
+
+def get_df()-> pd.DataFrame:
+    return pd.DataFrame({"Id"               : [1, 2, 3, 4],
+                         "Discipline(s)"    : ["  Chimie", "  Physique", "  Chimie", "Missing value"],
+                         "Etablissement(s)" : ["  Toulouse", "  Lyon", "  Lyon", "  Toulouse"],
+                         "Direction"        : ["  Pierre Aimar, Patrice Bacchin", "  Marie Curie", "  Patrice Bacchin", "Missing value"],
+                         "Date"             : ["  Soutenance le 03/11/2016", "  Soutenance le 01/02/2010", "  Soutenance le 12/12/2012", "  Thèse en préparation"]})
+
+
+def get_index()-> facet_index.FacetIndex:
+    index = facet_index.FacetIndex()
+    index.add(get_df())
+    return index
+
+
+def test_get_facet_values():
+    assert facet_index.get_facet_values("direction", "  Pierre Aimar, Patrice Bacchin") == ["Pierre Aimar", "Patrice Bacchin"]
+    assert facet_index.get_facet_values("year", "  Soutenance le 03/11/2016") == ["2016"]
+    assert facet_index.get_facet_values("year", "  Thèse en préparation") == []
+    assert facet_index.get_facet_values("discipline", "Missing value") == []
+
+
+def test_get_ids_or_and():
+    index = get_index()
+
+    assert index.get_ids({"discipline": ["Chimie"]}).tolist() == [1, 3]
+    # values of a facet with OR
+    assert index.get_ids({"discipline": ["Chimie", "Physique"]}).tolist() == [1, 2, 3]
+    # facets with AND
+    assert index.get_ids({"discipline": ["Chimie"], "etablissement": ["Lyon"]}).tolist() == [3]
+    assert index.get_ids({"direction": "Patrice Bacchin"}).tolist() == [1, 3]
+    # no filter, every these
+    assert index.get_ids({}).tolist() == [1, 2, 3, 4]
+
+
+def test_get_ids_year_range_and_case():
+    index = get_index()
+
+    assert index.get_ids({"year": ["2010-2012"]}).tolist() == [2, 3]
+    assert index.get_ids({"year": ["2016"]}).tolist() == [1]
+    assert index.get_ids({"discipline": ["chimie"]}).tolist() == [1, 3]
+    assert index.get_ids({"discipline": ["Biologie"]}).tolist() == []
+
+
+def test_get_ids_unknown_facet():
+    with pytest.raises(TypeError):
+        get_index().get_ids({"author": ["Marie Curie"]})
+
+
+def test_add_skips_indexed_ids():
+    index = get_index()
+
+    assert index.add(get_df()) == 0
+    df = pd.DataFrame({"Id": [5], "Discipline(s)": ["  Chimie"]})
+    assert index.add(df) == 1
+    assert index.get_ids({"discipline": ["Chimie"]}).tolist() == [1, 3, 5]
+
+
+def test_filter_ids(tmp_path):
+    get_index().save(str(tmp_path))
+
+    assert facet_index.filter_ids({"discipline": ["Chimie"]}, facet_index_path=str(tmp_path)) == [1, 3]
+    # in the order of the result set
+    assert facet_index.filter_ids({"etablissement": ["Lyon", "Toulouse"]}, [4, 3, 9, 1], str(tmp_path)) == [4, 3, 1]
+    assert facet_index.filter_ids({"year": ["1990-2000"]}, [1, 2], str(tmp_path)) == []
+
+
+def test_save_load(tmp_path):
+    index = get_index()
+    index.save(str(tmp_path))
+    loaded = facet_index.FacetIndex.load(str(tmp_path))
+
+    assert loaded.indexed_ids.tolist() == index.indexed_ids.tolist()
+    for facet in facet_index.FACETS:
+        assert loaded.postings[facet].keys() == index.postings[facet].keys()
+        for value, ids in index.postings[facet].items():
+            assert np.array_equal(loaded.postings[facet][value], ids)
+
+
+def test_count_facets():
+    counts = facet_index.count_facets(get_df())
+
+    assert counts["discipline"] == [("Chimie", 2), ("Physique", 1)]
+    assert counts["direction"][0] == ("Patrice Bacchin", 2)
+    assert counts["year"] == [("2010", 1), ("2012", 1), ("2016", 1)]
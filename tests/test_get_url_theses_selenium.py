@@ -0,0 +1,151 @@
+from contextlib import contextmanager
+import pytest
+
+try:
+    import scripts.get_url_theses_selenium as get_url_theses_selenium
+except TypeError as error: # the chrome driver of the config.ini is not installed
+    pytest.skip(str(error), allow_module_level=True)
+
+URL_QUERY = "https://theses.fr/resultats?q=eau&page=1&nb=100&tri=pertinence&domaine=theses"
+
+
+class FakeElement:
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeDriver:
+
+    def __init__(self, site: dict, total_hits: str):
+        self.site       = site
+        self.total_hits = total_hits
+        self.url        = None
+
+    def get(self, url: str):
+        self.url = url
+
+    def find_element(self, by, value):
+        return FakeElement(f"Recherche eau\n{self.total_hits} résultats\n...")
+
+
+class FakePool:
+    """Driver pool of a theses.fr with total_hits theses, in result pages of 100"""
+
+    size = 4
+
+    def __init__(self, total_hits: int):
+        nb_pages  = -(-total_hits // 100)
+        self.site = {get_url_theses_selenium.get_page_url(URL_QUERY, page):
+                     [f"https://theses.fr/{i}" for i in range((page - 1) * 100, min(page * 100, total_hits))]
+                     for page in range(1, nb_pages + 1)}
+        self.total_hits = f"{total_hits:,}".replace(",", " ")
+        self.read       = []
+
+    @contextmanager
+    def driver(self):
+        yield FakeDriver(self.site, self.total_hits)
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    def install(total_hits: int)-> FakePool:
+        pool = FakePool(total_hits)
+
+        def get_page_url_theses(driver):
+            pool.read.append(driver.url)
+            return list(driver.site.get(driver.url, []))
+
+        monkeypatch.setattr(get_url_theses_selenium.driver_pool, "get_driver_pool", lambda: pool)
+        monkeypatch.setattr(get_url_theses_selenium, "get_page_url_theses", get_page_url_theses)
+        return pool
+    return install
+
+
+def test_get_page_url():
+    assert get_url_theses_selenium.get_page_url(URL_QUERY, 3) == URL_QUERY.replace("page=1", "page=3")
+    assert get_url_theses_selenium.get_page_url("https://theses.fr/resultats?page=12&q=eau", 2) == "https://theses.fr/resultats?page=2&q=eau"
+    # nb=100 is not a page number
+    assert "nb=100" in get_url_theses_selenium.get_page_url(URL_QUERY, 7)
+
+
+def test_get_total_hits():
+    assert get_url_theses_selenium.get_total_hits(FakeDriver({}, "1 234")) == 1234
+    assert get_url_theses_selenium.get_total_hits(FakeDriver({}, "1")) == 1
+
+
+def test_iter_url_theses_reads_every_page(fake_pool):
+    pool = fake_pool(250)
+
+    pages = dict(get_url_theses_selenium.iter_url_theses("eau"))
+
+    assert sorted(pages) == [1, 2, 3]
+    assert [len(pages[page]) for page in [1, 2, 3]] == [100, 100, 50]
+    assert len(pool.read) == 3
+
+
+def test_iter_url_theses_capped(fake_pool):
+    pool = fake_pool(1000)
+
+    pages = dict(get_url_theses_selenium.iter_url_theses("eau", max_pages=4))
+
+    assert sorted(pages) == [1, 2, 3, 4]
+    assert len(pool.read) == 4
+
+
+def test_iter_url_theses_one_page(fake_pool):
+    pool = fake_pool(42)
+
+    assert [(page, len(url_theses)) for page, url_theses in get_url_theses_selenium.iter_url_theses("eau")] == [(1, 42)]
+    assert len(pool.read) == 1
+
+
+def test_read_first_page(fake_pool):
+    fake_pool(250)
+    url_theses, nb_pages, is_complete = get_url_theses_selenium.read_first_page(URL_QUERY, max_pages=5)
+    assert (len(url_theses), nb_pages, is_complete) == (100, 3, True)
+
+    fake_pool(1000)
+    assert get_url_theses_selenium.read_first_page(URL_QUERY, max_pages=5)[1:] == (5, False)
+
+    fake_pool(500)
+    assert get_url_theses_selenium.read_first_page(URL_QUERY, max_pages=5)[1:] == (5, True)
+
+
+def test_read_first_page_unknown_total(fake_pool, monkeypatch):
+    monkeypatch.setattr(get_url_theses_selenium, "get_total_hits", lambda driver: None)
+
+    # a full first page, the next pages may hold more theses
+    fake_pool(1000)
+    assert get_url_theses_selenium.read_first_page(URL_QUERY, max_pages=5)[1:] == (5, False)
+
+    fake_pool(60)
+    assert get_url_theses_selenium.read_first_page(URL_QUERY, max_pages=5)[1:] == (1, True)
+
+
+def test_get_result_listing(fake_pool):
+    fake_pool(250)
+    url_theses, is_complete = get_url_theses_selenium.get_result_listing(URL_QUERY)
+
+    # every page, in the order of the results whatever the order the pages are read
+    assert url_theses == [f"https://theses.fr/{i}" for i in range(250)]
+    assert is_complete
+
+
+def test_get_result_listing_incomplete(fake_pool, monkeypatch):
+    fake_pool(1000)
+    assert get_url_theses_selenium.get_result_listing(URL_QUERY, max_pages=3) == ([f"https://theses.fr/{i}" for i in range(300)], False)
+
+    # a page that failed makes the listing incomplete
+    fake_pool(250)
+    crawl_result_page = get_url_theses_selenium.crawl_result_page
+
+    def fail_page_2(page_url):
+        if page_url == get_url_theses_selenium.get_page_url(URL_QUERY, 2):
+            raise TimeoutError("page 2")
+        return crawl_result_page(page_url)
+
+    monkeypatch.setattr(get_url_theses_selenium, "crawl_result_page", fail_page_2)
+    url_theses, is_complete = get_url_theses_selenium.get_result_listing(URL_QUERY)
+    assert len(url_theses) == 150
+    assert not is_complete
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import scripts.job_queue as job_queue
+
+URL_QUERY = "https://theses.fr/resultats?q=eau&page=1&nb=100&tri=pertinence&domaine=theses"
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    return str(tmp_path / "jobs" / "jobs.db")
+
+
+def test_claim_in_order(database_path):
+    first  = job_queue.submit_job("eau", URL_QUERY, database_path)
+    second = job_queue.submit_job("membrane", URL_QUERY.replace("eau", "membrane"), database_path)
+
+    assert job_queue.get_job(second, database_path)["position"] == 1
+
+    job = job_queue.claim_job(database_path=database_path)
+    assert job["id"] == first
+    assert job_queue.get_job(first, database_path)["status"] == job_queue.STATUS_RUNNING
+
+    assert job_queue.claim_job(database_path=database_path)["id"] == second
+    assert job_queue.claim_job(database_path=database_path) is None
+
+
+def test_claim_timeout(database_path):
+    job_id = job_queue.submit_job("eau", URL_QUERY, database_path)
+    job_queue.claim_job(database_path=database_path)
+
+    # the worker is alive, the job is not given twice
+    assert job_queue.claim_job(job_timeout=3600, database_path=database_path) is None
+
+    # no progress for job_timeout seconds, the worker died : the job is run again from the start
+    job_queue.update_job(job_id, "scraping", 10, 100, database_path)
+    job = job_queue.claim_job(job_timeout=-1, database_path=database_path)
+    assert job["id"] == job_id
+    assert job_queue.get_job(job_id, database_path)["stage"] == "starting"
+    assert job_queue.get_job(job_id, database_path)["done"] == 0
+
+
+def test_finished_job_not_claimed(database_path):
+    job_id = job_queue.submit_job("eau", URL_QUERY, database_path)
+    job_queue.claim_job(database_path=database_path)
+    job_queue.finish_job(job_id, "TimeoutException", database_path)
+
+    job = job_queue.get_job(job_id, database_path)
+    assert (job["status"], job["error"]) == (job_queue.STATUS_FAILED, "TimeoutException")
+    assert job_queue.claim_job(job_timeout=-1, database_path=database_path) is None
+
+
+def test_update_job_progress(database_path):
+    job_id = job_queue.submit_job("eau", URL_QUERY, database_path)
+    job_queue.claim_job(database_path=database_path)
+
+    job_queue.update_job(job_id, "scraping", 25, 100, database_path)
+    job = job_queue.get_job(job_id, database_path)
+
+    assert (job["stage"], job["done"], job["total"]) == ("scraping", 25, 100)
+    assert job["eta"] is not None and job["eta"] >= 0
+    assert job_queue.get_job(job_id + 1, database_path) is None
+
+
+def test_report_progress():
+    reports = []
+    job_queue.set_progress_reporter(lambda stage, done, total: reports.append((stage, done, total)))
+    try:
+        job_queue.report_progress("embedding", 64, 100)
+    finally:
+        job_queue.set_progress_reporter(None)
+    job_queue.report_progress("embedding", 100, 100)
+
+    assert reports == [("embedding", 64, 100)]
+
+
+def test_report_progress_failure():
+    def reporter(stage, done, total):
+        raise OSError("database is locked")
+
+    job_queue.set_progress_reporter(reporter)
+    try:
+        job_queue.report_progress("embedding", 64, 100)
+    finally:
+        job_queue.set_progress_reporter(None)
+
+
+def test_submit_wrong_query(database_path):
+    with pytest.raises(TypeError):
+        job_queue.submit_job(None, URL_QUERY, database_path)
+
+
+def test_submit_coalesces_jobs_in_flight(database_path):
+    job_id = job_queue.submit_job("eau", URL_QUERY, database_path)
+
+    # queued, then running : the same url query joins the job
+    assert job_queue.submit_job("Eau ", URL_QUERY, database_path) == job_id
+    job_queue.claim_job(database_path=database_path)
+    assert job_queue.submit_job("eau", URL_QUERY, database_path) == job_id
+
+    assert job_queue.get_job(job_id, database_path)["nb_requests"] == 3
+    assert job_queue.get_jobs_stats(database_path)["coalesced"] == 2
+
+    # a finished job is not joined, the query is ingested again
+    job_queue.finish_job(job_id, database_path=database_path)
+    assert job_queue.submit_job("eau", URL_QUERY, database_path) != job_id
+
+
+def test_concurrent_submits_add_one_job(database_path):
+    job_queue.submit_job("membrane", URL_QUERY.replace("eau", "membrane"), database_path) # creates the queue
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        job_ids = list(executor.map(lambda _: job_queue.submit_job("eau", URL_QUERY, database_path), range(16)))
+
+    assert len(set(job_ids)) == 1
+    assert job_queue.get_job(job_ids[0], database_path)["nb_requests"] == 16
@@ -0,0 +1,102 @@
+import os
+import pandas as pd
+import pytest
+import scripts.result_cache as result_cache
+
+
+def get_df(nb_rows: int = 3)-> pd.DataFrame:
+    return pd.DataFrame({"Id": list(range(nb_rows)), "title": [f"these {i}" for i in range(nb_rows)], "year": ["2015"] * nb_rows})
+
+
+def test_put_get():
+    cache = result_cache.ResultSetCache(max_entries=2)
+    df    = get_df()
+    token = cache.put("url", df)
+
+    assert result_cache.is_valid_token(token)
+    url_query, df_cached = cache.get(token)
+    assert url_query == "url"
+    assert df_cached is df
+
+
+def test_unknown_and_malformed_tokens():
+    cache = result_cache.ResultSetCache(max_entries=2)
+
+    assert cache.get("0" * 32) is None
+    assert cache.get("../../etc/passwd") is None
+    assert cache.get(None) is None
+
+
+def test_evict_least_recently_used():
+    cache  = result_cache.ResultSetCache(max_entries=2)
+    first  = cache.put("first", get_df())
+    second = cache.put("second", get_df())
+
+    cache.get(first) # second is now the least recently used
+    third = cache.put("third", get_df())
+
+    assert cache.get(second) is None
+    assert cache.get(first)[0] == "first"
+    assert cache.get(third)[0] == "third"
+
+
+def test_evict_on_memory():
+    df    = get_df(100)
+    size  = int(df.memory_usage(index=True, deep=True).sum())
+    cache = result_cache.ResultSetCache(max_entries=10, max_bytes=size * 2)
+
+    tokens = [cache.put(str(i), get_df(100)) for i in range(3)]
+
+    assert cache.get(tokens[0]) is None
+    assert cache.nb_bytes <= size * 2
+
+
+def test_expired_entry(monkeypatch):
+    cache = result_cache.ResultSetCache(max_entries=2, ttl=10)
+    token = cache.put("url", get_df())
+
+    now = result_cache.time.time()
+    monkeypatch.setattr(result_cache.time, "time", lambda: now + 11)
+
+    assert cache.get(token) is None
+    assert cache.nb_bytes == 0
+
+
+def test_spill_and_load_back(tmp_path):
+    cache  = result_cache.ResultSetCache(max_entries=1, spill_path=str(tmp_path))
+    first  = cache.put("first", get_df())
+    second = cache.put("second", get_df())
+
+    # the evicted entry is written in json, not in a pickle
+    assert os.listdir(tmp_path) == [f"{first}.json"]
+
+    url_query, df = cache.get(first)
+    assert url_query == "first"
+    pd.testing.assert_frame_equal(df, get_df())
+    # the metadata stay strings
+    assert df["year"].tolist() == ["2015"] * 3
+
+    # first went back in memory, second was spilled in its place
+    assert os.listdir(tmp_path) == [f"{second}.json"]
+    assert cache.get(second)[0] == "second"
+
+
+def test_purge_expired_spill_files(tmp_path):
+    token      = "a" * 32
+    spill_file = tmp_path / f"{token}.json"
+    spill_file.write_text("{}")
+    (tmp_path / "legacy.pkl").write_bytes(b"")
+    os.utime(spill_file, (0, 0))
+
+    cache = result_cache.ResultSetCache(max_entries=1, ttl=10, spill_path=str(tmp_path))
+
+    assert os.listdir(tmp_path) == []
+    assert cache.get(token) is None
+
+
+def test_wrong_arguments():
+    with pytest.raises(TypeError):
+        result_cache.ResultSetCache(max_entries=0)
+
+    with pytest.raises(TypeError):
+        result_cache.ResultSetCache(max_entries=2).put("url", [1, 2])
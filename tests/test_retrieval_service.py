@@ -0,0 +1,42 @@
+import faiss
+import numpy as np
+import pytest
+import scripts.retrieval_service as retrieval_service
+
+
+def get_matrix(nb_rows: int = 200, dimension: int = 16, seed: int = 0):
+    random = np.random.default_rng(seed)
+    matrix = random.standard_normal((nb_rows, dimension)).astype(np.float32)
+    return matrix, (matrix ** 2).sum(axis=1), random.standard_normal(dimension).astype(np.float32)
+
+
+def test_exact_top_k_brute_force():
+    matrix, norms, query_vector = get_matrix()
+
+    top, distances = retrieval_service.exact_top_k(query_vector, matrix, norms, 10)
+
+    expected = ((matrix - query_vector) ** 2).sum(axis=1)
+    assert top.tolist() == np.argsort(expected, kind="stable")[:10].tolist()
+    assert distances == pytest.approx(expected[top], rel=1e-4, abs=1e-4)
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_exact_top_k_same_as_flat_index():
+    matrix, norms, query_vector = get_matrix(500, 32, seed=1)
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+
+    faiss_distances, faiss_top = index.search(query_vector[None, :], 20)
+    top, distances = retrieval_service.exact_top_k(query_vector, matrix, norms, 20)
+
+    assert top.tolist() == faiss_top[0].tolist()
+    assert distances == pytest.approx(faiss_distances[0], rel=1e-4, abs=1e-4)
+
+
+def test_exact_top_k_more_than_rows():
+    matrix, norms, query_vector = get_matrix(5)
+
+    top, distances = retrieval_service.exact_top_k(query_vector, matrix, norms, 10)
+
+    assert sorted(top.tolist()) == [0, 1, 2, 3, 4]
+    assert distances.shape == (5,)
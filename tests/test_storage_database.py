@@ -0,0 +1,81 @@
+import threading
+import time
+import pandas as pd
+import pytest
+import scripts.storage_database as storage_database
+
+
+def test_wait_lock_calls_on_wait(monkeypatch):
+    monkeypatch.setattr(storage_database, "LOCK_HEARTBEAT", 0)
+    attempts, calls = iter([False, False, False, True]), []
+
+    storage_database.wait_lock(lambda timeout: next(attempts), lambda: calls.append(1))
+
+    assert len(calls) == 3
+
+
+def test_wait_lock_failing_on_wait(monkeypatch):
+    monkeypatch.setattr(storage_database, "LOCK_HEARTBEAT", 0)
+    attempts = iter([False, False, True])
+
+    def on_wait():
+        raise OSError("database is locked")
+
+    # the lock is still taken
+    assert storage_database.wait_lock(lambda timeout: next(attempts), on_wait) >= 0
+
+
+def test_store_lock_reentrant(tmp_path):
+    database_path = str(tmp_path / "theses.db")
+
+    with storage_database.store_lock(database_path):
+        with storage_database.store_lock(database_path):
+            pass
+
+
+def test_store_lock_waiter_calls_callback(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_database, "LOCK_POLL", 0.01)
+    monkeypatch.setattr(storage_database, "LOCK_HEARTBEAT", 0.02)
+    database_path = str(tmp_path / "theses.db")
+    taken, calls  = threading.Event(), []
+
+    def holder():
+        with storage_database.store_lock(database_path):
+            taken.set()
+            time.sleep(0.3)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    taken.wait()
+
+    storage_database.set_lock_wait_callback(lambda: calls.append(time.perf_counter()))
+    try:
+        with storage_database.store_lock(database_path):
+            pass
+    finally:
+        storage_database.set_lock_wait_callback(None)
+    thread.join()
+
+    # the callback of set_lock_wait_callback is the default on_wait
+    assert len(calls) >= 3
+
+
+def test_filter_ids(tmp_path, monkeypatch):
+    # a new database is not filled with the legacy excel store
+    monkeypatch.setattr(storage_database, "EXCEL_QUERY_STORE_PATH", str(tmp_path / "missing.xlsx"))
+    database_path = str(tmp_path / "theses.db")
+    with storage_database.open_database(database_path) as conn:
+        storage_database.create_tables(conn)
+        storage_database.insert_theses(conn, pd.DataFrame({storage_database.COLUMN_URL_THESE: ["https://theses.fr/1", "https://theses.fr/2", "https://theses.fr/3"],
+                                                           "Langue": ["fr", "en", None],
+                                                           "Discipline(s)": ["Chimie", "Chimie", "Physique"]}))
+
+    assert storage_database.filter_ids({"Langue": "fr"}, database_path=database_path) == [1]
+    assert storage_database.filter_ids({"Langue": ["fr", "en"], "Discipline(s)": "Chimie"}, database_path=database_path) == [1, 2]
+    # a missing metadata matches MISSING_VALUE, like in the documents of the docstore
+    assert storage_database.filter_ids({"Langue": storage_database.MISSING_VALUE}, database_path=database_path) == [3]
+    # in the order of the result set
+    assert storage_database.filter_ids({"Discipline(s)": "Chimie"}, [2, 3, 1], database_path) == [2, 1]
+
+    with pytest.raises(TypeError):
+        storage_database.filter_ids({"Unknown": "fr"}, database_path=database_path)